@@ -7,36 +7,49 @@ import tornado.web
 import sockjs.tornado
 import pdb
 import json
-from pymongo import mongo_client
-from pymongo import database
-from pymongo.database import Database
+import threading
 import logging
 from mod_cmd.controllers import WorkspaceConnection
+from mod_cmd.project_cache import ProjectCache
+from mod_cmd.project_states import ProjectStates
+from mod_cmd.command_executor import CommandExecutor
+from mod_cmd.command_registry import CommandRegistry
 import config
 from redis import Redis
 from libs.redis_session.for_tornado import RedisSessionStore, Session
+from libs.redis_jobs.job_queue import JobQueue
 from libs.filesystem import Filesystem
 
 
-class MongoClient(mongo_client.MongoClient):
-    """Replace 'db' with config.MONGO_DBNAME to make this similar to Flask-PyMongo
+class LazyMongoClient(object):
+    """Stands in for :class:`app.mongo_client.MongoClient`, which is created on first use.
+
+    pymongo is imported and the client created when the database is first used rather than
+    when `app` is imported, so the server starts accepting connections sooner.
+
+    Attributes:
+        uri: MongoDB URI passed to MongoClient.
     """
+    def __init__(self, uri):
+        self.uri = uri
+        self._client = None
+        self._lock = threading.Lock()
+
+    def get_client(self):
+        """Gets the client, creating it on first call.
+        """
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    from mongo_client import MongoClient
+                    self._client = MongoClient(self.uri)
+        return self._client
 
     def __getattr__(self, name):
-        if name == 'db':
-            name = config.MONGO_DBNAME
-        attr = super(MongoClient, self).__getattr__(name)
-        if isinstance(attr, database.Database):
-            return Database(self, name)
-        return attr
+        return getattr(self.get_client(), name)
 
     def __getitem__(self, item):
-        if item == 'db':
-            item = config.MONGO_DBNAME
-        attr = super(MongoClient, self).__getitem__(item)
-        if isinstance(attr, database.Database):
-            return Database(self, item)
-        return attr
+        return self.get_client()[item]
 
 
 port = ''
@@ -44,7 +57,7 @@ if config.MONGO_PORT:
     port = ':%s' % config.MONGO_PORT
 uri = "mongodb://%s:%s@%s%s/%s?authMechanism=SCRAM-SHA-1" % \
       (config.MONGO_USERNAME, config.MONGO_PASSWORD, config.MONGO_HOST, port, config.MONGO_DBNAME)
-mongo = MongoClient(uri)
+mongo = LazyMongoClient(uri)
 
 logging.getLogger().setLevel(logging.DEBUG)
 
@@ -68,13 +81,36 @@ class Application(tornado.web.Application):
         }
         redis_conn = Redis(host=self.config['REDIS_HOST'], port=self.config['REDIS_PORT'], password=self.config['REDIS_PASSWORD'])
         self.session_store = RedisSessionStore(redis_conn)
+        self.jobs = JobQueue(redis_conn)
 
         self.fs = Filesystem(connect_to=self.config['FILESYSTEM'], bucket_name=self.config['AWS_BUCKET'],
                              rootdir=self.config['AWS_ROOTDIR'], config_file=self.config['AWSCONFIG_PATH'],
-                             tmpdir=self.config['TMP_DIR'])
+                             tmpdir=self.config['TMP_DIR'], cache_size=self.config['TMP_DIR_MAX_SIZE'],
+                             cache_age=self.config['TMP_DIR_MAX_AGE'],
+                             endpoint_url=self.config['AWS_ENDPOINT_URL'])
+
+        self._parse_cache = None
+        self.project_cache = ProjectCache(ttl=self.config['PROJECT_CACHE_TTL'])
+        self.project_states = ProjectStates()
+        self.commands = CommandRegistry(reload=self.config['COMMANDS_RELOAD'])
+        self.executor = CommandExecutor(threads=self.config['COMMAND_THREADS'],
+                                        processes=self.config['COMMAND_PROCESSES'])
 
         super(Application, self).__init__(handlers, **settings)
     
+    @property
+    def parse_cache(self):
+        """Cache of parsed documents, see :class:`libs.arthur.document.ArthurParseCache`.
+
+        Created on first use, as importing libs.arthur imports its parsers (pdfminer, scipy, ...).
+        """
+        if self._parse_cache is None:
+            from libs.arthur.document import ArthurParseCache
+            self._parse_cache = ArthurParseCache(self.config['PARSE_CACHE_DIR'],
+                                                 max_size=self.config['PARSE_CACHE_MAX_SIZE'],
+                                                 max_age=self.config['PARSE_CACHE_MAX_AGE'])
+        return self._parse_cache
+
     def init_session(self, sessionid):
         """For testing
         """
@@ -83,6 +119,9 @@ class Application(tornado.web.Application):
     def get_path(self, path):
         return self.fs.get_path(path, self.config['BASE_DIR'])
 
+    def get_zip_index(self, path):
+        return self.fs.get_zip_index(path, self.config['BASE_DIR'])
+
 
 attrs = filter(lambda x: x[0] != '_' and str.isupper(x[0]), dir(config))
 mapped_config = {}
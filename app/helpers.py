@@ -1,56 +1,65 @@
+"""
+Helpers of the app. Active user and project are taken from the `session` passed in, i.e. the
+session a command was given by its connection, or from app.session when not given (e.g. in
+a job worker).
+"""
 from app import app, mongo
 import os
 
-def user_logged_in():
+def get_session(session=None):
+    """Returns session, or app.session when None.
+    """
+    return app.session if session is None else session
+
+def user_logged_in(session=None):
     """Checks if user logged in.
     """
-    if 'active_user' not in app.session:
+    session = get_session(session)
+    if 'active_user' not in session:
         return False
-    username = app.session['active_user']
+    username = session['active_user']
     return mongo.db.users.count({'username': username}) > 0
 
-def user_path():
+def user_path(session=None):
     """Returns user's path (/user_data/active_user)
     """
-    return os.path.join(app.config['BASE_DIR'], 'user_data', app.session['active_user'])
+    return os.path.join(app.config['BASE_DIR'], 'user_data', get_session(session)['active_user'])
 
-def docs_path():
+def docs_path(session=None):
     """Returns path to a project's docs.zip file (where all documents for that project are stored).
     """
-    return os.path.join(user_path(), app.session['active_project'], 'docs.zip')
+    return os.path.join(user_path(session), get_session(session)['active_project'], 'docs.zip')
 
-def uploaded_path():
+def uploaded_path(session=None):
     """Returns path to a user's (temporary) uploaded directory.
     """
-    return os.path.join(user_path(), '_uploaded')
+    return os.path.join(user_path(session), '_uploaded')
 
-def corpus_path():
-    return os.path.join(user_path(), app.session['active_project'], 'corpus')
+def corpus_path(session=None):
+    return os.path.join(user_path(session), get_session(session)['active_project'], 'corpus')
 
-def save_project(project):
+def save_project(project, session=None):
     """Shallow saves project to mongodb database.
 
-    WARNING: Saving method is shallow, meaning it does not update deep nested data like
-             projects.docs and projects blocks - These should be inserted one by one, otherwise
-             it takes too much memory.
+    WARNING: Saving method is shallow, meaning it does not update documents and blocks of
+             the project - Documents are saved one by one into `docs` collection (see
+             :mod:`app.mod_cmd.project_docs`), otherwise it takes too much memory.
+
+    Saved project replaces the one kept in app.project_cache, so the next command uses it
+    without reloading.
     """
+    session = get_session(session)
     active_doc_name = None
     if project.active_doc is not None:
         active_doc_name = project.active_doc.name
 
-    doclist = []
-    for doc in project.docs:
-        docdict = doc.to_dict(raw=False, with_details=False)
-        docdict.pop('project_id', None)
-        doclist.append(docdict)
-
     mongo.db.users.update(
-        {'username': app.session['active_user'], 'projects._id': project._id},
+        {'username': session['active_user'], 'projects._id': project._id},
         {
             '$set': {
                 'projects.$.name': project.name,
-                'projects.$.active_doc': active_doc_name,
-                'projects.$.docs': doclist
+                'projects.$.active_doc': active_doc_name
             }
         }
     )
+    app.project_cache.set(session['active_user'], project.name, project)
@@ -1,7 +1,7 @@
 """
 This module contains ClientInstruction class.
 """
-import json
+from libs import wire_format as wire
 
 class ClientInstruction():
     """An object that can be returned to front end to give instructions.
@@ -49,8 +49,12 @@ class ClientInstruction():
         self._value['message'] = new_message
         return self._value['message']
 
-    def to_json(self):
+    def to_json(self, wire_format='json', compression=None):
         """Gets _value attribute in json form.
-        """
 
-        return json.dumps(self._value)
+        Args:
+            wire_format(str): 'json', or 'compact' to send document elements as typed arrays.
+            compression(str|None): None, or 'deflate' to compress large messages.
+                                   See :mod:`libs.wire_format`.
+        """
+        return wire.dumps(self._value, wire_format, compression)
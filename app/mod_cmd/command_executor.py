@@ -0,0 +1,263 @@
+"""
+This module contains CommandExecutor class, which runs commands off the Tornado IOLoop.
+"""
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, TimeoutError
+from tornado.concurrent import Future, chain_future
+from tornado.ioloop import IOLoop
+
+class CommandCancelled(Exception):
+    """Raised inside a command that was cancelled, at its next progress message or
+    :func:`CommandExecutor.check_cancelled` call.
+    """
+
+class CommandExecutor():
+    """Runs commands in a thread pool, so a long command (e.g. `load_zip`) does not block
+    the IOLoop, and with it other clients, heartbeats and the index page.
+
+    Commands of the same key (e.g. a project) run one at a time, in the order they were
+    submitted, while commands of different keys run concurrently. Inside a command, CPU-heavy
+    functions can be run in a process pool with :func:`run_in_process`, so they do not hold
+    the GIL the IOLoop needs.
+
+    >>> import time
+    >>> from tornado import gen
+    >>> executor = CommandExecutor(threads=2)
+    >>> ran = []
+    >>> def command(name, seconds):
+    ...     time.sleep(seconds)
+    ...     ran.append(name)
+    ...     return name
+    >>> @gen.coroutine
+    ... def submit_all():
+    ...     futures = [executor.submit('a', command, 'a1', 0.2), executor.submit('a', command, 'a2', 0),
+    ...                executor.submit('b', command, 'b1', 0.1)]
+    ...     results = yield futures
+    ...     raise gen.Return(results)
+    >>> IOLoop.current().run_sync(submit_all)
+    ['a1', 'a2', 'b1']
+    >>> ran
+    ['b1', 'a1', 'a2']
+
+    Cancelling a key cancels its running command at its next check, and drops its queued
+    commands. Threads started by a command check it with the command's :func:`cancel_token`:
+    >>> def long_command():
+    ...     token = executor.cancel_token()
+    ...     def work():
+    ...         while True:
+    ...             executor.check_cancelled(token)
+    ...             time.sleep(0.01)
+    ...     pool = ThreadPoolExecutor(1)
+    ...     try:
+    ...         pool.submit(work).result()
+    ...     finally:
+    ...         pool.shutdown()
+    >>> @gen.coroutine
+    ... def cancel():
+    ...     futures = [executor.submit('a', long_command), executor.submit('a', command, 'a3', 0)]
+    ...     yield gen.sleep(0.05)
+    ...     cancelled = executor.cancel('a')
+    ...     for future in futures:
+    ...         try:
+    ...             yield future
+    ...         except CommandCancelled:
+    ...             cancelled += 10
+    ...     raise gen.Return(cancelled)
+    >>> IOLoop.current().run_sync(cancel)
+    22
+    >>> 'a3' in ran
+    False
+
+    Commands sharing a key can be submitted by different owners (e.g. connections to the same
+    project). Cancelling an owner only cancels its own commands:
+    >>> def checking_command():
+    ...     for i in range(100):
+    ...         executor.check_cancelled()
+    ...         time.sleep(0.01)
+    >>> @gen.coroutine
+    ... def cancel_owner():
+    ...     first = executor.submit('p', checking_command, owner='x')
+    ...     second = executor.submit('p', command, 'p2', 0, owner='y')
+    ...     cancelled = executor.cancel('x')
+    ...     result = yield second
+    ...     try:
+    ...         yield first
+    ...     except CommandCancelled:
+    ...         raise gen.Return((cancelled, result))
+    >>> IOLoop.current().run_sync(cancel_owner)
+    (1, 'p2')
+    >>> executor.shutdown()
+
+    Attributes:
+        io_loop: IOLoop commands are submitted from, and progress is sent back to.
+    """
+    def __init__(self, threads=4, processes=None):
+        """Initializes object.
+
+        Args:
+            threads(int): Number of commands that can run at once.
+            processes(int): Number of processes to run CPU-heavy functions in. None or 0 to
+                            run them in the calling thread instead.
+        """
+        self.io_loop = None
+        self._threads = ThreadPoolExecutor(threads)
+        self._processes = None
+        if processes:
+            self._processes = ProcessPoolExecutor(processes)
+        self._queues = {}
+        self._local = threading.local()
+
+    def submit(self, key, fn, *args, **kwargs):
+        """Queues a command to run after previously submitted commands of the same key.
+
+        Must be called from the IOLoop's thread.
+
+        Args:
+            key: Commands of the same key run one at a time, e.g. the project they change.
+            fn(function): Command to run.
+            args: Arguments of fn.
+            kwargs: Keyword arguments of fn.
+            owner: (Keyword only) Who the command runs for, e.g. the client connection, see
+                   :func:`cancel`. Defaults to key.
+
+        Returns:
+            Future: Future resolved on the IOLoop with the command's result, or raising
+                    :class:`CommandCancelled` when the command was cancelled.
+        """
+        self.io_loop = IOLoop.current()
+        owner = kwargs.pop('owner', key)
+        command = _Command(fn, args, kwargs, owner)
+        queue = self._queues.setdefault(key, deque())
+        queue.append(command)
+        if len(queue) == 1:
+            self._start(key)
+        return command.future
+
+    def cancel(self, owner):
+        """Cancels the running and queued commands of an owner, see :func:`submit`.
+
+        Must be called from the IOLoop's thread.
+
+        Returns:
+            int: Number of cancelled commands.
+        """
+        cancelled = 0
+        for queue in self._queues.values():
+            for command in queue:
+                if command.owner == owner:
+                    command.cancelled.set()
+                    cancelled += 1
+        return cancelled
+
+    def in_command(self):
+        """Checks if the current thread is running a command.
+        """
+        return getattr(self._local, 'command', None) is not None
+
+    def cancel_token(self):
+        """Gets the cancellation token of the command running in the current thread, to check
+        cancellation from threads the command starts (e.g. stages of a pipeline), which
+        :func:`check_cancelled` can't tell the command of.
+
+        Returns:
+            threading.Event: Set when the command is cancelled, or None outside of a command.
+        """
+        command = getattr(self._local, 'command', None)
+        return command.cancelled if command is not None else None
+
+    def check_cancelled(self, token=None):
+        """Raises :class:`CommandCancelled` when a command was cancelled.
+
+        Args:
+            token(threading.Event): Token of the command, see :func:`cancel_token`. Defaults to
+                                    the token of the command running in the current thread.
+                                    Does nothing outside of a command without a token.
+        """
+        if token is None:
+            token = self.cancel_token()
+        if token is not None and token.is_set():
+            raise CommandCancelled()
+
+    def add_callback(self, callback, *args, **kwargs):
+        """Calls a function on the IOLoop, e.g. to send a message from a command.
+
+        Callbacks are called in the order they were added.
+        """
+        self.io_loop.add_callback(callback, *args, **kwargs)
+
+    def run_in_process(self, fn, *args, **kwargs):
+        """Runs a CPU-heavy function in the process pool and waits for its result.
+
+        The function, its arguments and its result must be picklable. Without a process pool,
+        the function runs in the calling thread.
+
+        Args:
+            fn(function): Function to run.
+            args: Arguments of fn.
+            token(threading.Event): (Keyword only) Cancellation token of the calling command, see
+                                    :func:`cancel_token`. Needed when called from a thread the
+                                    command started.
+
+        Raises:
+            CommandCancelled: When the calling command is cancelled while waiting. A function
+                              already running is not interrupted, its result is dropped.
+        """
+        token = kwargs.pop('token', None)
+        if token is None:
+            token = self.cancel_token()
+        self.check_cancelled(token)
+        if self._processes is None:
+            return fn(*args)
+        future = self._processes.submit(fn, *args)
+        while True:
+            try:
+                return future.result(timeout=0.1)
+            except TimeoutError:
+                try:
+                    self.check_cancelled(token)
+                except CommandCancelled:
+                    future.cancel()
+                    raise
+
+    def shutdown(self):
+        """Stops thread and process pools once running commands are done.
+        """
+        self._threads.shutdown()
+        if self._processes is not None:
+            self._processes.shutdown()
+
+    def _start(self, key):
+        command = self._queues[key][0]
+        future = self._threads.submit(self._run, command)
+        self.io_loop.add_future(future, lambda future: self._finish(key, command, future))
+
+    def _run(self, command):
+        self._local.command = command
+        try:
+            self.check_cancelled()
+            return command.fn(*command.args, **command.kwargs)
+        finally:
+            self._local.command = None
+
+    def _finish(self, key, command, future):
+        queue = self._queues[key]
+        queue.popleft()
+        if len(queue) > 0:
+            self._start(key)
+        else:
+            del self._queues[key]
+        chain_future(future, command.future)
+
+class _Command(object):
+    def __init__(self, fn, args, kwargs, owner):
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+        self.owner = owner
+        self.future = Future()
+        self.cancelled = threading.Event()
+
+if __name__ == '__main__':
+    import doctest
+    doctest.testmod()
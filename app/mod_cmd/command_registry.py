@@ -0,0 +1,174 @@
+"""
+This module contains CommandRegistry class, which finds and imports all commands once.
+"""
+import os
+import sys
+import time
+import threading
+import importlib
+import logging
+from collections import namedtuple
+from itertools import chain
+from helpers import get_package_module_pairs, get_base_package_module_pairs
+
+class Command(namedtuple('Command', ['name', 'package', 'run', 'summary', 'doc', 'error'])):
+    """A command found in commands directory.
+
+    Attributes:
+        name: Name of the command, i.e. its module name.
+        package: Package (subdirectory) the command is grouped in, '' for commands directly
+                 inside commands directory.
+        run: The command's `run` function.
+        summary: First line of `run`'s docstring, shown by `help`.
+        doc: Whole docstring of `run`, shown by `help [command]`.
+        error: Why the command's module could not be imported, None when it could. The
+               command is then unavailable and `run` is None.
+    """
+
+class CommandRegistry():
+    """Commands of app/mod_cmd/commands, imported once.
+
+    Commands directory is searched and all commands are imported on first use, so finding
+    a command takes the same time however many commands there are.
+
+    >>> import tempfile, shutil
+    >>> root = tempfile.mkdtemp()
+    >>> def write(path, doc):
+    ...     if not os.path.isdir(os.path.dirname(path)):
+    ...         os.makedirs(os.path.dirname(path))
+    ...         open(os.path.join(os.path.dirname(path), '__init__.py'), 'w').close()
+    ...     with open(path, 'w') as f:
+    ...         f.write('def run(project=None, args=[], **kwargs):\\n    \"\"\"%s\"\"\"\\n    return [project, args]\\n' % doc)
+    >>> write(os.path.join(root, 'test_commands', 'status.py'), 'Show status.')
+    >>> write(os.path.join(root, 'test_commands', 'docs', 'list_docs.py'), 'List docs.\\n\\n    list_docs [page]')
+    >>> sys.path.insert(0, root)
+    >>> registry = CommandRegistry(os.path.join(root, 'test_commands'), 'test_commands')
+    >>> command = registry.get('list_docs')
+    >>> command.package, command.summary
+    ('docs', 'List docs.')
+    >>> command.run(None, ['2'])
+    [None, ['2']]
+    >>> [(command.package, command.name) for command in registry.commands()]
+    [('docs', 'list_docs'), ('', 'status')]
+    >>> registry.get('nothing') is None
+    True
+
+    A command file that fails to import leaves only that command unavailable:
+    >>> with open(os.path.join(root, 'test_commands', 'docs', 'broken.py'), 'w') as f:
+    ...     f.write('raise ImportError("No module named documents")\\n')
+    >>> registry = CommandRegistry(os.path.join(root, 'test_commands'), 'test_commands')
+    >>> logging.disable(logging.ERROR)
+    >>> registry.get('broken').error
+    'ImportError: No module named documents'
+    >>> logging.disable(logging.NOTSET)
+    >>> registry.get('broken').run is None, registry.get('list_docs').summary
+    (True, 'List docs.')
+    >>> os.remove(os.path.join(root, 'test_commands', 'docs', 'broken.py'))
+
+    With `reload`, changed command files are imported again (checked at most once
+    per `reload_interval` seconds), e.g. while developing commands:
+    >>> registry = CommandRegistry(os.path.join(root, 'test_commands'), 'test_commands', reload=True, reload_interval=0)
+    >>> registry.get('status').summary
+    'Show status.'
+    >>> path = os.path.join(root, 'test_commands', 'status.py')
+    >>> write(path, 'Show changed status.')
+    >>> os.utime(path, (time.time()+10, time.time()+10))
+    >>> registry.get('status').summary
+    'Show changed status.'
+    >>> sys.path.remove(root)
+    >>> shutil.rmtree(root)
+
+    Attributes:
+        commands_dir: Directory of commands.
+        package: Package name of commands directory.
+        reload: Import changed command files again.
+        reload_interval: Minimum seconds between checks for changed command files.
+    """
+    def __init__(self, commands_dir='app/mod_cmd/commands', package='app.mod_cmd.commands', reload=False,
+                 reload_interval=1):
+        """Initializes object. Commands are imported on first use.
+
+        Args:
+            commands_dir(str): See :attr:`commands_dir`.
+            package(str): See :attr:`package`.
+            reload(bool): See :attr:`reload`.
+            reload_interval(float): See :attr:`reload_interval`.
+        """
+        self.commands_dir = commands_dir
+        self.package = package
+        self.reload = reload
+        self.reload_interval = reload_interval
+        self._commands = None
+        self._mtimes = {}
+        self._checked_at = 0
+        self._lock = threading.RLock()
+
+    def get(self, name):
+        """Gets a command.
+
+        Returns:
+            Command: The command, or None when there is no command with given name.
+        """
+        return self._get_commands().get(name)
+
+    def commands(self):
+        """Gets all commands, grouped by package. Commands without package come last.
+        """
+        return sorted(self._get_commands().values(), key=lambda command: (command.package == '', command.package, command.name))
+
+    def _get_commands(self):
+        commands = self._commands
+        if commands is None or (self.reload and time.time() - self._checked_at >= self.reload_interval):
+            with self._lock:
+                if self._commands is None or self._changed():
+                    self._commands = self._import_commands()
+                self._checked_at = time.time()
+                commands = self._commands
+        return commands
+
+    def _files(self):
+        """Gets (package, module, path) of all command files.
+        """
+        for package, module in chain(get_base_package_module_pairs(self.commands_dir),
+                                     get_package_module_pairs(self.commands_dir)):
+            if package == os.path.basename(os.path.normpath(self.commands_dir)):
+                package = ''
+            yield (package, module, os.path.join(self.commands_dir, package, module+'.py'))
+
+    def _changed(self):
+        mtimes = dict((path, os.path.getmtime(path)) for _, _, path in self._files())
+        return mtimes != self._mtimes
+
+    def _import_commands(self):
+        commands = {}
+        mtimes = {}
+        # Commands inside a package come after the others, so they replace commands of the same name.
+        for package, module, path in self._files():
+            mtimes[path] = os.path.getmtime(path)
+            name = '.'.join(part for part in (self.package, package, module) if part != '')
+            try:
+                imported = sys.modules.get(name)
+                if imported is None:
+                    imported = importlib.import_module(name)
+                elif path in self._mtimes and self._mtimes[path] != mtimes[path]:
+                    imported = reload(imported)
+            except Exception as e:
+                # Keep the other commands available, this one is tried again when its file changes.
+                logging.exception("Could not import command %s", name)
+                error = "%s: %s" % (type(e).__name__, e)
+                commands[module] = Command(name=module, package=package, run=None,
+                                           summary="Unavailable, %s" % error,
+                                           doc="Command could not be imported: %s" % error, error=error)
+                continue
+            if not hasattr(imported, 'run'):
+                continue
+            doc = imported.run.__doc__ or ''
+            summary = doc.strip().split('\n', 1)[0].strip()
+            commands[module] = Command(name=module, package=package, run=imported.run, summary=summary, doc=doc,
+                                       error=None)
+        self._mtimes = mtimes
+        return commands
+
+if __name__ == '__main__':
+    import doctest
+    doctest.testmod()
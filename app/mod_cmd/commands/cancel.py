@@ -0,0 +1,19 @@
+"""Cancel commands still running for this connection.
+"""
+from app.mod_cmd.client_instruction import ClientInstruction
+from app import app
+
+def run(project = None, args = [], connection = None, **kwargs):
+    """Cancel the running command (e.g. a long `load_zip`) and any commands waiting after it.
+
+    cancel
+
+    A running command stops at its next progress message.
+    """
+    cancelled = app.executor.cancel(connection)
+    if cancelled == 0:
+        message = "No command is running."
+    else:
+        message = "Cancelling %i command(s)..." % cancelled
+    instruction = ClientInstruction({'message': message})
+    return [project, instruction]
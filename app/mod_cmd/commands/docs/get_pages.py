@@ -0,0 +1,116 @@
+"""Get elements and data fields of some pages of active document.
+"""
+from app.mod_cmd.client_instruction import ClientInstruction
+from app import mongo
+from bson import ObjectId
+import config
+
+def run(project = None, args = [], **kwargs):
+    """Get elements and data fields of pages of active document, e.g. pages scrolled into view.
+
+    get_pages [first] [last]
+
+    Args:
+        first: First page to get.
+        last: (Optional) Last page to get. Defaults to first.
+
+    Adjacent pages are sent along, so they are ready when scrolling on. Elements are sent in
+    the connection's wire format (see `wire_format`), and only to the connection asking.
+    """
+    if project is None or project.active_doc is None:
+        instruction = ClientInstruction({'message': "Please load a document first with command `load_doc [name]`"})
+        return [project, instruction]
+    try:
+        first = int(args[0])
+        last = int(args[1]) if len(args) > 1 else first
+    except (IndexError, ValueError):
+        instruction = ClientInstruction({'message': "usage: get_pages [first] [last]"})
+        return [project, instruction]
+
+    document = project.active_doc
+    pages = page_window(document, first, last)
+    instruction = ClientInstruction({
+        'broadcast': False,
+        'doc_pages': DocumentPages(document, pages),
+        'data_fields': get_data_fields(project, document, pages),
+        'message': "Pages %s of %s." % (", ".join(str(page) for page in pages), document.name)
+    })
+    return [project, instruction]
+
+class DocumentPages(object):
+    """Elements of some pages of a document, serialized according to the wire format used.
+
+    Attributes:
+        document: ArthurDocument the pages are of.
+        pages: List of page numbers.
+    """
+    def __init__(self, document, pages):
+        self.document = document
+        self.pages = pages
+
+    def to_dict(self, columnar=False):
+        """Returns dictionary representation of this object.
+
+        Args:
+            columnar(bool): See :func:`ArthurDocument.to_dict`.
+        """
+        document = self.document.to_dict(with_details=True, columnar=columnar, pages=self.pages)
+        return {
+            '_id': document['_id'],
+            'revision': self.document.revision,
+            'pages': document['element_pages'],
+            'elements': document['elements']
+        }
+
+def page_window(document, first, last=None, prefetch=config.DOC_PREFETCH_PAGES, max_pages=config.DOC_MAX_PAGES):
+    """Gets existing pages of a document from first to last, with `prefetch` pages before and after.
+
+    Args:
+        document: ArthurDocument.
+        first(int): First requested page.
+        last(int): Last requested page. Defaults to first.
+        prefetch(int): Number of adjacent pages to add on each side.
+        max_pages(int): Maximum number of pages. Requested pages are cut beyond it.
+
+    Returns:
+        list: Sorted page numbers.
+    """
+    if last is None:
+        last = first
+    numbers = document.get_page_numbers()
+    requested = [number for number in numbers if first <= number <= last][:max_pages]
+    if len(requested) == 0:
+        return []
+    start = numbers.index(requested[0])
+    end = numbers.index(requested[-1]) + 1
+    room = max_pages - len(requested)
+    before = min(prefetch, start, room)
+    after = min(prefetch, len(numbers) - end, room - before)
+    return numbers[start-before:end+after]
+
+def first_pages(document, count):
+    """Gets the first `count` pages of a document, with prefetched pages after them.
+
+    Returns:
+        list|None: Sorted page numbers, or None when document has no pages (e.g. a text document).
+    """
+    numbers = document.get_page_numbers()
+    if len(numbers) == 0:
+        return None
+    return page_window(document, numbers[0], numbers[min(count, len(numbers)) - 1])
+
+def get_data_fields(project, document, pages):
+    """Gets data fields of given pages of a document.
+    """
+    doc_ids = [document._id, str(document._id)]
+    if ObjectId.is_valid(document._id):
+        doc_ids.append(ObjectId(document._id))
+    data_fields = []
+    for data_field in mongo.db.data_fields.find({'doc_id': {'$in': doc_ids},
+                                                 'project_id': {'$in': [project._id, str(project._id)]},
+                                                 'page': {'$in': pages}}):
+        data_field['_id'] = str(data_field['_id'])
+        data_field['project_id'] = str(data_field['project_id'])
+        data_field['doc_id'] = str(data_field['doc_id'])
+        data_fields.append(data_field)
+    return data_fields
@@ -21,22 +21,40 @@ sys.path.append(base_path)
 
 from app.mod_cmd.client_instruction import ClientInstruction
 from app.helpers import docs_path, save_project
-from zipfile import ZipFile
 from app import app, mongo
+from app.mod_cmd.project_docs import find_docs
 from libs.arthur.clusterer.dumb_clusterer import DumbClusterer
+from argparse import ArgumentParser
+import config
+
+# Keys documents can be sorted by, see :func:`get_doc_infos`.
+SORT_KEYS = ['name', 'size', 'num_data_fields_labeled', 'num_data_fields_total']
 
 def run(project = None, args = [], **kwargs):
     """List all documents in this project.
 
-    usage: list_docs option
+    usage: list_docs [--page PAGE] [--sort KEY] [--desc] [option]
 
     Args:
         option: Type of documents to display: "all"(default), "corrected", "guessed", "unprocessed".
+
+    Optional arguments:
+      --page PAGE, -p PAGE   Page of documents to display, starting from 1. Displays all documents when not given.
+      --sort KEY, -s KEY     Sort documents by "name", "size", "num_data_fields_labeled" or "num_data_fields_total".
+                             Documents are in order of docs.zip when not given.
+      --desc, -d             Sort in descending order.
     """
-    project, instruction = list_docs(project)
+    parser = ArgumentParser(add_help=False)
+    parser.add_argument('option', nargs='?', default='all')
+    parser.add_argument('--page', '-p', type=int)
+    parser.add_argument('--sort', '-s', choices=SORT_KEYS)
+    parser.add_argument('--desc', '-d', action='store_true')
+    parsed_args = parser.parse_args(args)
+    project, instruction = list_docs(project, page=parsed_args.page, sort=parsed_args.sort,
+                                     descending=parsed_args.desc, session=kwargs.get('session'))
     return [project, instruction]
 
-def list_docs(project):
+def list_docs(project, page=None, sort=None, descending=False, session=None):
     """List all documents in a project
 
     >>> from libs.arthur.project import ArthurProject
@@ -50,6 +68,10 @@ def list_docs(project):
 
     Attr:
         project: Project to get list of documents from
+        page: Page of documents to list, starting from 1. When None, list all documents.
+        sort: Key to sort documents by, one of :data:`SORT_KEYS`.
+        descending: Sort in descending order.
+        session: Session of active project. Defaults to app.session.
     """
     if project == None:
         instruction = ClientInstruction({
@@ -58,35 +80,44 @@ def list_docs(project):
             'message': "Please load a project first with command `load_project [project name]`"
         })
     else:
-        rawpath = docs_path()
         del project.active_doc
         project.active_doc = None
-        save_project(project)
-
-        with app.get_path(rawpath) as path:
-            with ZipFile(path, 'r') as zipfile:
-                instruction = ClientInstruction({
-                    'pass_project': True,
-                    'pass_docs': True,
-                    'docs': get_doc_infos(project, zipfile),
-                    'project': project.to_dict(),
-                    'page': '#doc-list',
-                    'message': "Listing documents of project %s" % project.name
-                })
+        save_project(project, session)
+
+        zip_index = app.get_zip_index(docs_path(session))
+        instruction = ClientInstruction({
+            'pass_project': True,
+            'pass_docs': True,
+            'docs': get_doc_infos(project, zip_index, page=page, sort=sort, descending=descending),
+            'docs_page': page,
+            'docs_per_page': config.DOCS_PER_PAGE,
+            'docs_total': len(zip_index),
+            'page': '#doc-list',
+            'message': "Listing documents of project %s" % project.name
+        })
     return [project, instruction]
 
-def get_doc_infos(project, zipfile):
+def get_doc_infos(project, zipfile, page=None, per_page=config.DOCS_PER_PAGE, sort=None, descending=False):
     """Gets all information of documents inside given zip file.
 
-    Make sure that the zipfile is already opened before passing it here.
+    Pass either an opened zip file, or its index (see :func:`app.get_zip_index`).
     One way to call this, for example:
     >>> # filepath = 'file.zip'
-    >>> # with ZipFile(filepath, 'r') as zipfile:
-    >>> #     get_doc_infos(zipfile)
+    >>> # get_doc_infos(project, app.get_zip_index(filepath))
+
+    Documents are fetched with one query and their data fields are counted with one `$group`
+    aggregation, then joined by name. When sorted by name or size (or not sorted), only
+    the requested page is queried. Sorting by numbers of data fields needs counts of all
+    documents, which still takes the same two queries.
 
     Attr:
         project: Arthur project.
-        zipfile: Zip file handler.
+        zipfile: Zip file handler or ZipIndex.
+        page: Page of documents to get, starting from 1. When None, get all documents.
+        per_page: Number of documents per page.
+        sort: Key to sort documents by, one of :data:`SORT_KEYS`. Documents are in order of
+              the zip file when None.
+        descending: Sort in descending order.
 
     Returns:
         list: A list of dictionary with following information:
@@ -95,15 +126,42 @@ def get_doc_infos(project, zipfile):
               - num_data_fields_labeled: Number of data fields labeled.
               - num_data_fields_total: Total number of data fields.
     """
+    def paginate(items):
+        if page is None:
+            return items
+        return items[(page-1)*per_page:page*per_page]
+
+    zipinfos = zipfile.infolist()
+    by_counts = sort in ('num_data_fields_labeled', 'num_data_fields_total')
+    names = None
+    if not by_counts:
+        if sort == 'name':
+            zipinfos = sorted(zipinfos, key=lambda zipinfo: zipinfo.filename, reverse=descending)
+        elif sort == 'size':
+            zipinfos = sorted(zipinfos, key=lambda zipinfo: zipinfo.file_size, reverse=descending)
+        zipinfos = paginate(zipinfos)
+        names = [zipinfo.filename for zipinfo in zipinfos]
+
+    found_docs = dict((doc['name'], doc) for doc in find_docs(mongo.db, project._id, names=names))
+    # Data fields' project_id may be kept as a string.
+    match = {'project_id': {'$in': [project._id, str(project._id)]}}
+    if names is not None:
+        match['doc_id'] = {'$in': [doc['_id'] for doc in found_docs.values()]}
+    counts = mongo.db.data_fields.aggregate([
+        {'$match': match},
+        {'$group': {'_id': '$doc_id', 'count': {'$sum': 1}}}
+    ])
+    counts = dict((count['_id'], count['count']) for count in counts)
+
     docinfos = []
-    for zipinfo in zipfile.infolist():
+    for zipinfo in zipinfos:
         num_data_fields_labeled = 0
         num_data_fields_total = 0
-        found_docs = filter(lambda d: d.name == zipinfo.filename, project.docs)
+        found_doc = found_docs.get(zipinfo.filename)
 
-        if len(found_docs) > 0:
-            num_data_fields_labeled = mongo.db.data_fields.count({'project_id': project._id, 'doc_id': found_docs[0]._id})
-            num_data_fields_total = found_docs[0].num_data_fields
+        if found_doc is not None:
+            num_data_fields_labeled = counts.get(found_doc['_id'], 0)
+            num_data_fields_total = found_doc.get('num_data_fields', 0)
         docinfos.append({
             'name': zipinfo.filename,
             'size': zipinfo.file_size,
@@ -111,6 +169,9 @@ def get_doc_infos(project, zipfile):
             'num_data_fields_labeled': num_data_fields_labeled,
             'num_data_fields_total': num_data_fields_total
         })
+    if by_counts:
+        docinfos.sort(key=lambda docinfo: docinfo[sort], reverse=descending)
+        docinfos = paginate(docinfos)
     return docinfos
 
 if __name__ == '__main__':
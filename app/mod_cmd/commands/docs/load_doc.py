@@ -1,12 +1,12 @@
 """Load a document
 """
-from zipfile import ZipFile
 from app.helpers import docs_path, save_project
 from libs.arthur import ArthurDocument
 import os
 from app.mod_cmd.client_instruction import ClientInstruction
 from app import app, mongo
 from bson import ObjectId
+from app.mod_cmd.project_docs import find_doc
 
 def run(project = None, args = [], **kwargs):
     """Load a document.
@@ -24,16 +24,17 @@ def run(project = None, args = [], **kwargs):
     _, filetype = os.path.splitext(name)
     if len(args) > 1:
         filetype = args[1]
-    project, instruction = load_doc(name, doctype=filetype, project=project)
+    project, instruction = load_doc(name, doctype=filetype, project=project, session=kwargs.get('session'))
     return [project, instruction]
 
-def load_doc(name, doctype = None, project = None):
+def load_doc(name, doctype = None, project = None, session = None):
     """Load document
 
     Args:
         name: Name of document (file must exist in :/username/project/docs.zip: file).
         doctype: Type of document. 'pdf', 'docx', etc.
         project: reference to ArthurProject object.
+        session: Session of active project. Defaults to app.session.
 
     Returns:
         list: List of two objects, ArthurProject and ClientInstruction instance.
@@ -42,13 +43,10 @@ def load_doc(name, doctype = None, project = None):
         instruction = ClientInstruction({'message': 'Please load a project.'})
     else:
         try:
-            path = docs_path()
-            with app.get_path(path) as path:
-                with ZipFile(path, 'r') as docs:
-                    text = docs.read(name)
-            doc = ArthurDocument(text=text, doctype=doctype, name=name)
+            text = app.get_zip_index(docs_path(session)).read(name)
+            doc = ArthurDocument(text=text, doctype=doctype, name=name, cache=app.parse_cache)
             project.active_doc = doc
-            save_project(project)
+            save_project(project, session)
             instruction = ClientInstruction({
                 'pass_project': True,
                 'data_fields': get_docblocks(project, name),
@@ -72,16 +70,10 @@ def load_doc(name, doctype = None, project = None):
     return (project, instruction)
 
 def get_idocblocks(project, docname):
-    cursor = mongo.db.users.aggregate([
-        {'$unwind': '$projects'},
-        {'$unwind': '$projects.docs'},
-        {'$match': {'projects._id': project._id, 'projects.docs.name': docname}},
-        {'$project': {'projects.docs': 1}}
-    ])
     doc_id = None
-    doc = next(cursor, None)
+    doc = find_doc(mongo.db, project._id, docname)
     if doc:
-        doc_id = doc['projects']['docs']['_id']
+        doc_id = doc['_id']
     docblocks = mongo.db.docblocks.find({
         'project_id': ObjectId(project._id),
         'doc_id': ObjectId(doc_id)
@@ -1,12 +1,8 @@
 """Help command
 """
-import imp
 import pdb
-import os
-import importlib
-from itertools import chain
 from app.mod_cmd.client_instruction import ClientInstruction
-from app.mod_cmd.helpers import get_package_module_pairs, get_base_package_module_pairs, get_package
+from app import app
 
 def run(project=None, args=[], **kwargs):
     """Show all available console commands. `help [command]` to show detailed help for a command.
@@ -52,26 +48,20 @@ def get_docs(cmd = None):
     """
     docs = []
     if cmd is None:
-        last_package = ''
-        for package, module in chain(get_package_module_pairs(), get_base_package_module_pairs()):
-            if package != last_package:
-                if package == 'commands':
+        last_package = None
+        for command in app.commands.commands():
+            if command.package != last_package:
+                if command.package == '':
                     docs.append('others:')
                 else:
-                    docs.append(package+':')
-            last_package = package
-
-            if package == 'commands':
-                package = ''
-            if package != '':
-                package += '.'
-            mod = importlib.import_module("app.mod_cmd.commands.%s%s" % (package, module))
-            docs.append(("\t%s: %s" % (module, mod.run.__doc__.split('\n', 1)[0].strip())))
+                    docs.append(command.package+':')
+            last_package = command.package
+            docs.append(("\t%s: %s" % (command.name, command.summary)))
     else:
-        package = get_package(cmd)
-        if package != '':
-            package += '.'
-        mod = importlib.import_module("app.mod_cmd.commands.%s%s" % (package, cmd))
-        docs.append(("%s\n%s" % (cmd, mod.run.__doc__)).strip())
+        command = app.commands.get(cmd)
+        if command is None:
+            docs.append("Command %s not found." % cmd)
+        else:
+            docs.append(("%s\n%s" % (cmd, command.doc)).strip())
 
     return docs
\ No newline at end of file
@@ -0,0 +1,27 @@
+"""Cancel a background job.
+"""
+from app.mod_cmd.client_instruction import ClientInstruction
+from app import app
+from app.helpers import get_session
+
+def run(project = None, args = [], **kwargs):
+    """Cancel a background job. A running job stops at its next progress message.
+
+    usage: cancel_job id
+
+    Args:
+        id: Id of job to cancel, see `job_status`.
+    """
+    session = get_session(kwargs.get('session'))
+    if len(args) == 0:
+        message = "Usage: cancel_job id"
+    else:
+        job = app.jobs.get(args[0])
+        if job is None or job['user'] != session['active_user']:
+            message = "Job %s not found." % args[0]
+        elif app.jobs.cancel(job['id']):
+            message = "Cancelling job %s. Resume it later with 'resume_job %s'." % (job['id'], job['id'])
+        else:
+            message = "Job %s is already %s." % (job['id'], job['status'])
+    instruction = ClientInstruction({'message': message})
+    return [project, instruction]
@@ -0,0 +1,45 @@
+"""Show status of background jobs.
+"""
+import time
+from app.mod_cmd.client_instruction import ClientInstruction
+from app import app
+from app.helpers import get_session
+
+def run(project = None, args = [], **kwargs):
+    """Show status of your background jobs, or progress of a job.
+
+    usage: job_status [id]
+
+    Args:
+        id: Id of job to show progress of. Shows your latest jobs when not given.
+    """
+    session = get_session(kwargs.get('session'))
+    if len(args) == 0:
+        jobs = app.jobs.list_jobs(session['active_user'])
+        if len(jobs) == 0:
+            message = "No jobs. Submit one with 'submit_job'."
+        else:
+            message = "Latest jobs:"
+            for job in jobs:
+                message += "\n%s  %-10s %-13s %s  %s" % (job['id'], job['status'], job['kind'], job['project'],
+                                                        time.strftime('%Y-%m-%d %H:%M', time.localtime(job['created_at'])))
+    else:
+        job = app.jobs.get(args[0])
+        if job is None or job['user'] != session['active_user']:
+            message = "Job %s not found." % args[0]
+        else:
+            message = \
+            "Job: %s\n" \
+            "Command: %s %s\n" \
+            "Project: %s\n" \
+            "Status: %s" \
+            % (job['id'], job['kind'], " ".join(job['params']['args']), job['project'], job['status'])
+            if job.get('error'):
+                message += "\nError: %s" % job['error']
+            if job.get('result'):
+                message += "\nResult: %s" % job['result']
+            log = app.jobs.log(job['id'], count=10)
+            if len(log) > 0:
+                message += "\n\nLatest progress:\n%s" % "\n".join(log)
+    instruction = ClientInstruction({'message': message})
+    return [project, instruction]
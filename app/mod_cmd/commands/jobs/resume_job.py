@@ -0,0 +1,27 @@
+"""Resume a failed or cancelled background job.
+"""
+from app.mod_cmd.client_instruction import ClientInstruction
+from app import app
+from app.helpers import get_session
+
+def run(project = None, args = [], **kwargs):
+    """Resume a failed or cancelled background job from its last completed batch.
+
+    usage: resume_job id
+
+    Args:
+        id: Id of job to resume, see `job_status`.
+    """
+    session = get_session(kwargs.get('session'))
+    if len(args) == 0:
+        message = "Usage: resume_job id"
+    else:
+        job = app.jobs.get(args[0])
+        if job is None or job['user'] != session['active_user']:
+            message = "Job %s not found." % args[0]
+        elif app.jobs.resume(job['id']):
+            message = "Resumed job %s." % job['id']
+        else:
+            message = "Job %s is %s, only failed or cancelled jobs can be resumed." % (job['id'], job['status'])
+    instruction = ClientInstruction({'message': message})
+    return [project, instruction]
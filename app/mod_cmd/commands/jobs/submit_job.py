@@ -0,0 +1,39 @@
+"""Run a long command as a background job.
+"""
+from app.mod_cmd.client_instruction import ClientInstruction
+from app.mod_cmd.commands.help import get_docs
+from app.mod_cmd.jobs import JOB_KINDS
+from app import app
+from app.helpers import get_session
+
+def run(project = None, args = [], **kwargs):
+    """Run a long command in background, by a worker. Its progress is kept even when you disconnect.
+
+    usage: submit_job command [arguments]
+
+    Args:
+        command: One of `load_zip`, `create_corpus` or `cluster`.
+        arguments: Arguments of the command, e.g. `submit_job load_zip --keep name`.
+                   `create_corpus` takes [--batch_size N] [--overwrite].
+
+    Follow the job with `job_status`, and stop it with `cancel_job`.
+    """
+    session = get_session(kwargs.get('session'))
+    if project is None:
+        instruction = ClientInstruction({'message': 'Please load a project.'})
+    elif len(args) == 0 or args[0] not in JOB_KINDS:
+        instruction = ClientInstruction({'message': "\n".join(get_docs('submit_job'))})
+    else:
+        kind = args[0]
+        parse_args, _ = JOB_KINDS[kind]
+        try:
+            parse_args(args[1:])
+        except SystemExit:
+            # ArgumentParser exits on invalid arguments.
+            instruction = ClientInstruction({'message': "Invalid arguments for %s.\n%s" % (kind, "\n".join(get_docs('submit_job')))})
+        else:
+            job_id = app.jobs.submit(kind, {'args': args[1:]}, user=session['active_user'], project=project.name)
+            instruction = ClientInstruction({
+                'message': "Submitted job %s. Run 'job_status %s' to follow its progress." % (job_id, job_id)
+            })
+    return [project, instruction]
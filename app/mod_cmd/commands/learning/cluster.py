@@ -5,7 +5,7 @@ from libs.arthur.learner import get_clustering_algorithms, get_clusterer_class
 from libs.arthur.reader import read
 import os
 import config
-from app.helpers import user_path
+from app.helpers import user_path, get_session
 from app import app, mongo
 from bson import ObjectId
 
@@ -27,7 +27,7 @@ def run(project = None, args = [], connection = None, **kwargs):
             instruction = ClientInstruction({'message': "Clusterer '%s' not found. Run 'cluster' to view all available clusterers." % args[0]})
 
         # Try to find list of mwes (multi-word expressions) from database, and setup clusterer when not found.
-        user_id = mongo.db.users.find_one({'username': app.session['active_user']}, ['_id'])
+        user_id = mongo.db.users.find_one({'username': get_session(kwargs.get('session'))['active_user']}, ['_id'])
         query = {'user_id': user_id, 'project_id': ObjectId(project._id)}
 
         # Todo: Use either user's or project's path, still undecided for now...
@@ -3,6 +3,7 @@
 from argparse import ArgumentParser
 from app.mod_cmd.client_instruction import ClientInstruction
 from app import app, mongo
+from app.helpers import get_session
 
 def run(project = None, args = [], **kwargs):
     """Create a concept.
@@ -44,7 +45,7 @@ def run(project = None, args = [], **kwargs):
         parser.add_argument('--docs', '-d', nargs='+')
         parsed_args = parser.parse_args(args)
 
-        user_id = mongo.db.users.find_one({'username': app.session['active_user']},
+        user_id = mongo.db.users.find_one({'username': get_session(kwargs.get('session'))['active_user']},
                                           projection=['_id'])['_id']
 
 
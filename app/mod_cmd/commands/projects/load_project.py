@@ -7,6 +7,8 @@ import os
 from app.mod_cmd.client_instruction import ClientInstruction
 from app import app
 from app.mod_cmd.commands.docs.load_doc import load_doc
+from app.mod_cmd.project_docs import ProjectDocs, move_project_docs
+from app.helpers import get_session
 
 def run(project = None, args = [], **kwargs):
     """Load a project.
@@ -17,19 +19,40 @@ def run(project = None, args = [], **kwargs):
         name: Name of project to load.
     """
     name = args[0]
-    project, instruction = load_project('default', name)
+    session = get_session(kwargs.get('session'))
+    # Explicitly loading a project always reloads it from database.
+    app.project_cache.invalidate('default', name)
+    project = load_cached_project('default', name, session=session)
     if project is None:
         instruction = ClientInstruction({'message': "Project \"%s\" does not exist. Run 'list_projects' to view available projects." % name})
     else:
-        app.session['active_doc'] = None
-        app.session['active_project'] = name
-        project, instruction = status.run(project)
+        session['active_doc'] = None
+        session['active_project'] = name
+        project, instruction = status.run(project, session=session)
         instruction.set_value('pass_project', True);
         instruction.set_value('page', '#doc-list');
         instruction.set_message(("Project \"%s\" loaded.\n-----------------------------\n" + instruction.get_message()) % project.name)
     return [project, instruction]
 
-def load_project(username, project_name):
+def load_cached_project(username, project_name, session=None):
+    """Get a project from app.project_cache, loading it when not cached.
+
+    Args:
+        username: Username owning the project.
+        project_name: Name of project to load.
+        session: Session the project is active in, see :func:`load_project`.
+
+    Returns:
+        ArthurProject: Loaded project, or None when project does not exist.
+    """
+    project = app.project_cache.get(username, project_name)
+    if project is None:
+        project, _ = load_project(username, project_name, session=session)
+        if project is not None:
+            app.project_cache.set(username, project_name, project)
+    return project
+
+def load_project(username, project_name, session=None):
     """Load a project.
 
     This method is accessible from other parts of the app.
@@ -37,6 +60,8 @@ def load_project(username, project_name):
     Args:
         username: Username owning the project.
         project_name: Name of project to load.
+        session: Session the project is active in, its active document is loaded from the
+                 project's docs.zip. Defaults to app.session.
     """
     # projection is important here to get only the projects with given name.
     user_data = mongo.db.users.find_one({'username': username, 'projects.name': project_name},
@@ -46,20 +71,19 @@ def load_project(username, project_name):
         return (None, None)
     else:
         project_data = user_data['projects'][0]
-        
-        docs = []
-        if 'docs' in project_data:
-            for doc_data in project_data['docs']:
-                docs.append(ArthurDocument(**doc_data))
+        # Documents of a project not moved into docs collection on startup yet are moved now,
+        # so they are not missing from the project.
+        move_project_docs(mongo.db, user_data['_id'], project_data)
 
         project = ArthurProject(
             name = project_data['name'],
             context = mongo.db.contexts.find_one({'_id': project_data['context_id']}),
             _id = project_data['_id'],
-            docs = docs
+            # Documents are only created when used, summaries are listed from their records.
+            docs = ProjectDocs(mongo.db, project_data['_id'], ArthurDocument)
         )
 
         instruction = None
         if 'active_doc' in project_data and project_data['active_doc'] is not None:
-            project, instruction = load_doc(project_data['active_doc'], project=project)
+            project, instruction = load_doc(project_data['active_doc'], project=project, session=session)
         return (project, instruction)
@@ -1,8 +1,7 @@
 """This module is useful to allow user finds out current state of their work.
 """
 from app.mod_cmd.client_instruction import ClientInstruction
-from app.helpers import docs_path
-from zipfile import ZipFile
+from app.helpers import docs_path, get_session
 from app import app, mongo
 
 def run(project = None, args = [], **kwargs):
@@ -14,19 +13,27 @@ def run(project = None, args = [], **kwargs):
         item: Item from the project you wish to view in more detail. Possible values:
               - docs: View all docs currently being worked on. Shorthand of `list_docs` command.
               - context: View the detail of context currently used in the project.
+              - cache: View hits, misses and size of the local cache of remote files.
     """
-    if project is None:
+    if len(args) > 0 and args[0] == 'cache':
+        stats = app.fs.cache.stats()
+        message = \
+        "Cached files: %d (%d bytes)\n" \
+        "Hits: %d\n" \
+        "Misses: %d\n" \
+        "Writes: %d\n" \
+        "Evictions: %d" \
+        % (stats['files'], stats['size'], stats['hits'], stats['misses'],
+           stats['writes'], stats['evictions'])
+    elif project is None:
         message = ""
     else:
+        session = get_session(kwargs.get('session'))
         active_doc = ''
-        if 'last_loaded_doc' in app.session:
-            active_doc = app.session['last_loaded_doc']
+        if 'last_loaded_doc' in session:
+            active_doc = session['last_loaded_doc']
         
-        path = docs_path()
-
-        with app.get_path(path) as path:
-            with ZipFile(path, 'r') as zipfile:
-                docs = len(zipfile.namelist())
+        docs = len(app.get_zip_index(docs_path(session)))
         current_context = project.context['name']
         dfcount = mongo.db.data_fields.count({'project_id': project._id})
 
@@ -0,0 +1,30 @@
+"""Choose how responses are encoded for this connection.
+"""
+from app.mod_cmd.client_instruction import ClientInstruction
+from libs import wire_format as wire
+
+def run(project = None, args = [], connection = None, **kwargs):
+    """Set how responses to this connection are encoded.
+
+    wire_format [json|compact] [deflate]
+
+    Args:
+        json: Plain json, a dict per document element (default).
+        compact: Document elements as one base64 encoded typed array per feature, much smaller
+                 and faster to decode for large documents. See libs/wire_format.py.
+        deflate: Also compress large responses.
+
+    Without arguments, shows the current format.
+    """
+    if connection is None:
+        return [project, ClientInstruction({'message': "No connection to set wire format of."})]
+    if len(args) > 0:
+        if args[0] not in wire.FORMATS or (len(args) > 1 and args[1] != 'deflate'):
+            return [project, ClientInstruction({'message': "usage: wire_format [json|compact] [deflate]"})]
+        connection.wire_format = args[0]
+        connection.compression = args[1] if len(args) > 1 else None
+    message = "Wire format: %s" % connection.wire_format
+    if connection.compression is not None:
+        message += " (%s)" % connection.compression
+    instruction = ClientInstruction({'message': message})
+    return [project, instruction]
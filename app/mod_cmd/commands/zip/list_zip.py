@@ -10,8 +10,9 @@ def run(project = None, args = [], **kwargs):
     """List all uploaded zip files.
     """
     
-    if user_logged_in():
-        path = os.path.join(uploaded_path(), '*.zip')
+    session = kwargs.get('session')
+    if user_logged_in(session):
+        path = os.path.join(uploaded_path(session), '*.zip')
         filenames = []
         for filepath in glob.iglob(path):
             filenames.append(os.path.basename(filepath))
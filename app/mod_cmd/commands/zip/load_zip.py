@@ -28,15 +28,21 @@ if __name__ == '__main__':
 from zipfile import ZipFile
 from app.mod_cmd.client_instruction import ClientInstruction
 from app import app, mongo
-from app.helpers import user_path, uploaded_path, docs_path, save_project
+from app.helpers import user_path, uploaded_path, docs_path, corpus_path, save_project
+from app.mod_cmd.ingestion_writer import IngestionWriter
+from app.mod_cmd.project_docs import delete_docs
+import config
 from app.mod_cmd.commands.help import get_docs
-import os
+import os, errno
 from libs.arthur import ArthurDocument
+from libs.arthur.document import ArthurParseCache
 import numpy as np
-import sockjs.tornado
 from bson.objectid import ObjectId
 from argparse import ArgumentParser
-from libs.arthur.reader import create_corpus, read
+from libs.arthur.reader import write_corpus_file, read
+from libs.arthur.collocations import CollocationStore
+from libs.arthur.pipeline import Pipeline
+from libs.arthur.clusterer.dumb_clusterer import DumbClusterer
 
 def run(project = None, args = [], **kwargs):
     """Load all documents inside a zip file in server into currently active project. Runs 'upload_zip' instead if file does not exist.
@@ -62,32 +68,59 @@ def run(project = None, args = [], **kwargs):
                 'message': "\n".join(docs)
             })
         else:
-            parser = ArgumentParser(add_help=False)
-            parser.add_argument('name')
-            parser.add_argument('--keep', '-k', action='store_true')
-            parser.add_argument('--nuke', '-n', action='store_true')
-            parser.add_argument('--overwrite_corpus', '-o', action='store_true')
-            parsed_args = parser.parse_args(args)
+            parsed_args = parse_args(args)
 
             name = parsed_args.name
             keep = parsed_args.keep
             nuke = parsed_args.nuke
-            frompath = os.path.join(uploaded_path(), name)
-            project, instruction = load_zip(project, docs_path(), frompath, keep=keep, nuke=nuke, connection=kwargs['connection'], mongo=mongo)
-            save_project(project)
+            overwrite_corpus = parsed_args.overwrite_corpus
+            session = kwargs.get('session')
+            frompath = os.path.join(uploaded_path(session), name)
+            project, instruction = load_zip(project, docs_path(session), frompath, keep=keep, nuke=nuke,
+                                            overwrite_corpus=overwrite_corpus, corpus_dir=corpus_path(session),
+                                            connection=kwargs['connection'], mongo=mongo, session=session)
+            save_project(project, session)
 
     return [project, instruction]
 
-def load_zip(project, docs_path, zip_path, keep=False, nuke=False, connection=None, mongo=None):
+def parse_args(args):
+    """Parses arguments of this command, see :func:`run`.
+    """
+    parser = ArgumentParser(add_help=False)
+    parser.add_argument('name')
+    parser.add_argument('--keep', '-k', action='store_true')
+    parser.add_argument('--nuke', '-n', action='store_true')
+    parser.add_argument('--overwrite_corpus', '-o', action='store_true')
+    return parser.parse_args(args)
+
+def load_zip(project, docs_path, zip_path, keep=False, nuke=False, overwrite_corpus=False, corpus_dir=None,
+             clusterer=None, connection=None, mongo=None, start=0, on_checkpoint=None, session=None):
     """Loads documents from zip_path into project.
 
+    Documents are streamed through a :class:`libs.arthur.pipeline.Pipeline` with these stages,
+    connected by bounded queues so only a few documents are held in memory at once:
+
+    1. Read a member of the zip file.
+    2. Parse it into an ArthurDocument. A document already in project, which has no elements
+       when it was created from its database record, is parsed as well to fill them in.
+       A document in app.parse_cache is loaded from there. Otherwise it is parsed exactly once, in a process of app.executor so parsing does not
+       hold the GIL other clients' requests need, and stored into the cache. When app.executor
+       has no process pool, documents are parsed in this stage's thread instead.
+    3. Append it to project's docs.zip.
+    4. Write its text into the corpus.
+    5. Cluster its content into data fields.
+    6. Queue the document and its data fields for database, see
+       :class:`app.mod_cmd.ingestion_writer.IngestionWriter`. Writes are flushed in bulk,
+       so progress is reported without waiting on database for each document.
+
     Args:
         project: ArthurProject object documents will be loaded into.
         docs_path: Path to docs.zip of a project.
         zip_path: Path to zip file containing documents to load.
         keep: By default, load_zip will remove uploaded zip file. Set this to True to keep that file.
-        connection: Pass a sockjs.tornado.SockJSConnection object to update progress dynamically,
-                    otherwise print will be used.
+        connection: Pass a sockjs.tornado.SockJSConnection object (or any object with `send`
+                    method, e.g. a :class:`libs.redis_jobs.job_queue.Job`) to update progress
+                    dynamically, otherwise print will be used.
 
     While loading each document, its content will be clustered into several data_fields which will
     then be used for learning algorithms.
@@ -96,9 +129,9 @@ def load_zip(project, docs_path, zip_path, keep=False, nuke=False, connection=No
     >>> project = ArthurProject('test_project')
     >>> zip_path = os.path.join(base_path, 'test', 'unit', 'test.zip')
     >>> project, instruction = load_zip(project, docs_path, zip_path, keep=True)
-    Found document "11758.docx". Created 0 data_fields (not entered into database).
-    Found document "348418.pdf". Created 50 data_fields (not entered into database).
-    Found document "348608.pdf". Created 53 data_fields (not entered into database).
+    Found document "11758.docx". Created 0 data fields (not entered into database).
+    Found document "348418.pdf". Created 50 data fields (not entered into database).
+    Found document "348608.pdf". Created 53 data fields (not entered into database).
 
     >>> print(instruction.get_value('message')) # doctest:+ELLIPSIS
     Loaded ...
@@ -110,13 +143,26 @@ def load_zip(project, docs_path, zip_path, keep=False, nuke=False, connection=No
         zip_path (str): Path to zip file containing documents to be loaded.
         keep (bool): If True, keep loaded zip file, otherwise delete it after all documents
                      loaded into project. Defaults to False.
+        overwrite_corpus (bool): Overwrite corpus files of documents that already have them.
+        corpus_dir (str): Corpus directory to write documents' texts into. No corpus is written
+                          when not given.
+        clusterer: Clusterer to extract data fields with. Defaults to a DumbClusterer without MWEs.
         mongo (MongoClient): If not empty, will store blocks into mongodb database.
+        start (int): Number of zip file's members to skip, e.g. the ones loaded before
+                     an interrupted load.
+        on_checkpoint (function): Called with the number of zip file's members whose documents
+                                  and data fields are all in database, after each write to
+                                  database. Pass it as `start` to resume an interrupted load.
+        session: Session of active project, the project is saved with. Defaults to app.session.
 
     Returns:
         list: [ArthurProject instance, ClientInstruction instance]
     """
     found = []
     added = []
+    name = os.path.basename(zip_path)
+    if clusterer is None:
+        clusterer = DumbClusterer()
     try:
         fromzip = ZipFile(zip_path, 'r')
         try:
@@ -125,64 +171,132 @@ def load_zip(project, docs_path, zip_path, keep=False, nuke=False, connection=No
 
             if nuke:
                 mode = 'w'
-                project.nuke_docs(corpus_dir=corpus_path())
+                project.nuke_docs(corpus_dir=corpus_dir)
                 project.active_doc = None
-                message = "☠ - Nuked project's documents - No Survivor!"
-                if isinstance(connection, sockjs.tornado.SockJSConnection):
-                    connection.send(message)
-                else:
-                    print(message)
+                send(connection, "☠ - Nuked project's documents - No Survivor!")
                 if mongo:
                     mongo.db.data_fields.delete_many({'project_id': project._id})
-
-            # Create corpus
-            send(connection, "Attempt to create corpus...")
-            create_corpus(fromzip, corpus_path(), stdout=connection, overwrite=overwrite_corpus)
+                    delete_docs(mongo.db, project._id)
+                    save_project(project, session)
 
             tozip = ZipFile(topath, mode)
+            collocations = None
+            if corpus_dir is not None:
+                if not os.path.exists(corpus_dir):
+                    os.makedirs(corpus_dir)
+                collocations = CollocationStore.open(corpus_dir)
+            # Index of each document by name. Only the documents found in zip file are created.
+            existing = dict((summary['name'], index) for index, summary in enumerate(project.get_doc_summaries()))
+            # Number of members queued for database, all of them are written on each flush.
+            inserted = [start]
+            def checkpoint():
+                if on_checkpoint is not None:
+                    on_checkpoint(inserted[0])
+
+            writer = None
+            if mongo is not None:
+                writer = IngestionWriter(mongo.db, project._id, batch_size=config.INGEST_BATCH_SIZE,
+                                         flush_interval=config.INGEST_FLUSH_INTERVAL, on_flush=checkpoint)
 
-            for docname in fromzip.namelist():
-                content = fromzip.read(docname)
+            # Stages run in threads of their own, they check cancellation of this command with its token.
+            token = app.executor.cancel_token()
+
+            def read_members():
+                for docname in fromzip.namelist()[start:]:
+                    app.executor.check_cancelled(token)
+                    yield {'docname': docname, 'content': fromzip.read(docname)}
+
+            def parse(item):
+                index = existing.get(item['docname'])
+                document = project.docs[index] if index is not None else None
+                item['new'] = document is None
+                if document is None or len(document.get_features()) == 0:
+                    cache = app.parse_cache
+                    parsed = None
+                    if cache is None or not cache.has(item['content']):
+                        cache_args = (cache.cache_dir, cache.max_size, cache.max_age) if cache is not None else ()
+                        parsed = app.executor.run_in_process(parse_document, item['content'], *cache_args,
+                                                             token=token)
+                    if document is None:
+                        document = ArthurDocument(item['content'], name=item['docname'], project_id=project._id,
+                                                  _id=ObjectId(), cache=cache, parsed=parsed)
+                    else:
+                        if parsed is None:
+                            parsed = ArthurDocument(item['content'], cache=cache).get_parsed()
+                        document.load_parsed(parsed)
+                item['document'] = document
+                return item
+
+            def archive(item):
+                docname = item['docname']
+                # Content is not needed after this stage.
+                content = item.pop('content')
                 try:
                     tozip.getinfo(docname)
                     found.append(docname)
-                    message = "Found document \"%s\"." % docname
-                except:
+                    item['message'] = "Found document \"%s\"." % docname
+                except KeyError:
                     # Add to project's list of documents
                     tozip.writestr(docname, content)
                     added.append(docname)
-                    message = "Loaded document \"%s\"." % docname
+                    item['message'] = "Loaded document \"%s\"." % docname
+                return item
+
+            def extract_corpus(item):
+                if collocations is None:
+                    return item
+                fileid = item['docname']+'.txt'
+                filename = os.path.join(corpus_dir, fileid)
+                exists = os.path.isfile(filename)
+                if not exists or overwrite_corpus:
+                    old_text = None
+                    if exists and fileid in collocations.fileids:
+                        with open(filename, 'rb') as f:
+                            old_text = f.read()
+                    text = write_corpus_file(item['document'], filename)
+                    # Counts of the old file are only replaced when it was overwritten.
+                    if text:
+                        if old_text is not None:
+                            collocations.remove_text(fileid, old_text)
+                        collocations.add_text(fileid, text)
+                return item
+
+            def cluster(item):
                 # Checks if data fields have been created for this document, add if they haven't.
-                documents = filter(lambda d: d.name == docname, project.docs)
-                new_data_fields = []
-                if len(documents) == 0:
-                    document = ArthurDocument(content, name=docname, project_id=project._id, _id=ObjectId())
-                    project.docs.append(document)
-                    if mongo is not None:
-                        # Todo: Use transaction and save in bulk instead.
-                        save_project(project)
-                    have_data_fields = False
-                else:
-                    document = documents[0]
-                    have_data_fields = True
-                    if document.num_data_fields == 0:
-                        have_data_fields = False
-
-                if have_data_fields:
-                    message += " Already has %i data fields." % document.num_blocks 
-                else:
-                    new_data_fields = read(document, project_id=project._id)
-                    if mongo is not None:
-                        if len(new_data_fields) == 0:
-                            total_inserted_data_fields = 0
-                        else:
-                            total_inserted_data_fields = len(mongo.db.data_fields.insert_many(new_data_fields).inserted_ids)
-                            save_project(project)
-                        message += " Created %i data fields and entered them into database." % (total_inserted_data_fields)
-                    else:
-                        message += " Created %i data fields (not entered into database)." % (len(new_data_fields))
+                document = item['document']
+                item['data_fields'] = None
+                if item['new'] or document.num_data_fields == 0:
+                    item['data_fields'] = read(document, clusterer, project_id=project._id)
+                    document.num_data_fields = len(item['data_fields'])
+                return item
 
-                send(connection, message)
+            def insert(item):
+                inserted[0] += 1
+                if writer is not None and item['data_fields'] is not None:
+                    writer.add_document(item['document'], item['data_fields'])
+                return item
+
+            pipeline = Pipeline([parse, archive, extract_corpus, cluster, insert])
+            try:
+                for item in pipeline.run(read_members()):
+                    document = item['document']
+                    message = item['message']
+                    if item['new']:
+                        project.docs.append(document)
+                    if item['data_fields'] is None:
+                        message += " Already has %i data fields." % document.num_data_fields
+                    elif writer is not None:
+                        message += " Created %i data fields and queued them for database." % len(item['data_fields'])
+                    else:
+                        message += " Created %i data fields (not entered into database)." % len(item['data_fields'])
+                    send(connection, message)
+                if writer is not None:
+                    writer.close()
+                    save_project(project, session)
+                    send(connection, "Entered %i data fields into database." % writer.total_data_fields)
+            finally:
+                if collocations is not None:
+                    collocations.save()
 
         except KeyError as e:
             instruction = ClientInstruction({'message': e[1]})
@@ -211,8 +325,25 @@ def load_zip(project, docs_path, zip_path, keep=False, nuke=False, connection=No
     })
     return [project, instruction]
 
+def parse_document(content, cache_dir=None, max_size=None, max_age=None):
+    """Parses a document and stores it into parse cache, so it is not parsed again next time.
+    Runs in a separate process, see :func:`CommandExecutor.run_in_process`.
+
+    Args:
+        content: Content of the document.
+        cache_dir, max_size, max_age: See :class:`libs.arthur.document.ArthurParseCache`.
+                                      No cache is used when cache_dir is None.
+
+    Returns:
+        tuple: Parsed document, pass it as `parsed` to ArthurDocument.
+    """
+    cache = None
+    if cache_dir is not None:
+        cache = ArthurParseCache(cache_dir, max_size=max_size, max_age=max_age)
+    return ArthurDocument(content, cache=cache).get_parsed()
+
 def send(connection, message):
-    if isinstance(connection, sockjs.tornado.SockJSConnection):
+    if connection is not None:
         connection.send(message)
     else:
         print(message)
@@ -1,25 +1,65 @@
 """
 Controllers for mod_cmd
 """
-import os
-import glob
-import importlib
-from libs.arthur import ArthurProject
-from helpers import get_package
 import sockjs.tornado
 import json
+import logging
+from tornado.ioloop import IOLoop
 from libs.redis_session.for_tornado import Session
+from command_executor import CommandCancelled
+
+# Commands run right away on the IOLoop instead of waiting for the running command of the project.
+# They get no project, so they never wait on database.
+INLINE_COMMANDS = ['cancel']
 
 class WorkspaceConnection(sockjs.tornado.SockJSConnection):
-    """Workspace connection implementation"""
+    """Workspace connection implementation
+
+    Responses of commands with `pass_project` carry the whole project as 'project', along with
+    its version as 'project_version'. A client that sends back the version it has as
+    'project_version' in its messages gets 'project_delta' instead, with only what changed since
+    (see :func:`ProjectStates.delta`). A delta applies to the version in its 'base_version'. A client
+    whose version differs sends 'project_version': null to get the whole project again.
+    A new connection always gets the whole project.
+
+    With `initial_pages` query argument, only elements of the first pages of active document are
+    sent with the project (listed in its 'element_pages'), and the client asks for the pages it
+    shows with `get_pages` command.
+
+    Attributes:
+        wire_format: How responses to this connection are encoded, 'json' or 'compact'.
+                     Set with `wire_format` query argument or command, see :mod:`libs.wire_format`.
+        compression: None, or 'deflate' to compress large responses.
+        project_version: Version of project last sent to this connection.
+        delta_sync: Whether the client acknowledged a version, so it can be sent deltas.
+        initial_pages: Number of pages of active document sent with the project. None for all pages.
+    """
     # Class level variable
     participants = set()
+    wire_format = 'json'
+    compression = None
+    project_version = None
+    delta_sync = False
+    initial_pages = None
 
     def write(self, message=''):
         """This method is needed so WorkspaceConnection object can be passed to functions
         that print progress as they run, e.g. :class:`ArthurReader`.
         """
 
+    def send(self, message, binary=False):
+        """Sends message to the client.
+
+        When called from a running command, the message is sent from the IOLoop instead, and
+        :class:`CommandCancelled` is raised if the command has been cancelled.
+        """
+        from app import app
+        if app.executor.in_command():
+            app.executor.check_cancelled()
+            app.executor.add_callback(super(WorkspaceConnection, self).send, message, binary)
+        else:
+            super(WorkspaceConnection, self).send(message, binary)
+
     def on_open(self, info):
         """What to do when connection first opened up.
 
@@ -38,72 +78,254 @@ class WorkspaceConnection(sockjs.tornado.SockJSConnection):
 
         self.info = info
         self._prepare_session(app)
+        self._set_wire_format(info)
 
         # Send that someone joined
         self.broadcast(self.participants, "%s joined." % self.session.conn_info.ip)
 
         # Add client to the clients list
         self.participants.add(self)
-        if 'active_project' in app.session:
-            project, instruction = load_project(app.session['active_user'], app.session['active_project'])
+        session = app.session
+        if 'active_project' in session:
+            # A new connection always loads a fresh project, then shares it through app.project_cache.
+            project, instruction = load_project(session['active_user'], session['active_project'], session=session)
             if project.active_doc == None:
-                project, instruction = list_docs(project)
+                project, instruction = list_docs(project, session=session)
+            app.project_cache.set(session['active_user'], session['active_project'], project)
             instruction.set_value('message', "Connected to workspace server.\n\n%s" % instruction.get_value('message'))
 
             project, instruction = self.pass_other_stuff(project, instruction)
 
-            self.send(instruction.to_json())
+            self.broadcast_responses(self.encode_responses(instruction, [self]))
         else:
             self.send("Connected to workspace server.")
 
     def on_message(self, message):
+        """Runs the command in message.
+
+        Commands run in app.executor, so the IOLoop keeps serving other clients. Commands of the
+        same project run one at a time, also from different connections, as they share the
+        project kept in app.project_cache. Its response is broadcast once it is done.
+        """
         from app import app
         data = json.loads(message)
-        [project, response_msg] = self.run_cmd(data)
-        self.broadcast(self.participants, response_msg)
+        if 'project_version' in data:
+            self.delta_sync = app.project_states.has(data['project_version'])
+        if 'method' not in data:
+            # Only acknowledged project version.
+            return
+        # Commands get the session and participants as they are now, instead of reading them from
+        # their thread while the IOLoop changes them.
+        session = app.session
+        participants = list(self.participants)
+        if data['method'] in INLINE_COMMANDS:
+            [project, responses] = self.run_cmd(data, session, participants)
+            self.broadcast_responses(responses)
+        else:
+            future = app.executor.submit(self._executor_key(session), self._run_cmd_and_respond, data, session,
+                                         participants, owner=self)
+            IOLoop.current().add_future(future, lambda future: self._on_cmd_done(data, future))
+
+    def _executor_key(self, session):
+        """Key commands run one at a time by, see :func:`CommandExecutor.submit`: the active project,
+        or this connection when no project is active.
+        """
+        if 'active_project' in session:
+            return (session['active_user'], session['active_project'])
+        return self
+
+    def _run_cmd_and_respond(self, data, session, participants):
+        """Runs a command in a thread of app.executor, then broadcasts its response from the IOLoop.
+
+        The response is queued on the IOLoop before the next command of the project starts,
+        so it always comes after this command's progress messages and before the next one's.
+        """
+        from app import app
+        try:
+            [project, responses] = self.run_cmd(data, session, participants)
+        except CommandCancelled:
+            self._invalidate_project(session)
+            responses = [(self.participants, self._cancelled_response(data), None)]
+        except Exception as e:
+            logging.exception("Command %s failed", data['method'])
+            self._invalidate_project(session)
+            responses = [(self.participants, self._error_response(data, e), None)]
+        app.executor.add_callback(self.broadcast_responses, responses)
+
+    def _on_cmd_done(self, data, future):
+        try:
+            future.result()
+        except CommandCancelled:
+            # Cancelled before it started.
+            self.broadcast(self.participants, self._cancelled_response(data))
+        except Exception as e:
+            # Failed outside of the command, errors of the command are responded to by _run_cmd_and_respond.
+            logging.exception("Command %s failed", data['method'])
+            self.broadcast(self.participants, self._error_response(data, e))
+
+    def _invalidate_project(self, session):
+        """Drops the active project from app.project_cache, e.g. when a command failed or was
+        cancelled after changing it halfway.
+        """
+        from app import app
+        if 'active_project' in session:
+            app.project_cache.invalidate(session['active_user'], session['active_project'])
+
+    def _cancelled_response(self, data):
+        from app.mod_cmd.client_instruction import ClientInstruction
+        instruction = ClientInstruction({'message': "Command %s cancelled." % data['method']})
+        return instruction.to_json()
+
+    def _error_response(self, data, error):
+        from app.mod_cmd.client_instruction import ClientInstruction
+        instruction = ClientInstruction({'message': "Command %s failed: %s: %s" % (data['method'], type(error).__name__, error)})
+        return instruction.to_json()
 
     def on_close(self):
+        from app import app
+        # Commands of a closed connection have no one to respond to. Commands of other
+        # connections to the same project keep running.
+        app.executor.cancel(self)
+
         # Remove client from the clients list and broadcast leave message
         self.participants.remove(self)
 
         self.broadcast(self.participants, "%s left." % self.session.conn_info.ip)
         self.send("Disconnected from workspace server. Run 'connect' to reconnect.")
 
-    def run_cmd(self, data):
+    def run_cmd(self, data, session, participants):
         """Runs the given command.
+
+        Active project is taken from app.project_cache instead of being loaded from database
+        for every command. The project returned by the command is cached again, so changes
+        made by the command are seen by the next one.
+
+        Args:
+            data(dict): Message of the command, with 'method' and 'params'.
+            session: Session of the connection, passed to the command as `session`.
+            participants(list): Connections to respond to, taken on the IOLoop.
+
+        Returns:
+            tuple: (project, responses), see :func:`encode_responses`.
         """
-        from app.mod_cmd.commands.projects.load_project import load_project
+        from app.mod_cmd.commands.projects.load_project import load_cached_project
         from app import app
         from app.mod_cmd.client_instruction import ClientInstruction
         
-        command = data['method']
+        command = app.commands.get(data['method'])
         params = data['params']
 
-        package = get_package(command)
-
         project = None
-        if 'active_project' in app.session:
-            project, _ = load_project(app.session['active_user'], app.session['active_project'])
-
-        if os.path.exists(os.path.join('app', 'mod_cmd', 'commands', package, command+'.py')):
-            if package != '':
-                package += '.'
-            cmd = importlib.import_module("app.mod_cmd.commands.%s%s" % (package, command))
-            [project, instruction] = cmd.run(project, params, connection=self)
+        if 'active_project' in session and data['method'] not in INLINE_COMMANDS:
+            project = load_cached_project(session['active_user'], session['active_project'], session=session)
+
+        if command is not None and command.error is not None:
+            instruction = ClientInstruction({'message': "Command %s is unavailable: %s" % (command.name, command.error)})
+        elif command is not None:
+            [project, instruction] = command.run(project, params, connection=self, session=session)
         else:
-            instruction = ClientInstruction({'message': "Command %s not found. Run 'help' to view all available commands." % command})
+            instruction = ClientInstruction({'message': "Command %s not found. Run 'help' to view all available commands." % data['method']})
+
+        if project is not None and 'active_project' in session and project.name == session['active_project']:
+            app.project_cache.set(session['active_user'], project.name, project)
 
         project, instruction = self.pass_other_stuff(project, instruction)
 
-        return (project, instruction.to_json())
+        # Responses meant for this connection only, e.g. pages it shows. The flag is not sent.
+        if instruction.get_value().pop('broadcast', None) is False:
+            participants = [self]
+        return (project, self.encode_responses(instruction, participants))
+
+    def encode_responses(self, instruction, participants=None):
+        """Encodes instruction for participants, once per wire format and project version in use.
+
+        A project passed in instruction is sent whole, or as a delta to participants that
+        acknowledged a version. Participants are not changed here, as this runs in command
+        threads: the version sent is recorded by :func:`broadcast_responses` on the IOLoop.
+
+        Args:
+            participants(list): Connections to encode for. Defaults to all participants, pass a list
+                                of them taken on the IOLoop when called from a command thread.
+
+        Returns:
+            list: List of (participants, message, project_version) tuples. project_version
+                  is None when no project is sent.
+        """
+        from app import app
+        from app.mod_cmd.client_instruction import ClientInstruction
+        from app.mod_cmd.commands.docs.get_pages import first_pages
+        if participants is None:
+            participants = list(self.participants)
+        project = instruction.get_value('project')
+        version = None
+        if project is not None:
+            version = app.project_states.update(project)
+
+        groups = {}
+        for participant in participants:
+            base_version = None
+            if project is not None:
+                if participant.delta_sync and app.project_states.has(participant.project_version):
+                    base_version = participant.project_version
+            key = (participant.wire_format, participant.compression, base_version, participant.initial_pages)
+            groups.setdefault(key, []).append(participant)
+
+        responses = []
+        for (wire_format, compression, base_version, initial_pages), group in groups.items():
+            value = instruction.get_value()
+            if project is not None:
+                value = dict(value)
+                columnar = wire_format == 'compact'
+                pages = None
+                if initial_pages is not None and project.active_doc is not None:
+                    pages = first_pages(project.active_doc, initial_pages)
+                delta = None
+                if base_version is not None:
+                    # None when the base version was dropped from history since it was checked.
+                    delta = app.project_states.delta(base_version, version, project, columnar=columnar,
+                                                     active_doc_pages=pages)
+                if delta is None:
+                    value['project'] = project.to_dict(columnar=columnar, active_doc_pages=pages)
+                    value['project_version'] = version
+                else:
+                    del value['project']
+                    value['project_delta'] = delta
+            responses.append((group, ClientInstruction(value).to_json(wire_format, compression), version))
+        return responses
+
+    def broadcast_responses(self, responses):
+        """Broadcasts responses encoded by :func:`encode_responses`, recording the project version
+        sent to each participant. Must be called from the IOLoop's thread.
+        """
+        for participants, message, version in responses:
+            if version is not None:
+                for participant in participants:
+                    participant.project_version = version
+            self.broadcast(participants, message)
 
     def pass_other_stuff(self, project, instruction):
-        # If instructed to pass project, fill in "project" key with serialized ArthurProject object.
+        # If instructed to pass project, fill in "project" key with ArthurProject object,
+        # serialized according to each participant's wire format.
         if instruction.get_value('pass_project'):
-            instruction.set_value('project', project.to_dict())
+            instruction.set_value('project', project)
 
         return (project, instruction)
 
+    def _set_wire_format(self, info):
+        """Takes wire format, compression and initial pages from query arguments of the connection,
+        e.g. `?wire_format=compact&compression=deflate&initial_pages=2`. Unknown values are ignored.
+        """
+        from libs import wire_format as wire
+        wire_format = info.get_argument('wire_format')
+        if wire_format in wire.FORMATS:
+            self.wire_format = wire_format
+        compression = info.get_argument('compression')
+        if compression in wire.COMPRESSIONS:
+            self.compression = compression
+        initial_pages = info.get_argument('initial_pages')
+        if initial_pages is not None and initial_pages.isdigit() and int(initial_pages) > 0:
+            self.initial_pages = int(initial_pages)
+
     def _prepare_session(self, app):
         if not hasattr(app, 'session'):
             # Somehow in bluemix self.info.cookies.get('session') is empty, perhaps
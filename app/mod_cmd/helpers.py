@@ -12,20 +12,20 @@ def get_package(command):
     return package
 
 
-def get_package_module_pairs():
+def get_package_module_pairs(commands_dir='app/mod_cmd/commands'):
     """Iterates over all module/pair inside app/mod_cmd/commands/**/*.py
     """
     sets = []
-    for filepath in glob.iglob('app/mod_cmd/commands/**/*.py'):
+    for filepath in glob.iglob(os.path.join(commands_dir, '**', '*.py')):
         pair = __yield_from_filepath(filepath)
         if pair is not None:
             yield pair
 
-def get_base_package_module_pairs():
+def get_base_package_module_pairs(commands_dir='app/mod_cmd/commands'):
     """Iterates over all module/pair inside app/mod_cmd/commands/*.py
     """
     sets = []
-    for filepath in glob.iglob('app/mod_cmd/commands/*.py'):
+    for filepath in glob.iglob(os.path.join(commands_dir, '*.py')):
         pair = __yield_from_filepath(filepath)
         if pair is not None:
             yield pair
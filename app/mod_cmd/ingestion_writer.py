@@ -0,0 +1,121 @@
+"""
+This module contains IngestionWriter class.
+"""
+import time
+from project_docs import doc_upsert
+
+class IngestionWriter():
+    """Write-behind batching of database writes while loading documents.
+
+    Instead of inserting data fields and saving the project after each document, data fields
+    and document metadata are queued, then flushed in unordered bulk operations once
+    `batch_size` data fields are queued or `flush_interval` seconds have passed since the
+    last flush. Documents are upserted into `docs` collection (see :mod:`project_docs`),
+    so flushing costs the same however many documents the project already has.
+
+    A document is queued together with its data fields, and data fields are written before
+    documents, so a document found in database always has all of its data fields.
+
+    >>> class Collection(object):
+    ...     def __init__(self):
+    ...         self.inserted = []
+    ...     def insert_many(self, documents, ordered=True):
+    ...         self.inserted.append(len(documents))
+    ...     def bulk_write(self, requests, ordered=True):
+    ...         self.inserted.append(len(requests))
+    >>> class Database(object):
+    ...     data_fields = Collection()
+    ...     docs = Collection()
+    >>> db = Database()
+    >>> flushes = []
+    >>> writer = IngestionWriter(db, 'project id', batch_size=3, on_flush=lambda: flushes.append(1))
+    >>> writer.add_document({'name': 'a.pdf'}, [{'text': 'a'}, {'text': 'b'}])
+    >>> db.data_fields.inserted
+    []
+    >>> writer.add_document({'name': 'b.pdf'}, [{'text': 'c'}])
+    >>> db.data_fields.inserted, db.docs.inserted, len(flushes)
+    ([3], [2], 1)
+
+    Remaining writes are flushed when closing:
+    >>> writer.add_data_fields([{'text': 'd'}])
+    >>> writer.close()
+    >>> db.data_fields.inserted
+    [3, 1]
+    >>> writer.total_data_fields
+    4
+
+    Attributes:
+        batch_size: Number of queued data fields that triggers a flush.
+        flush_interval: Seconds after the last flush that trigger a flush. None to only
+                        flush by size.
+        total_data_fields: Number of data fields written so far.
+        total_documents: Number of documents written so far.
+        on_flush: Function called after each flush, e.g. to save a checkpoint. None to not call any.
+    """
+    def __init__(self, db, project_id, batch_size=1000, flush_interval=5, on_flush=None):
+        """Initializes object.
+
+        Args:
+            db: Mongo database to write into.
+            project_id: Id of project documents are loaded into.
+            batch_size(int): See :attr:`batch_size`.
+            flush_interval(float): See :attr:`flush_interval`.
+            on_flush(function): See :attr:`on_flush`.
+        """
+        self.db = db
+        self.project_id = project_id
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.on_flush = on_flush
+        self.total_data_fields = 0
+        self.total_documents = 0
+        self._data_fields = []
+        self._documents = []
+        self._flushed_at = time.time()
+
+    def add_data_fields(self, data_fields):
+        """Queues data fields to insert.
+        """
+        self._data_fields.extend(data_fields)
+        self._flush_if_needed()
+
+    def add_document(self, doc, data_fields=None):
+        """Queues a document's metadata to save into `docs` collection, with its data fields.
+
+        Args:
+            doc: ArthurDocument, or its dict from :func:`ArthurDocument.to_dict`.
+            data_fields: Data fields of the document to insert.
+        """
+        if data_fields:
+            self._data_fields.extend(data_fields)
+        self._documents.append(doc_upsert(self.project_id, doc))
+        self._flush_if_needed()
+
+    def flush(self):
+        """Writes all queued data fields and documents.
+        """
+        if len(self._data_fields) > 0:
+            self.db.data_fields.insert_many(self._data_fields, ordered=False)
+            self.total_data_fields += len(self._data_fields)
+            self._data_fields = []
+        if len(self._documents) > 0:
+            self.db.docs.bulk_write(self._documents, ordered=False)
+            self.total_documents += len(self._documents)
+            self._documents = []
+        self._flushed_at = time.time()
+        if self.on_flush is not None:
+            self.on_flush()
+
+    def close(self):
+        """Flushes remaining writes.
+        """
+        self.flush()
+
+    def _flush_if_needed(self):
+        if len(self._data_fields) >= self.batch_size or \
+           (self.flush_interval is not None and time.time() - self._flushed_at >= self.flush_interval):
+            self.flush()
+
+if __name__ == '__main__':
+    import doctest
+    doctest.testmod()
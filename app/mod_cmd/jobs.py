@@ -0,0 +1,113 @@
+"""
+This module contains handlers of background jobs, run by workers started with `worker.py`.
+
+Long commands (loading a zip file, creating a corpus, clustering) can be submitted as jobs
+with `submit_job` command instead of being run while the client waits. Jobs are kept in
+app.jobs (a :class:`libs.redis_jobs.job_queue.JobQueue`), so their progress can be followed
+with `job_status` even after the client reconnects, and an interrupted job can be resumed
+from its last checkpoint with `resume_job`.
+
+Each handler is passed a :class:`libs.redis_jobs.job_queue.Job` whose params are
+{'args': [...]}, the arguments of the command the job runs.
+"""
+import os
+from multiprocessing import Process
+from app import app, mongo
+from app.helpers import docs_path, uploaded_path, corpus_path, save_project
+from app.mod_cmd.commands.projects.load_project import load_project
+from app.mod_cmd.commands.zip import load_zip
+from app.mod_cmd.commands.learning import cluster
+from libs.arthur.reader import create_corpus
+from libs.redis_jobs.job_queue import JobWorker
+from argparse import ArgumentParser
+from bson import ObjectId
+import config
+
+def run_load_zip(job):
+    """Loads a zip file into a project, see `load_zip` command.
+
+    The number of zip file's members written into database is saved as checkpoint after
+    each write, so a resumed job skips them.
+    """
+    parsed_args = load_zip.parse_args(job.params['args'])
+    project = _load_project(job)
+    start = job.checkpoint.get('members', 0)
+    if start > 0:
+        # Data fields of documents that were not written when the job stopped.
+        ids = [summary['_id'] for summary in project.get_doc_summaries()]
+        doc_ids = ids + [ObjectId(_id) for _id in ids if ObjectId.is_valid(_id)]
+        mongo.db.data_fields.delete_many({'project_id': {'$in': [project._id, str(project._id)]},
+                                          'doc_id': {'$nin': doc_ids}})
+        job.send("Resuming from document %i." % (start+1))
+    frompath = os.path.join(uploaded_path(), parsed_args.name)
+    project, instruction = load_zip.load_zip(project, docs_path(), frompath, keep=parsed_args.keep,
+                                             nuke=parsed_args.nuke and start == 0,
+                                             overwrite_corpus=parsed_args.overwrite_corpus,
+                                             corpus_dir=corpus_path(), connection=job, mongo=mongo,
+                                             start=start,
+                                             on_checkpoint=lambda members: job.save_checkpoint({'members': members}))
+    save_project(project)
+    return instruction.get_value('message')
+
+def parse_create_corpus_args(args):
+    """Parses arguments of `create_corpus` job.
+
+    usage: submit_job create_corpus [--batch_size N] [--overwrite]
+    """
+    parser = ArgumentParser(add_help=False)
+    parser.add_argument('--batch_size', '-b', type=int, default=100)
+    parser.add_argument('--overwrite', '-o', action='store_true')
+    return parser.parse_args(args)
+
+def run_create_corpus(job):
+    """Creates corpus of a project's documents, see :func:`libs.arthur.reader.create_corpus`.
+
+    The index of the next batch is saved as checkpoint after each batch.
+    """
+    parsed_args = parse_create_corpus_args(job.params['args'])
+    _load_project(job)
+    start_batch = job.checkpoint.get('batch', 0)
+    create_corpus(docs_path(), corpus_path(), batch_size=parsed_args.batch_size, start_batch=start_batch,
+                  stdout=job, overwrite=parsed_args.overwrite, processes=config.COMMAND_PROCESSES or None,
+                  on_batch=lambda batch: job.save_checkpoint({'batch': batch}))
+    return "Corpus created."
+
+def run_cluster(job):
+    """Clusters active document of a project, see `cluster` command.
+    """
+    project = _load_project(job)
+    project, instruction = cluster.run(project, job.params['args'], connection=job)
+    return instruction.get_value('message')
+
+# Kinds of jobs, mapped to (function parsing their arguments, handler).
+JOB_KINDS = {
+    'load_zip': (load_zip.parse_args, run_load_zip),
+    'create_corpus': (parse_create_corpus_args, run_create_corpus),
+    'cluster': (lambda args: args, run_cluster)
+}
+
+def run_workers(processes=1):
+    """Runs job workers until interrupted, each in its own process.
+    """
+    workers = [Process(target=_run_worker) for i in range(processes)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+
+def _run_worker():
+    handlers = dict((kind, handler) for kind, (_, handler) in JOB_KINDS.items())
+    JobWorker(app.jobs, handlers).run(stale_after=config.JOB_STALE_AFTER)
+
+def _load_project(job):
+    """Loads the project of a job, as if its user had loaded it.
+
+    Raises:
+        ValueError: When the project no longer exists.
+    """
+    # Helpers (e.g. docs_path) take user and project from session.
+    app.session = {'active_user': job.user, 'active_project': job.project}
+    project, _ = load_project(job.user, job.project)
+    if project is None:
+        raise ValueError("Project %s not found." % job.project)
+    return project
@@ -0,0 +1,82 @@
+"""
+This module contains ProjectCache class.
+"""
+import time
+
+class ProjectCache():
+    """Keeps loaded ArthurProject objects in memory between commands.
+
+    Loading a project means querying users and contexts collections and recreating all
+    of its documents, so instead of loading it for every message received, a loaded project
+    is kept here until it is invalidated or replaced.
+
+    >>> cache = ProjectCache(ttl=60)
+    >>> cache.get('default', 'risky') is None
+    True
+    >>> cache.set('default', 'risky', 'project object')
+    >>> cache.get('default', 'risky')
+    'project object'
+
+    Invalidate a project once it is changed outside of the cached object:
+    >>> cache.invalidate('default', 'risky')
+    >>> cache.get('default', 'risky') is None
+    True
+
+    Or invalidate all projects of a user:
+    >>> cache.set('default', 'risky', 'project object')
+    >>> cache.invalidate('default')
+    >>> len(cache)
+    0
+
+    Attributes:
+        ttl: Seconds a cached project stays valid. None to keep projects until invalidated.
+    """
+    def __init__(self, ttl=None):
+        """Initializes object.
+
+        Args:
+            ttl(int): Seconds a cached project stays valid. Since projects may also be changed
+                      outside of this app, this bounds how stale a cached project can get.
+                      Defaults to None, i.e. keep projects until invalidated.
+        """
+        self.ttl = ttl
+        self._projects = {}
+
+    def __len__(self):
+        return len(self._projects)
+
+    def get(self, username, project_name):
+        """Gets a cached project.
+
+        Returns:
+            ArthurProject: Cached project, or None when not cached or expired.
+        """
+        key = (username, project_name)
+        if key not in self._projects:
+            return None
+        project, cached_at = self._projects[key]
+        if self.ttl is not None and time.time() - cached_at > self.ttl:
+            del self._projects[key]
+            return None
+        return project
+
+    def set(self, username, project_name, project):
+        """Caches a project, replacing the previously cached one.
+        """
+        self._projects[(username, project_name)] = (project, time.time())
+
+    def invalidate(self, username=None, project_name=None):
+        """Removes cached projects.
+
+        Args:
+            username: Only remove projects of this user. When None, remove all projects.
+            project_name: Only remove project with this name.
+        """
+        for key in self._projects.keys():
+            if (username is None or key[0] == username) and \
+               (project_name is None or key[1] == project_name):
+                del self._projects[key]
+
+if __name__ == '__main__':
+    import doctest
+    doctest.testmod()
@@ -0,0 +1,267 @@
+"""
+This module contains functions to keep projects' documents in their own `docs` collection.
+
+Each document of a project is a record keyed by `project_id` and `name`:
+
+    {'_id': ObjectId, 'project_id': ObjectId, 'name': str, 'num_data_fields': int}
+
+Documents used to be kept in `projects.docs` arrays of the users collection, which had to be
+rewritten whole on every save. Run :func:`setup_docs_collection` once on startup to create
+indexes and move existing documents out of those arrays. As that runs after the server started,
+a project loaded before its documents were moved moves them first, see :func:`move_project_docs`.
+
+A loaded project's documents are a :class:`ProjectDocs`, which builds an ArthurDocument
+only for the documents that are used.
+"""
+from collections import MutableSequence
+from bson import ObjectId
+from pymongo import ASCENDING, UpdateOne
+from pymongo.errors import BulkWriteError
+
+def doc_record(project_id, doc):
+    """Returns a document as it is stored in `docs` collection.
+
+    >>> doc = {'_id': '5734b2a3e1382310cc5e0e31', 'name': 'a.pdf', 'num_data_fields': 0}
+    >>> record = doc_record('project id', doc)
+    >>> sorted(record.items())
+    [('_id', ObjectId('5734b2a3e1382310cc5e0e31')), ('name', 'a.pdf'), ('num_data_fields', 0), ('project_id', 'project id')]
+
+    Args:
+        project_id: Id of project owning the document.
+        doc: ArthurDocument, or its dict from :func:`ArthurDocument.to_dict`.
+    """
+    if not isinstance(doc, dict):
+        doc = doc.to_dict(raw=False, with_details=False)
+    record = dict(doc)
+    record['project_id'] = project_id
+    if ObjectId.is_valid(record.get('_id')):
+        record['_id'] = ObjectId(record['_id'])
+    else:
+        record.pop('_id', None)
+    return record
+
+def doc_upsert(project_id, doc):
+    """Returns an upsert of a document into `docs` collection, to pass to `bulk_write`.
+
+    Args:
+        project_id: Id of project owning the document.
+        doc: ArthurDocument, or its dict from :func:`ArthurDocument.to_dict`.
+    """
+    return UpdateOne(*_upsert_spec(project_id, doc), upsert=True)
+
+def save_doc(db, project_id, doc):
+    """Inserts or updates a single document of a project.
+    """
+    db.docs.update_one(*_upsert_spec(project_id, doc), upsert=True)
+
+def _upsert_spec(project_id, doc):
+    """Returns (filter, update) pair upserting a document.
+    """
+    record = doc_record(project_id, doc)
+    update = {}
+    if '_id' in record:
+        # _id of an existing record can't be changed.
+        update['$setOnInsert'] = {'_id': record.pop('_id')}
+    update['$set'] = record
+    return ({'project_id': project_id, 'name': record['name']}, update)
+
+def find_doc(db, project_id, name):
+    """Finds a document of a project by its name.
+
+    Returns:
+        dict: Document record, or None when not found.
+    """
+    return db.docs.find_one({'project_id': project_id, 'name': name})
+
+def find_docs(db, project_id, names=None, page=None, per_page=100):
+    """Lists documents of a project, sorted by name.
+
+    Args:
+        db: Mongo database.
+        project_id: Id of project.
+        names: Only list documents with these names.
+        page(int): Page to list, starting from 1. When None, list all documents.
+        per_page(int): Number of documents per page.
+
+    Returns:
+        Cursor: Cursor of document records.
+    """
+    query = {'project_id': project_id}
+    if names is not None:
+        query['name'] = {'$in': list(names)}
+    cursor = db.docs.find(query).sort('name', ASCENDING)
+    if page is not None:
+        cursor = cursor.skip((page-1) * per_page).limit(per_page)
+    return cursor
+
+def doc_summary(record):
+    """Returns summary of a document record, the same as `to_dict(raw=False, with_details=False)`
+    of an ArthurDocument created from the record, without creating one.
+
+    >>> record = {'_id': ObjectId('5734b2a3e1382310cc5e0e31'), 'project_id': ObjectId('5734b2a3e1382310cc5e0e32'),
+    ...           'name': 'a.pdf', 'num_data_fields': 3}
+    >>> sorted(doc_summary(record).items())
+    [('_id', '5734b2a3e1382310cc5e0e31'), ('name', 'a.pdf'), ('num_data_fields', 3), ('project_id', '5734b2a3e1382310cc5e0e32')]
+    """
+    summary = dict(record)
+    summary['_id'] = str(record.get('_id'))
+    summary['name'] = record.get('name')
+    summary['num_data_fields'] = record.get('num_data_fields', 0)
+    if 'project_id' in summary:
+        summary['project_id'] = str(summary['project_id'])
+    return summary
+
+class ProjectDocs(MutableSequence):
+    """Documents of a project, loaded from `docs` collection on first use.
+
+    Records are kept as they are, and an ArthurDocument is created from a record only when
+    the document is accessed. Listing documents with :func:`summaries` does not create any,
+    so loading a project with many documents stays cheap.
+
+    >>> class Docs(object):
+    ...     def find(self, query):
+    ...         return Cursor([{'_id': ObjectId('5734b2a3e1382310cc5e0e3%i' % i), 'name': 'doc%i.pdf' % i,
+    ...                         'project_id': query['project_id'], 'num_data_fields': i} for i in range(3)])
+    >>> class Cursor(list):
+    ...     def sort(self, key, direction):
+    ...         return self
+    >>> class Database(object):
+    ...     docs = Docs()
+    >>> class Document(object):
+    ...     def __init__(self, **record):
+    ...         self.name = record['name']
+    ...     def to_dict(self, raw=False, with_details=False):
+    ...         return {'name': self.name}
+    >>> docs = ProjectDocs(Database(), 'project id', Document)
+    >>> [summary['name'] for summary in docs.summaries()]
+    ['doc0.pdf', 'doc1.pdf', 'doc2.pdf']
+    >>> docs.num_created
+    0
+    >>> docs[1].name, docs.num_created
+    ('doc1.pdf', 1)
+    >>> docs.append(Document(name='new.pdf'))
+    >>> len(docs), [summary['name'] for summary in docs.summaries()][-1]
+    (4, 'new.pdf')
+    >>> del docs[:]
+    >>> len(docs)
+    0
+
+    Attributes:
+        num_created: Number of documents created from records, for monitoring.
+    """
+    def __init__(self, db, project_id, document_class):
+        """Initializes object.
+
+        Args:
+            db: Mongo database.
+            project_id: Id of project.
+            document_class: Class of documents, called with a record's fields as keyword
+                            arguments (i.e. ArthurDocument).
+        """
+        self.num_created = 0
+        self._db = db
+        self._project_id = project_id
+        self._document_class = document_class
+        self._items = None
+
+    def summaries(self):
+        """Gets summaries of all documents, see :func:`doc_summary`, without creating documents.
+
+        Returns:
+            list: List of dicts.
+        """
+        return [doc_summary(item) if isinstance(item, dict) else item.to_dict(raw=False, with_details=False)
+                for item in self._get_items()]
+
+    def __len__(self):
+        return len(self._get_items())
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        items = self._get_items()
+        if isinstance(items[index], dict):
+            items[index] = self._document_class(**items[index])
+            self.num_created += 1
+        return items[index]
+
+    def __setitem__(self, index, document):
+        self._get_items()[index] = document
+
+    def __delitem__(self, index):
+        del self._get_items()[index]
+
+    def insert(self, index, document):
+        self._get_items().insert(index, document)
+
+    def _get_items(self):
+        if self._items is None:
+            self._items = list(find_docs(self._db, self._project_id))
+        return self._items
+
+def delete_docs(db, project_id):
+    """Deletes all documents of a project.
+    """
+    db.docs.delete_many({'project_id': project_id})
+
+def setup_docs_collection(db):
+    """Creates indexes of `docs` collection and moves documents of all projects into it.
+    Also indexes `data_fields` collection by document and page, for `get_pages` command.
+
+    Moving is idempotent: documents are upserted by project id and name, and each
+    project's `docs` array is removed once its documents are moved.
+
+    Returns:
+        int: Number of moved documents.
+    """
+    db.docs.create_index([('project_id', ASCENDING), ('name', ASCENDING)], unique=True)
+    db.data_fields.create_index([('doc_id', ASCENDING), ('page', ASCENDING)])
+    moved = 0
+    for user in db.users.find({'projects.docs': {'$exists': True}}, ['projects._id', 'projects.docs']):
+        for project in user.get('projects', []):
+            moved += move_project_docs(db, user['_id'], project)
+    return moved
+
+def move_project_docs(db, user_id, project):
+    """Moves documents still kept inside a project's `docs` array into `docs` collection.
+
+    >>> class Collection(object):
+    ...     def __init__(self):
+    ...         self.calls = []
+    ...     def bulk_write(self, ops, ordered=True):
+    ...         self.calls.append(len(ops))
+    ...     def update_one(self, query, update):
+    ...         self.calls.append(update)
+    >>> class Database(object):
+    ...     docs, users = Collection(), Collection()
+    >>> db = Database()
+    >>> project = {'_id': 'project id', 'docs': [{'name': 'a.pdf'}, {'name': 'b.pdf'}]}
+    >>> move_project_docs(db, 'user id', project), db.docs.calls, db.users.calls
+    (2, [2], [{'$unset': {'projects.$.docs': ''}}])
+    >>> move_project_docs(db, 'user id', {'_id': 'project id'})
+    0
+
+    Args:
+        db: Mongo database.
+        user_id: Id of user owning the project.
+        project: Project record, as in `projects` array of the user.
+
+    Returns:
+        int: Number of moved documents.
+    """
+    if 'docs' not in project:
+        return 0
+    ops = [doc_upsert(project['_id'], doc) for doc in project['docs']]
+    if len(ops) > 0:
+        try:
+            db.docs.bulk_write(ops, ordered=False)
+        except BulkWriteError:
+            # Moved at the same time by setup_docs_collection, upserts now update what it inserted.
+            db.docs.bulk_write(ops, ordered=False)
+    db.users.update_one({'_id': user_id, 'projects._id': project['_id']},
+                        {'$unset': {'projects.$.docs': ''}})
+    return len(ops)
+
+if __name__ == '__main__':
+    import doctest
+    doctest.testmod()
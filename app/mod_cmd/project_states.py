@@ -0,0 +1,152 @@
+"""
+This module contains ProjectStates class.
+"""
+import threading
+from collections import OrderedDict
+from itertools import count
+
+class ProjectStates():
+    """Versions of projects sent to clients, so that only what changed since a version is sent.
+
+    Each time a project is sent, its state (name, summaries of its documents and revision of
+    its active document) is recorded under a new version, unless nothing changed since the
+    project was last sent. A client that has a version gets a delta from that version instead
+    of the whole project, see :func:`delta`.
+
+    >>> class Doc(object):
+    ...     def __init__(self, _id, name):
+    ...         self._id, self.name, self.revision = _id, name, 0
+    ...     def to_dict(self, raw=False, with_details=False, columnar=False, pages=None):
+    ...         obj = {'_id': self._id, 'name': self.name}
+    ...         if with_details:
+    ...             obj['elements'] = ['...']
+    ...         return obj
+    >>> class Project(object):
+    ...     def __init__(self, name, docs):
+    ...         self._id, self.name, self.docs, self.active_doc = None, name, docs, None
+    ...     def get_doc_summaries(self):
+    ...         return [doc.to_dict() for doc in self.docs]
+    >>> states = ProjectStates()
+    >>> a, b = Doc('1', 'a.pdf'), Doc('2', 'b.pdf')
+    >>> project = Project('risky', [a, b])
+    >>> v1 = states.update(project)
+    >>> states.update(project) == v1
+    True
+
+    After a document is renamed and another one loaded, only they are sent:
+    >>> a.name = 'c.pdf'
+    >>> project.active_doc = b
+    >>> v2 = states.update(project)
+    >>> delta = states.delta(v1, v2, project)
+    >>> sorted(delta.keys())
+    ['active_doc', 'base_version', 'docs', 'version']
+    >>> delta['docs'], delta['active_doc']['elements']
+    ([{'_id': '1', 'name': 'c.pdf'}], ['...'])
+
+    Removed documents are dropped from the list of document ids:
+    >>> project.docs = [b]
+    >>> v3 = states.update(project)
+    >>> delta = states.delta(v2, v3, project)
+    >>> delta['doc_ids'], 'active_doc' in delta
+    (['2'], False)
+
+    Versions older than the history can't be used as base:
+    >>> states = ProjectStates(history=1)
+    >>> v1 = states.update(project)
+    >>> project.name = 'risky2'
+    >>> v2 = states.update(project)
+    >>> states.has(v1), states.has(v2)
+    (False, True)
+    >>> states.delta(v1, v2, project) is None
+    True
+
+    Attributes:
+        history: Number of versions kept, of all projects.
+    """
+    def __init__(self, history=64):
+        """Initializes object.
+
+        Args:
+            history(int): See :attr:`history`.
+        """
+        self.history = history
+        self._states = OrderedDict()
+        self._latest = {}
+        self._versions = count(1)
+        self._lock = threading.Lock()
+
+    def update(self, project):
+        """Records current state of a project.
+
+        Returns:
+            int: Version of the state, the same as last time when nothing changed since then.
+                 Versions are unique across projects.
+        """
+        key = project._id if project._id is not None else project.name
+        state = self._get_state(project)
+        with self._lock:
+            version = self._latest.get(key)
+            if version not in self._states or self._states[version] != state:
+                version = next(self._versions)
+                self._states[version] = state
+                self._latest[key] = version
+                while len(self._states) > self.history:
+                    self._states.popitem(last=False)
+            return version
+
+    def has(self, version):
+        """Whether a version is known, i.e. a delta from it can be made.
+        """
+        return version in self._states
+
+    def delta(self, base_version, version, project, columnar=False, active_doc_pages=None):
+        """Gets what changed in a project from one version to another.
+
+        Args:
+            base_version(int): Version the client has.
+            version(int): Current version of project, as returned by :func:`update`.
+            project(ArthurProject): The project.
+            columnar(bool): Serialize elements of active document as one array per feature,
+                            see :func:`ArthurDocument.to_dict`.
+            active_doc_pages(list|None): Only include elements of these pages of active document.
+
+        Returns:
+            dict|None: 'base_version' and 'version', and only the keys that changed of:
+                  'name': name of project, 'docs': list of summaries of changed or added
+                  documents, 'doc_ids': ids of all documents in order, to drop removed ones,
+                  'active_doc': the whole active document or None.
+                  None when either version has been dropped from history meanwhile, e.g. by
+                  another thread's :func:`update`, send the whole project instead.
+        """
+        with self._lock:
+            base = self._states.get(base_version)
+            state = self._states.get(version)
+        if base is None or state is None:
+            return None
+        delta = {'base_version': base_version, 'version': version}
+        if base['name'] != state['name']:
+            delta['name'] = state['name']
+        base_docs = dict(base['docs'])
+        docs = [summary for _id, summary in state['docs'] if base_docs.get(_id) != summary]
+        if len(docs) > 0:
+            delta['docs'] = docs
+        doc_ids = [_id for _id, _ in state['docs']]
+        if doc_ids != [_id for _id, _ in base['docs']]:
+            delta['doc_ids'] = doc_ids
+        if base['active_doc'] != state['active_doc']:
+            delta['active_doc'] = None
+            if project.active_doc is not None:
+                delta['active_doc'] = project.active_doc.to_dict(raw=False, with_details=True, columnar=columnar,
+                                                                 pages=active_doc_pages)
+        return delta
+
+    def _get_state(self, project):
+        docs = [(summary['_id'], summary) for summary in project.get_doc_summaries()]
+        active_doc = None
+        if project.active_doc is not None:
+            active_doc = (project.active_doc.revision, project.active_doc.to_dict(raw=False, with_details=False))
+        return {'name': project.name, 'docs': docs, 'active_doc': active_doc}
+
+if __name__ == '__main__':
+    import doctest
+    doctest.testmod()
@@ -0,0 +1,29 @@
+"""
+MongoClient used by the application.
+"""
+from pymongo import mongo_client
+from pymongo import database
+from pymongo.database import Database
+import config
+
+
+class MongoClient(mongo_client.MongoClient):
+    """Replace 'db' with config.MONGO_DBNAME to make this similar to Flask-PyMongo
+    """
+
+    def __getattr__(self, name):
+        if name == 'db':
+            name = config.MONGO_DBNAME
+        attr = super(MongoClient, self).__getattr__(name)
+        if isinstance(attr, database.Database):
+            return Database(self, name)
+        return attr
+
+    def __getitem__(self, item):
+        if item == 'db':
+            item = config.MONGO_DBNAME
+        attr = super(MongoClient, self).__getitem__(item)
+        if isinstance(attr, database.Database):
+            return Database(self, item)
+        return attr
+
@@ -52,16 +52,66 @@ REDIS_HOST = os.getenv('ARTHUR_REDIS_HOST', '192.168.99.100')
 REDIS_PORT = os.getenv('ARTHUR_REDIS_PORT', 6379)
 REDIS_PASSWORD = os.getenv('ARTHUR_REDIS_PASSWORD', '')
 
+# Seconds a loaded project is kept in memory between commands. Projects are also
+# refreshed whenever they are saved by this app.
+PROJECT_CACHE_TTL = int(os.getenv('ARTHUR_PROJECT_CACHE_TTL', 300))
+
+# Loading documents from a zip file queues database writes, and flushes them in bulk
+# once this many data fields are queued or this many seconds have passed.
+INGEST_BATCH_SIZE = int(os.getenv('ARTHUR_INGEST_BATCH_SIZE', 1000))
+INGEST_FLUSH_INTERVAL = float(os.getenv('ARTHUR_INGEST_FLUSH_INTERVAL', 5))
+
+# Commands run in this many threads instead of on the IOLoop, so a long command does not
+# block other clients. CPU-heavy work (e.g. parsing pdfs) runs in this many processes,
+# 0 to run it in the command's thread instead.
+COMMAND_THREADS = int(os.getenv('ARTHUR_COMMAND_THREADS', 4))
+COMMAND_PROCESSES = int(os.getenv('ARTHUR_COMMAND_PROCESSES', 2))
+
+# Number of processes started by worker.py to run background jobs (see `submit_job` command),
+# and seconds after which a job whose worker stopped responding is queued again.
+JOB_WORKERS = int(os.getenv('ARTHUR_JOB_WORKERS', 2))
+JOB_STALE_AFTER = int(os.getenv('ARTHUR_JOB_STALE_AFTER', 10*60))
+
+# Set to 1 while developing commands, to import changed command files again without restarting.
+COMMANDS_RELOAD = os.getenv('ARTHUR_COMMANDS_RELOAD', '0') == '1'
+
+# Number of documents listed per page by `list_docs --page`.
+DOCS_PER_PAGE = int(os.getenv('ARTHUR_DOCS_PER_PAGE', 100))
+
+# Pages of a document sent by `get_pages` before and after the requested ones, so they are
+# ready when the client scrolls on, and the most pages sent at once.
+DOC_PREFETCH_PAGES = int(os.getenv('ARTHUR_DOC_PREFETCH_PAGES', 1))
+DOC_MAX_PAGES = int(os.getenv('ARTHUR_DOC_MAX_PAGES', 20))
+
 # Filesystem settings
 
 # temporary directory where we keep documents from AWS.
 TMP_DIR = os.getenv('ARTHUR_TMP_DIR', 'tmp')
 
+# maximum total size in bytes of files kept in TMP_DIR, least recently used files are removed beyond it.
+TMP_DIR_MAX_SIZE = int(os.getenv('ARTHUR_TMP_DIR_MAX_SIZE', 1024*1024*1024))
+
+# seconds a file in TMP_DIR may stay unused before it is removed.
+TMP_DIR_MAX_AGE = int(os.getenv('ARTHUR_TMP_DIR_MAX_AGE', 7*24*60*60))
+
+# directory where parsed documents are cached, keyed by hash of their content.
+PARSE_CACHE_DIR = os.getenv('ARTHUR_PARSE_CACHE_DIR', os.path.join(TMP_DIR, 'parse_cache'))
+
+# maximum total size in bytes of parsed documents cached, least recently loaded ones are removed beyond it.
+# It is not counted in TMP_DIR_MAX_SIZE, even when PARSE_CACHE_DIR is inside TMP_DIR.
+PARSE_CACHE_MAX_SIZE = int(os.getenv('ARTHUR_PARSE_CACHE_MAX_SIZE', 2*1024*1024*1024))
+
+# seconds a parsed document may stay unloaded before it is removed from cache.
+PARSE_CACHE_MAX_AGE = int(os.getenv('ARTHUR_PARSE_CACHE_MAX_AGE', 30*24*60*60))
+
 # None or 'aws-s3'
 FILESYSTEM = os.getenv('ARTHUR_FILESYSTEM', 'aws-s3')
 AWS_BUCKET = os.getenv('ARTHUR_AWS_BUCKET', 'arthur-storage')
 AWS_ROOTDIR = os.getenv('ARTHUR_AWS_ROOTDIR', 'workspace')
 
+# endpoint of an S3 compatible server (e.g. a local minio) to use instead of Amazon S3.
+AWS_ENDPOINT_URL = os.getenv('ARTHUR_AWS_ENDPOINT_URL', None)
+
 # Set the rest of settings through environment variables. See:
 # https://boto3.readthedocs.org/en/latest/guide/configuration.html
 # Note: prefix ARTHUR_ is thus NOT needed here.
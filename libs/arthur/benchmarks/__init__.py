@@ -0,0 +1,83 @@
+"""
+Benchmarks of Arthur library. Run each module directly, e.g.
+
+```
+python libs/arthur/benchmarks/get_text.py
+```
+"""
+import os, inspect
+from timeit import default_timer
+
+# base_path points to arthur library's directory.
+base_path = os.path.realpath(
+    os.path.abspath(
+        os.path.join(
+            os.path.split(
+                inspect.getfile(
+                    inspect.currentframe()
+                )
+            )[0],
+            '..'
+        )
+    )
+)
+
+def load_many_pages(pdf_path=None, copies=20):
+    """Creates a many-page ArthurDocument.
+
+    When no pdf_path is given, pages of the test pdf are repeated `copies` times,
+    stitched below each other the same way ArthurPDFConverter stitches pages.
+
+    Args:
+        pdf_path(str): Path to a pdf document. If given, it is loaded as is.
+        copies(int): Number of times the test pdf is repeated.
+
+    Returns:
+        ArthurDocument: The loaded document.
+    """
+    from document import ArthurDocument, ArthurDocumentElement, ArthurDocumentPageInfo
+    if pdf_path is not None:
+        with open(pdf_path, 'rb') as f:
+            return ArthurDocument(f.read(), doctype='pdf', name=os.path.basename(pdf_path))
+
+    with open(os.path.join(base_path, 'test', 'test.pdf'), 'rb') as f:
+        source = ArthurDocument(f.read(), doctype='pdf', name='test.pdf')
+    num_pages = len(source._page_infos)
+    total_height = sum([p.height for p in source._page_infos])
+    elements = [source._elements[i] for i in xrange(len(source._elements))]
+
+    document = ArthurDocument(name='many_pages.pdf')
+    for copy in xrange(copies):
+        for page_info in source._page_infos:
+            document.write_page_info(ArthurDocumentPageInfo(number=page_info.number + copy*num_pages,
+                                                            width=page_info.width, height=page_info.height))
+        for element in elements:
+            features = element.features.copy()
+            features['page'] += copy*num_pages
+            features['y'] += copy*total_height
+            features['y1'] += copy*total_height
+            document.write(ArthurDocumentElement(element.text, features))
+    return document
+
+class Timer(object):
+    """Context manager that measures elapsed seconds.
+
+    >>> with Timer() as t:
+    ...     pass
+    >>> t.elapsed >= 0
+    True
+    """
+    def __enter__(self):
+        self.start = default_timer()
+        return self
+
+    def __exit__(self, *args):
+        self.elapsed = default_timer() - self.start
+
+def report(name, elapsed, baseline=None):
+    """Prints a single line of benchmark result.
+    """
+    line = "%-40s %10.4fs" % (name, elapsed)
+    if baseline is not None and elapsed > 0:
+        line += "  (%.1fx)" % (baseline / elapsed)
+    print(line)
@@ -0,0 +1,73 @@
+"""Micro-benchmark of grouping document features into textboxes on a dense multi-page document.
+
+Compares the single-pass grouping of :func:`reader.__extract_textboxes` with the previous
+implementation, which masked all features once per (page, textbox_id) pair.
+
+usage: python extract_textboxes.py [pdf_path] [copies]
+"""
+if __name__ == '__main__':
+    import os, sys, inspect
+    sys.path.append(os.path.realpath(
+        os.path.abspath(
+            os.path.join(
+                os.path.split(
+                    inspect.getfile(
+                        inspect.currentframe()
+                    )
+                )[0],
+                '..'
+            )
+        )
+    ))
+
+import numpy as np
+from document import ArthurDocument
+from helpers import unique_rows
+from reader import __extract_textboxes as extract_textboxes
+from benchmarks import load_many_pages, Timer, report
+
+def masked_extract_textboxes(document):
+    """Previous implementation of :func:`reader.__extract_textboxes`, kept for comparison.
+    """
+    features = document.get_features()
+    page_feature_id = ArthurDocument.get_feature_id('page')
+    textbox_feature_id = ArthurDocument.get_feature_id('textbox_id')
+
+    page_textbox_pairs = features[:, [page_feature_id, textbox_feature_id]]
+    unique_page_textbox_pairs = unique_rows(page_textbox_pairs)
+    textboxes = []
+    for page, textbox_id in unique_page_textbox_pairs:
+        textbox = features[np.where(
+            (features[:, page_feature_id]==page) *
+            (features[:, textbox_feature_id]==textbox_id)
+        )]
+        textboxes.append(textbox)
+    return textboxes
+
+def main(pdf_path=None, copies=20, repeat=5):
+    document = load_many_pages(pdf_path, copies)
+    print("%i pages, %i elements" % (len(document._page_infos), len(document.get_features())))
+
+    with Timer() as t:
+        for _ in xrange(repeat):
+            masked = masked_extract_textboxes(document)
+    report('extract textboxes (mask per pair)', t.elapsed / repeat)
+    baseline = t.elapsed / repeat
+
+    with Timer() as t:
+        for _ in xrange(repeat):
+            grouped = extract_textboxes(document)
+    report('extract textboxes (sort and split)', t.elapsed / repeat, baseline)
+
+    assert len(masked) == len(grouped) and \
+        all(np.array_equal(a, b) for a, b in zip(masked, grouped)), \
+        "Grouped textboxes differ from masked textboxes"
+
+if __name__ == '__main__':
+    pdf_path = None
+    copies = 20
+    if len(sys.argv) > 1 and sys.argv[1] != '-':
+        pdf_path = sys.argv[1]
+    if len(sys.argv) > 2:
+        copies = int(sys.argv[2])
+    main(pdf_path, copies)
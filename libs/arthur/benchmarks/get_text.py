@@ -0,0 +1,75 @@
+"""Benchmark of :func:`ArthurDocument.get_text` on a many-page document.
+
+Compares indexed text reconstruction with the previous implementation, which scanned
+the whole document for every feature.
+
+usage: python get_text.py [pdf_path] [copies]
+"""
+if __name__ == '__main__':
+    import os, sys, inspect
+    sys.path.append(os.path.realpath(
+        os.path.abspath(
+            os.path.join(
+                os.path.split(
+                    inspect.getfile(
+                        inspect.currentframe()
+                    )
+                )[0],
+                '..'
+            )
+        )
+    ))
+
+import numpy as np
+from document import ArthurDocument
+from reader import __extract_textboxes as extract_textboxes
+from benchmarks import load_many_pages, Timer, report
+
+def scan_get_text(document, features):
+    """Previous implementation of :func:`ArthurDocument.get_text`, kept for comparison.
+    """
+    data = document.get_features(with_id=True)
+    fx = ArthurDocument.get_feature_id('x')
+    fy = ArthurDocument.get_feature_id('y')
+    fpage = ArthurDocument.get_feature_id('page')
+    text = ''
+    last_y = None
+    for f in features:
+        rows = data[np.where(
+            (data[:,fx+1] == f[fx]) *
+            (data[:,fy+1] == f[fy]) *
+            (data[:,fpage+1] == f[fpage])
+        )]
+        for r in rows:
+            y = r[fy+1]
+            if last_y != y and last_y is not None:
+                text += ' '
+            last_y = y
+            text += document._elements.get_text(int(r[0]))
+    return text
+
+def main(pdf_path=None, copies=20):
+    document = load_many_pages(pdf_path, copies)
+    textboxes = extract_textboxes(document)
+    print("%i pages, %i elements, %i textboxes" %
+          (len(document._page_infos), len(document.get_features()), len(textboxes)))
+
+    with Timer() as t:
+        scanned = [scan_get_text(document, textbox) for textbox in textboxes]
+    report('get_text (full scan)', t.elapsed)
+    baseline = t.elapsed
+
+    with Timer() as t:
+        indexed = [document.get_text(textbox) for textbox in textboxes]
+    report('get_text (position index)', t.elapsed, baseline)
+
+    assert scanned == indexed, "Indexed text differs from scanned text"
+
+if __name__ == '__main__':
+    pdf_path = None
+    copies = 20
+    if len(sys.argv) > 1 and sys.argv[1] != '-':
+        pdf_path = sys.argv[1]
+    if len(sys.argv) > 2:
+        copies = int(sys.argv[2])
+    main(pdf_path, copies)
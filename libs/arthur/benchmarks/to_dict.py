@@ -0,0 +1,58 @@
+"""Benchmark of encoding a document the way `load_doc` sends it to the client.
+
+Compares payload size and encode time of plain json (a dict per element) with the compact
+wire format (typed arrays per feature) of :mod:`libs.wire_format`, with and without deflate.
+
+usage: python to_dict.py [pdf_path] [copies]
+"""
+if __name__ == '__main__':
+    import os, sys, inspect
+    arthur_path = os.path.realpath(
+        os.path.abspath(
+            os.path.join(
+                os.path.split(
+                    inspect.getfile(
+                        inspect.currentframe()
+                    )
+                )[0],
+                '..'
+            )
+        )
+    )
+    sys.path.append(arthur_path)
+    # For libs.wire_format.
+    sys.path.append(os.path.join(arthur_path, '..', '..'))
+
+import json
+from project import ArthurProject
+from libs import wire_format as wire
+from benchmarks import load_many_pages, Timer, report
+
+def main(pdf_path=None, copies=20):
+    document = load_many_pages(pdf_path, copies)
+    project = ArthurProject(name='benchmark', active_doc=document, docs=[document])
+    print("%i pages, %i elements" % (len(document._page_infos), len(document.get_features())))
+
+    with Timer() as t:
+        message = json.dumps({'project': project.to_dict()})
+    report('json (%.1f MB)' % (len(message) / 1e6), t.elapsed)
+    baseline = t.elapsed
+
+    for wire_format, compression in [('compact', None), ('compact', 'deflate')]:
+        with Timer() as t:
+            compact = wire.dumps({'project': project}, wire_format, compression)
+        name = wire_format if compression is None else "%s+%s" % (wire_format, compression)
+        report('%s (%.1f MB, %.1f%%)' % (name, len(compact) / 1e6, 100. * len(compact) / len(message)),
+               t.elapsed, baseline)
+
+    elements = wire.loads(compact)['project']['active_doc']['elements']
+    assert elements['count'] == len(document.get_features()), "Compact message lost elements"
+
+if __name__ == '__main__':
+    pdf_path = None
+    copies = 20
+    if len(sys.argv) > 1 and sys.argv[1] != '-':
+        pdf_path = sys.argv[1]
+    if len(sys.argv) > 2:
+        copies = int(sys.argv[2])
+    main(pdf_path, copies)
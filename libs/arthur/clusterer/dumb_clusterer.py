@@ -25,27 +25,34 @@ sys.path.append(base_path)
 # from nltk.collocations import BigramAssocMeasures, TrigramAssocMeasures, BigramCollocationFinder, TrigramCollocationFinder
 # from nltk import word_tokenize
 # from nltk.tokenize import MWETokenizer
-import string
 import numpy as np
 from document import ArthurDocument
+from mwe_matcher import MWEMatcher
+from collocations import CollocationStore
 
 # Todo: Change to more robust algorithm
 class DumbClusterer():
     """A rather dumb clusterer. 
     """
     def __init__(self, corpus_dir=None, mwes=[], setup_mwes=True, **kwargs):
-        self.mwes = mwes
+        self.mwes = list(mwes)
+        self.corpus = None
+        self.corpus_dir = corpus_dir
+        self._matcher = None
+        self._matcher_key = None
         if corpus_dir is not None:
-            self.setup_corpus(corpus_dir, '.*')
+            self.setup_corpus(corpus_dir)
             if setup_mwes:
                 self.setup_mwes(**kwargs)
 
-    def setup_corpus(self, corpus_dir, paths='.*'):
+    def setup_corpus(self, corpus_dir, paths=r'.*\.txt'):
         """Setting up a corpus.
 
         Args:
             corpus_dir(str): Path to corpus directory.
+            paths(str): Regex of corpus files, relative to corpus directory.
         """
+        self.corpus_dir = corpus_dir
         self.corpus = PlaintextCorpusReader(corpus_dir, paths)
         return self.corpus
 
@@ -79,6 +86,18 @@ class DumbClusterer():
         >>> expr_width == ftr_width
         True
 
+        Text has a space at each line break, which no feature stands for, so the last
+        expressions of a textbox with several lines keep their whole text:
+        >>> from document import ArthurDocumentElement
+        >>> lines = ArthurDocument()
+        >>> for i, char in enumerate('abcd'):
+        ...     lines.write(ArthurDocumentElement(char, {'x': float(i % 2), 'x1': float(i % 2) + 1.,
+        ...                                              'y': float(i // 2), 'y1': float(i // 2) + 1.}))
+        >>> print(lines.get_text(lines.get_features()))
+        ab cd
+        >>> [expression['text'] for expression in DumbClusterer().extract_expressions(lines)]
+        ['ab', 'cd']
+
         Args:
             document(ArthurDocument): Document to extract data fields from.
             features(list): List of features containing data fields to extract. If not given, use
@@ -89,51 +108,69 @@ class DumbClusterer():
         Returns:
             np.array: An array of data_fields.
         """
-        mwes = self.mwes
         if features is None:
             features = document.get_features()
         text = document.get_text(features)
-        for idx, mwe in enumerate(mwes):
-            if isinstance(mwe, str):
-                mwes[idx] = word_tokenize(mwe.lower())
-            elif hasattr(mwe, '__iter__'):
-                mwes[idx] = [x.lower() for x in mwe]
-        tokenizer = MWETokenizer(mwes, separator=' ')
-        tokenized = tokenizer.tokenize(word_tokenize(text.lower()))
+        starts, ends = self.get_matcher().match(text)
+
+        # Bounding boxes of all expressions at once. Reductions are done over a padded
+        # array, so that expressions ending at the last feature still have a valid end index.
+        # Text is longer than features when it has line breaks, only feature indices are clamped.
+        columns = [ArthurDocument.get_feature_id(name) for name in ('x', 'x1', 'y', 'y1', 'page')]
+        size = len(features)
+        text_starts, text_ends = starts, ends
+        starts = np.minimum(starts, size)
+        ends = np.minimum(ends, size)
+        nonempty = ends > starts
+        boxes = np.zeros([len(starts), len(columns)])
+        if size > 0 and len(starts) > 0:
+            padded = np.vstack([features[:, columns], np.zeros([1, len(columns)])])
+            # Interleaving start and end indices makes every even segment an expression.
+            indices = np.empty(len(starts)*2, dtype=int)
+            indices[0::2] = starts
+            indices[1::2] = ends
+            boxes[:, 0] = np.minimum.reduceat(padded[:, 0], indices)[0::2]
+            boxes[:, 1] = np.maximum.reduceat(padded[:, 1], indices)[0::2]
+            boxes[:, 2] = np.minimum.reduceat(padded[:, 2], indices)[0::2]
+            boxes[:, 3] = np.maximum.reduceat(padded[:, 3], indices)[0::2]
+            boxes[:, 4] = padded[starts, 4]
+            boxes[~nonempty] = 0
 
         expressions = []
-        pos = 0
-        for token in tokenized:
-            # token could be "deez nutz" but text contains multiple spaces e.g. "deez  nutz",
-            # so we need to split the token and find position of first and last characters.
-            words = token.split()
-            start_pos = text.lower().index(words[0], pos)
-            for word in words:
-                ipos = text.lower().index(word, pos)
-                end_pos = ipos + len(word)
-            pos = end_pos
-            min_x = 0
-            max_x = 0
-            min_y = 0
-            max_y = 0
-            page = 0
-            if len(features[start_pos:end_pos,:] > 0):
-                min_x =  np.amin(features[start_pos:end_pos,:], axis=0)[ArthurDocument.get_feature_id('x')]
-                max_x =  np.amax(features[start_pos:end_pos,:], axis=0)[ArthurDocument.get_feature_id('x1')]
-                min_y =  np.amin(features[start_pos:end_pos,:], axis=0)[ArthurDocument.get_feature_id('y')]
-                max_y =  np.amax(features[start_pos:end_pos,:], axis=0)[ArthurDocument.get_feature_id('y1')]
-                page = features[start_pos, ArthurDocument.get_feature_id('page')]
-
+        for start_pos, end_pos, box in zip(np.asarray(text_starts).tolist(), np.asarray(text_ends).tolist(),
+                                           boxes.tolist()):
             expressions.append({
                 'text': text[start_pos:end_pos],
-                'x': min_x,
-                'x1': max_x,
-                'y': min_y,
-                'y1': max_y,
-                'page': page
+                'x': box[0],
+                'x1': box[1],
+                'y': box[2],
+                'y1': box[3],
+                'page': box[4]
             })
         return expressions
 
+    def get_matcher(self):
+        """Gets MWEMatcher compiled from :attr:`mwes`.
+
+        The matcher is compiled once and reused, and only recompiled after :attr:`mwes`
+        is replaced or grows.
+
+        >>> clusterer = DumbClusterer(mwes=['crown jewel'])
+        >>> clusterer.get_matcher() is clusterer.get_matcher()
+        True
+        >>> clusterer.mwes.append('waterfront estates')
+        >>> len(clusterer.get_matcher())
+        2
+
+        Returns:
+            MWEMatcher: Matcher of the multi-word expressions.
+        """
+        key = (id(self.mwes), len(self.mwes))
+        if self._matcher is None or self._matcher_key != key:
+            self._matcher = MWEMatcher(self.mwes)
+            self._matcher_key = key
+        return self._matcher
+
     def setup_mwes(self, trigram_nbest=100, bigram_nbest=2000):
         """Create multi-word expressions by learning a corpus located in a corpus directory.
 
@@ -153,36 +190,15 @@ class DumbClusterer():
         Returns:
             list: List of multi-word expressions.
         """
-        if self.corpus is None:
+        if self.corpus_dir is None:
             raise Exception("Corpus not found. Run method `setup_corpus` with given corpus directory first.")
 
-        bigram_measures = BigramAssocMeasures()
-        trigram_measures = TrigramAssocMeasures()
-
-        # Following are not used since ne chunk takes too much time.
-        # Text processing before bigrams and trigrams calculated
-        # words = []
-        # for sent in self.corpus.sents():
-        #     for chunk in nltk.ne_chunk(nltk.pos_tag(sent)):
-        #         if not isinstance(chunk, nltk.Tree):
-        #             w = chunk[0]
-        #             # - Removal of words containing numbers or punctuations
-        #             if not any((ch.isdigit() or ch in string.punctuation) for ch in w):
-        #                 # - Lowercasing all words
-        #                 words.append(w.lower())
-        #                 print(w.lower().encode("utf-8")),
-
-        # Text processing before bigrams and trigrams calculated
-        words = []
-        for w in self.corpus.words():
-            # - Removal of words containing numbers or punctuations
-            if not any((ch.isdigit() or ch in string.punctuation) for ch in w):
-                # - Lowercasing all words
-                words.append(w.lower())
-
-        bigram_finder = BigramCollocationFinder.from_words(words)
-        trigram_finder = TrigramCollocationFinder.from_words(words)
-        mwes = trigram_finder.nbest(trigram_measures.pmi, trigram_nbest) + bigram_finder.nbest(bigram_measures.pmi, bigram_nbest)
+        # N-gram counts are kept with the corpus and updated as corpus files are created
+        # (see `reader.create_corpus`), so only files not counted yet are read here.
+        store = CollocationStore.open(self.corpus_dir)
+        if store.update(self.corpus_dir) > 0:
+            store.save()
+        mwes = store.nbest(trigram_nbest, bigram_nbest)
         # Basically combining two list by turning them into sets to make sure union returned 
         # i.e. `set1 | set2` where set1 could be list of string or list, and if the latter, they
         # need to be converted into sets.
@@ -0,0 +1,264 @@
+"""
+Module containing CollocationStore class.
+
+The store keeps unigram, bigram and trigram counts of a corpus on disk, so multi-word
+expressions (MWEs) can be ranked without reading the whole corpus again.
+"""
+import os, errno
+import re
+import math
+import heapq
+import string
+import tempfile
+import cPickle as pickle
+
+# Name of the store file, kept inside the corpus directory.
+COLLOCATIONS_FILENAME = 'collocations.pickle'
+
+# Bump this whenever counting changes, to have stores rebuilt from corpus files.
+COLLOCATIONS_VERSION = 1
+
+# Same as words of nltk's PlaintextCorpusReader (i.e. WordPunctTokenizer).
+WORD_PATTERN = re.compile(r"\w+|[^\w\s]+", re.UNICODE)
+
+def extract_words(text):
+    """Extracts words used for collocations from a text.
+
+    Words containing numbers or punctuations are removed, and the rest are lowercased.
+
+    >>> extract_words("Victoria's CROWN jewel, 2.24 ac.")
+    [u'victoria', u's', u'crown', u'jewel', u'ac']
+
+    Args:
+        text(str): Utf-8 encoded or unicode text.
+
+    Returns:
+        list: List of unicode words.
+    """
+    if not isinstance(text, unicode):
+        text = text.decode('utf-8', 'replace')
+    words = []
+    for w in WORD_PATTERN.findall(text):
+        if not any((ch.isdigit() or ch in string.punctuation) for ch in w):
+            words.append(w.lower())
+    return words
+
+class CollocationStore(object):
+    """Persistent, incrementally updated n-gram counts of a corpus.
+
+    Corpus files are counted once, when they are added, and MWEs are ranked by PMI
+    (pointwise mutual information) from the counts, the same way nltk's collocation
+    finders do. To keep memory bounded, bigrams and trigrams are pruned when there are
+    more than `max_ngrams` of them, starting from the least frequent ones.
+
+    >>> store = CollocationStore()
+    >>> store.add_text('a.txt', "Crown jewel of waterfront estates. A crown jewel indeed.")
+    True
+    >>> store.add_text('b.txt', "Waterfront estates with a view.")
+    True
+
+    Files already counted are skipped:
+    >>> store.add_text('a.txt', "Crown jewel of waterfront estates. A crown jewel indeed.")
+    False
+
+    >>> store.nbest(trigram_nbest=1, bigram_nbest=2)
+    [(u'with', u'a', u'view'), (u'a', u'view'), (u'crown', u'jewel')]
+
+    Removing a file subtracts its counts:
+    >>> store.remove_text('b.txt', "Waterfront estates with a view.")
+    >>> len(store)
+    1
+
+    Attributes:
+        path: Path of the store file, or None when store is not persisted.
+        max_ngrams: Maximum number of bigrams (and of trigrams) to keep.
+        fileids: Set of ids of counted files.
+        total: Number of counted words.
+    """
+
+    def __init__(self, path=None, max_ngrams=500000):
+        """Initializes an empty CollocationStore instance.
+
+        Args:
+            path(str): Path of the store file, see :func:`save`.
+            max_ngrams(int): Maximum number of bigrams (and of trigrams) to keep. None to keep all.
+        """
+        self.path = path
+        self.max_ngrams = max_ngrams
+        self.fileids = set()
+        self.total = 0
+        self._unigrams = {}
+        self._bigrams = {}
+        self._trigrams = {}
+
+    @classmethod
+    def open(cls, corpus_dir, max_ngrams=500000):
+        """Opens the store of a corpus directory, or creates an empty one.
+
+        Args:
+            corpus_dir(str): Path to corpus directory.
+            max_ngrams(int): See :func:`__init__`.
+
+        Returns:
+            CollocationStore: The store, not yet updated with new corpus files (see :func:`update`).
+        """
+        path = os.path.join(corpus_dir, COLLOCATIONS_FILENAME)
+        store = cls(path, max_ngrams)
+        try:
+            with open(path, 'rb') as f:
+                state = pickle.load(f)
+        except IOError as e:
+            if e.errno == errno.ENOENT:
+                return store
+            raise
+        if state.get('version') != COLLOCATIONS_VERSION:
+            return store
+        store.fileids = state['fileids']
+        store.total = state['total']
+        store._unigrams = state['unigrams']
+        store._bigrams = state['bigrams']
+        store._trigrams = state['trigrams']
+        return store
+
+    def __len__(self):
+        return len(self.fileids)
+
+    def save(self):
+        """Writes the store into its file.
+
+        The file is written into a temporary file first, then moved into place, so
+        readers never see a partially written store.
+        """
+        if self.path is None:
+            return
+        state = {
+            'version': COLLOCATIONS_VERSION,
+            'fileids': self.fileids,
+            'total': self.total,
+            'unigrams': self._unigrams,
+            'bigrams': self._bigrams,
+            'trigrams': self._trigrams
+        }
+        directory = os.path.dirname(self.path) or '.'
+        fd, tmp_path = tempfile.mkstemp(prefix='.collocations-', dir=directory)
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                pickle.dump(state, f, pickle.HIGHEST_PROTOCOL)
+            os.rename(tmp_path, self.path)
+        except:
+            os.remove(tmp_path)
+            raise
+
+    def update(self, corpus_dir):
+        """Counts corpus files that are not counted yet.
+
+        Args:
+            corpus_dir(str): Path to corpus directory.
+
+        Returns:
+            int: Number of newly counted files.
+        """
+        count = 0
+        for filename in sorted(os.listdir(corpus_dir)):
+            if not filename.endswith('.txt') or filename in self.fileids:
+                continue
+            with open(os.path.join(corpus_dir, filename), 'rb') as f:
+                if self.add_text(filename, f.read()):
+                    count += 1
+        return count
+
+    def add_text(self, fileid, text):
+        """Counts n-grams of a corpus file.
+
+        Args:
+            fileid(str): Id of the file, usually its name inside corpus directory.
+            text(str): Content of the file.
+
+        Returns:
+            bool: False when the file was already counted.
+        """
+        if fileid in self.fileids:
+            return False
+        self._count(extract_words(text), 1)
+        self.fileids.add(fileid)
+        self._prune()
+        return True
+
+    def remove_text(self, fileid, text):
+        """Subtracts counts of a corpus file, e.g. before it is overwritten.
+
+        Args:
+            fileid(str): Id of the file.
+            text(str): Content of the file when it was counted.
+        """
+        if fileid not in self.fileids:
+            return
+        self._count(extract_words(text), -1)
+        self.fileids.discard(fileid)
+
+    def nbest(self, trigram_nbest=100, bigram_nbest=2000):
+        """Gets MWEs ranked highest by PMI.
+
+        Args:
+            trigram_nbest(int): Number of highest ranked trigrams to get.
+            bigram_nbest(int): Number of highest ranked bigrams to get.
+
+        Returns:
+            list: Trigrams followed by bigrams, as tuples of words.
+        """
+        return (self._nbest(self._trigrams, trigram_nbest) +
+                self._nbest(self._bigrams, bigram_nbest))
+
+    def _nbest(self, ngrams, n):
+        """Ranks n-grams by PMI, breaking ties by n-gram (like nltk's `score_ngrams`).
+        """
+        if self.total == 0:
+            return []
+        unigrams = self._unigrams
+        log_total = math.log(self.total, 2)
+        scored = []
+        for ngram, count in ngrams.iteritems():
+            score = math.log(count, 2) + (len(ngram)-1) * log_total
+            for word in ngram:
+                score -= math.log(unigrams[word], 2)
+            scored.append((-score, ngram))
+        return [ngram for _, ngram in heapq.nsmallest(n, scored)]
+
+    def _count(self, words, delta):
+        """Adds `delta` to counts of unigrams, bigrams and trigrams of words.
+        """
+        self.total += delta * len(words)
+        self._add(self._unigrams, words, delta)
+        self._add(self._bigrams, zip(words, words[1:]), delta)
+        self._add(self._trigrams, zip(words, words[1:], words[2:]), delta)
+
+    def _add(self, counts, ngrams, delta):
+        for ngram in ngrams:
+            count = counts.get(ngram, 0) + delta
+            if count > 0:
+                counts[ngram] = count
+            elif ngram in counts:
+                # Pruned n-grams may get below zero.
+                del counts[ngram]
+
+    def _prune(self):
+        """Removes least frequent bigrams and trigrams while there are more than `max_ngrams`.
+
+        N-grams are pruned down to three quarters of `max_ngrams`, so pruning does not
+        run for every added file.
+        """
+        if self.max_ngrams is None:
+            return
+        for counts in (self._bigrams, self._trigrams):
+            if len(counts) <= self.max_ngrams:
+                continue
+            target = self.max_ngrams * 3 // 4
+            threshold = 1
+            while len(counts) > target:
+                for ngram in [ngram for ngram, count in counts.iteritems() if count <= threshold]:
+                    del counts[ngram]
+                threshold += 1
+
+if __name__ == '__main__':
+    import doctest
+    doctest.testmod()
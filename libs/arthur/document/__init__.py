@@ -1 +1,3 @@
-from document import *
\ No newline at end of file
+from document import *
+from element_store import *
+from parse_cache import *
\ No newline at end of file
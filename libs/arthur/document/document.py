@@ -3,15 +3,18 @@ This module contains classes related to a document object used
 by Arthur, namely ArthurDocument, along with its elements.
 """
 
-from pdfminer.pdfparser import PDFStreamParser
-from pdfminer.pdfdocument import PDFDocument
 from pdfminer.pdfparser import PDFSyntaxError
 from pdfminer.pdfpage import PDFTextExtractionNotAllowed
 
-from pdf_processors import process_pdf
+from pdf_processors import open_pdf, process_pdf
+from element_store import ArthurElementStore
 
 import numpy as np
 from collections import namedtuple
+from itertools import count
+
+# Revisions are shared by all documents, so two documents never have the same revision.
+_revisions = count(1)
 
 class ArthurDocument(object):
     """An object used in Arthur for various document related functions.
@@ -27,6 +30,26 @@ class ArthurDocument(object):
     [[ -1.00000000e+00  -1.00000000e+00   1.00000000e+00 ...,   5.99999760e+01
     ...
 
+    Pages can be laid out in multiple processes, with the same result:
+    >>> f.seek(0)
+    >>> parallel = ArthurDocument(f.read(), doctype='pdf', processes=2)
+    >>> np.array_equal(parallel.get_features(), features)
+    True
+    >>> parallel.get_text(parallel.get_features()) == document.get_text(features)
+    True
+
+    A document parsed elsewhere (e.g. in another process) is rebuilt from its parsed arrays:
+    >>> f.seek(0)
+    >>> rebuilt = ArthurDocument(f.read(), doctype='pdf', parsed=document.get_parsed())
+    >>> np.array_equal(rebuilt.get_features(), features), rebuilt._page_infos == document._page_infos
+    (True, True)
+
+    A document created without text, e.g. from its database record, is filled the same way:
+    >>> stored = ArthurDocument(name='testname', num_data_fields=3)
+    >>> stored.load_parsed(document.get_parsed())
+    >>> np.array_equal(stored.get_features(), features), stored.num_data_fields
+    (True, 3)
+
     How to get name:
     >>> document.name
     'testname'
@@ -76,21 +99,32 @@ class ArthurDocument(object):
            [ 1,  2,  3,  4,  5,  6,  7,  8,  9, 10],
            [ 2,  3,  4,  5,  6,  7,  8,  9, 10, 11]])
 
+    A sorted copy is returned, so read-only features of a document can be sorted too:
+    >>> fsort[0, 0]
+    1
+    >>> sorted_features = ArthurDocument.sort_features(features, ['page', 'y', 'x'])
+    >>> sorted_features.shape == features.shape, features.flags.writeable
+    (True, False)
+
     Attributes:
         num_data_fields Number of data fields.
 
         raw: Raw text.
-        _elements: (read-only) List of ArthurDocumentElement instances. Edit via method :func:`write`.
+        _elements: (read-only) ArthurElementStore instance, behaves like a list of ArthurDocumentElement
+                   instances. Edit via method :func:`write`.
                    Elements differ from features in that they store a text.
         
         _page_infos: (read-only) List of ArthurDocumentPageInfo instances detailing page info
                      (width and height, page number, and maybe other features we may later need
                      for learning). Edit via method :func:`write_page_info`.
         
-        _data: (read-only) Numpy array gathered from self._elements. This array contains id (to
+        _data: (read-only) Numpy array view of self._elements. This array contains id (to
                lookup for elements in :func:`get_text`). To get only the features, use method
                :func:`get_features`.
         
+        revision: (read-only) Changes whenever elements or page infos are written, e.g. to tell
+                  whether a document has to be sent again. Unique across all documents.
+
         _others: (read-only) Other attributes of this document that will be outputted with
                  :func:`to_dict()` method.
                  They are also retrieve / updateable by function :func:`get_other_attr(key)` and
@@ -98,9 +132,15 @@ class ArthurDocument(object):
         
         __page_numbers: (private) A list of registered page numbers, so we don't have to search through all page_infos
                         to find out if a page exists in document.
+
+        __position_index: (private) Dict mapping (page, x, y) to list of element ids, used by :func:`get_text`.
+                          Built on first use and dropped whenever an element is written.
+
+        __derived: (private) Dict of values derived from elements, see :func:`get_derived`.
     """
 
-    def __init__(self, text=None, doctype=None, num_data_fields=0, _id=None, name=None, **kwargs):
+    def __init__(self, text=None, doctype=None, num_data_fields=0, _id=None, name=None, processes=None, cache=None,
+                 parsed=None, **kwargs):
         """Initializes ArthurDocument instance.
 
         Args:
@@ -109,6 +149,12 @@ class ArthurDocument(object):
                   no need to read text during object creation.
             doctype: Type of given text. If doctype is not given, try one by one:
                      pdf, docx, etc.
+            processes: Number of processes to lay out pdf pages in. Defaults to None, i.e.
+                       pages are processed serially. See :func:`process_pdf`.
+            cache: ArthurParseCache instance. When given, a pdf that has been parsed before
+                   is loaded from cache instead of being parsed again.
+            parsed: Result of :func:`get_parsed` of the same text parsed before, e.g. in
+                    another process. When given, text is not parsed again.
             kwargs: Other keyword arguments. Can be used to store arbitrary values
                     during document creation (will be returned by to_dict() method).
 
@@ -118,22 +164,32 @@ class ArthurDocument(object):
         self.name = name
 
         self._id = _id
-        self._elements = []
+        self._elements = ArthurElementStore(ArthurDocument.get_feature_names(),
+                                            ArthurDocument.get_default_features(),
+                                            int_features=['page', 'textbox_id', 'textline_id'])
         self._page_infos = []
-        self._data = None
         self._others = kwargs
+        self.revision = next(_revisions)
 
         self.__page_numbers = []
+        self.__position_index = None
+        self.__derived = {}
 
         if text is not None:
+            if doctype != 'pdf':
+                self.raw = text
+            if parsed is not None:
+                self.load_parsed(parsed)
+                return
+            if cache is not None and self._load_from_cache(cache, text):
+                return
+
+            # The parsed pdf document is reused by process_pdf, so each pdf is only parsed once.
             if doctype == 'pdf':
-                parser = PDFStreamParser(text)
-                document = PDFDocument(parser)
+                document = open_pdf(text)
             else:
                 try:
-                    self.raw = text
-                    parser = PDFStreamParser(text)
-                    document = PDFDocument(parser)
+                    document = open_pdf(text)
                     doctype = 'pdf'
                 except PDFSyntaxError:
                     doctype = 'text'
@@ -141,7 +197,54 @@ class ArthurDocument(object):
             if doctype == 'pdf':
                 if not document.is_extractable:
                     raise PDFTextExtractionNotAllowed
-                process_pdf(self, text)
+                process_pdf(self, text, document=document, processes=processes)
+                if cache is not None:
+                    self._save_to_cache(cache, text)
+
+    def _load_from_cache(self, cache, text):
+        """Loads elements and page infos of a pdf from parse cache.
+
+        Returns:
+            bool: True when document was found in cache.
+        """
+        cached = cache.load(text, ArthurDocument.get_feature_names())
+        if cached is None:
+            return False
+        self.load_parsed(cached)
+        return True
+
+    def load_parsed(self, parsed):
+        """Replaces elements and page infos with parsed ones, see :func:`get_parsed`, e.g. to fill
+        a document created from its database record, which has no elements.
+        """
+        data, chars, offsets, page_infos = parsed
+        self._elements = ArthurElementStore.from_arrays(ArthurDocument.get_feature_names(), data, chars, offsets,
+                                                        ArthurDocument.get_default_features(),
+                                                        int_features=['page', 'textbox_id', 'textline_id'])
+        self.__position_index = None
+        self.__derived.clear()
+        self.revision = next(_revisions)
+        self.remove_page_info()
+        for number, width, height in page_infos:
+            self.write_page_info(ArthurDocumentPageInfo(number=number, width=width, height=height))
+
+    def get_parsed(self):
+        """Gets elements and page infos of this document as plain arrays, e.g. to send a document
+        parsed in another process back. Pass them as `parsed` to rebuild the document.
+
+        Returns:
+            tuple: (data, chars, offsets, page_infos), see :func:`ArthurParseCache.load`.
+        """
+        data = self._elements.get_data()
+        _, chars, offsets = self._elements.get_arrays()
+        page_infos = [(p.number, p.width, p.height) for p in self._page_infos]
+        return (data, chars, offsets, page_infos)
+
+    def _save_to_cache(self, cache, text):
+        """Stores elements and page infos of this document into parse cache.
+        """
+        data, chars, offsets, page_infos = self.get_parsed()
+        cache.save(text, data, chars, offsets, page_infos, ArthurDocument.get_feature_names())
 
     def write(self, element=None):
         """Writes an ArthurDocumentElement to this document for
@@ -150,7 +253,23 @@ class ArthurDocument(object):
         Args:
             element: ArthurDocumentElement object.
         """
-        self._elements.append(element)
+        self._elements.append(element.text, element.features)
+        self.__position_index = None
+        self.__derived.clear()
+        self.revision = next(_revisions)
+
+    def write_elements(self, features, text, offsets):
+        """Writes multiple elements at once, e.g. elements of a page processed in another process.
+
+        Args:
+            features: Numpy array of features, columns ordered by :func:`get_feature_names`.
+            text: Packed texts of the elements.
+            offsets: Offsets of each element's text in `text`. See :func:`ArthurElementStore.extend`.
+        """
+        self._elements.extend(features, text, offsets)
+        self.__position_index = None
+        self.__derived.clear()
+        self.revision = next(_revisions)
 
     def write_page_info(self, page_info):
         """Writes into page_infos.
@@ -165,6 +284,7 @@ class ArthurDocument(object):
         if not self.page_number_exists(page_info.number):
             self._page_infos.append(page_info)
             self.__page_numbers.append(page_info.number)
+            self.revision = next(_revisions)
 
     def page_number_exists(self, number):
         """Checks if a page_info with given number exists.
@@ -183,6 +303,10 @@ class ArthurDocument(object):
                     del self._page_infos[idx]
             del self.__page_numbers[number]
 
+    @property
+    def _data(self):
+        return self._elements.get_data()
+
     def get_features(self, with_id=False, force_recreate=False):
         """Gets all stored ArthurDocumentElements as numpy array
         features for use in data analysis and machine learning.
@@ -190,22 +314,100 @@ class ArthurDocument(object):
         To get only one column of features:
         `features[:,ArthurDocument.get_feature_id('field_name')]`
 
+        The returned array is a read-only view of the document's element store, so copy
+        it to modify its values.
+
         Args:
-            force_recreate: Force recreates :attr:`_data` attribute.
+            force_recreate: Not needed anymore since features are stored as they are written.
+                            Kept for backward compatibility.
             with_id: Defaults to False. When True, include id as first attribute's value.
                      This id can be used to get element (`self._elements[id]`).
         
         Returns:
             numpy.array: Numpy array of features
         """
-        if self._data is None or force_recreate:
-            self._recreate_features()
         if with_id:
-            return self._data
+            return self._elements.get_data()
         else:
-            return np.nan_to_num(self._data[:,1:])
+            return self._elements.get_features()
+
+    def get_derived(self, key, create):
+        """Gets a value derived from this document's elements, creating it on first use.
+
+        Useful for values that are expensive to compute and needed by several readers,
+        e.g. which elements are duplicates. Derived values are dropped whenever elements
+        are written.
+
+        >>> document = ArthurDocument()
+        >>> document.get_derived('count', lambda d: len(d.get_features()))
+        0
+        >>> document.write(ArthurDocumentElement('a'))
+        >>> document.get_derived('count', lambda d: len(d.get_features()))
+        1
+
+        Args:
+            key: Name of derived value.
+            create: Function that takes this document and returns the derived value.
+        """
+        if key not in self.__derived:
+            self.__derived[key] = create(self)
+        return self.__derived[key]
+
+    def get_page_ids(self, pages):
+        """Gets ids of elements on given pages.
+
+        Elements are grouped by page once (see :func:`get_derived`), so getting elements
+        of a few pages doesn't scan the whole document.
+
+        >>> document = ArthurDocument()
+        >>> for text, page in [('a', 2), ('b', 1), ('c', 2)]:
+        ...     document.write(ArthurDocumentElement(text, {'page': page}))
+        >>> document.get_page_ids([2, 3])
+        array([0, 2])
+        >>> [element['text'] for element in document.to_dict(with_details=True, pages=[1])['elements']]
+        ['b']
+
+        Args:
+            pages: Iterable of page numbers.
+
+        Returns:
+            numpy.ndarray: Ids of elements, ordered by page and then by id.
+        """
+        index = self.get_derived('page_index', ArthurDocument._index_pages)
+        ids = [index[page] for page in pages if page in index]
+        if len(ids) == 0:
+            return np.zeros(0, dtype=np.int64)
+        return np.concatenate(ids)
+
+    def get_page_numbers(self):
+        """Gets numbers of this document's pages, including pages without elements.
+
+        >>> document = ArthurDocument()
+        >>> for number in [2, 1]:
+        ...     document.write_page_info(ArthurDocumentPageInfo(number=number, width=612, height=792))
+        >>> document.get_page_numbers()
+        [1, 2]
+
+        Returns:
+            list: Sorted page numbers, empty for a document without pages (e.g. a text document).
+        """
+        return sorted(page_info.number for page_info in self._page_infos)
+
+    @staticmethod
+    def _index_pages(document):
+        """Groups ids of elements by page.
 
-    def to_dict(self, raw=False, with_details=False):
+        Returns:
+            dict: Dict of page number to numpy array of element ids.
+        """
+        pages = document._data[:, ArthurDocument.get_feature_id('page')+1]
+        # Stable sort keeps elements of a page in id order.
+        order = np.argsort(pages, kind='mergesort')
+        numbers, starts = np.unique(pages[order], return_index=True)
+        ends = list(starts[1:]) + [len(order)]
+        return dict((int(number), order[start:end]) for number, start, end in zip(numbers, starts, ends))
+
+    def to_dict(self, raw=False, with_details=False, columnar=False, pages=None):
         """Returns dictionary representation of this object.
 
         Args:
@@ -214,6 +416,13 @@ class ArthurDocument(object):
                                 elements, and data fields. Generally this should be set
                                 to False when listing documents, and True for viewing
                                 a document in detail. Defaults to False.
+            columnar(bool): If True, elements are returned as one numpy array per feature
+                            (see :func:`ArthurElementStore.to_columns`) instead of a list of
+                            dicts. Much more compact for large documents, but not json
+                            serializable as is. Defaults to False.
+            pages(list|None): Only include elements of these pages, listed as 'element_pages'.
+                              Page infos of all pages are still included. Defaults to None,
+                              i.e. elements of all pages.
 
         Returns:
             dict: This object, serialized as dictionary.
@@ -236,9 +445,18 @@ class ArthurDocument(object):
         dict_elements = None
         page_infos = None
         if with_details:
-            dict_elements = []
-            for element in self._elements:
-                dict_elements.append(element.to_dict())
+            ids = None
+            if pages is not None:
+                ids = self.get_page_ids(pages)
+                obj['element_pages'] = sorted(pages)
+            if columnar:
+                dict_elements = self._elements.to_columns(ids)
+            elif ids is None:
+                dict_elements = []
+                for element in self._elements:
+                    dict_elements.append(element.to_dict())
+            else:
+                dict_elements = [self._elements[idx].to_dict() for idx in ids]
             page_infos = []
             for page_info in self._page_infos:
                 page_infos.append(page_info.to_dict())
@@ -277,21 +495,27 @@ class ArthurDocument(object):
     def sort_features(cls, features, sort_by_names, axis=0, **kwargs):
         """Sort features by names.
 
-        Simply pass in list of names to sort features
+        Simply pass in list of names to sort features, the first name sorts first. Features
+        are not changed, as they may be read-only (see :func:`get_features`).
+
+        Args:
+            features: Numpy array of features, with or without ids.
+            sort_by_names(list): Names of features to sort by.
+            axis, kwargs: Not needed anymore since rows are always sorted. Kept for backward compatibility.
+
+        Returns:
+            numpy.array: Sorted copy of features.
         """
-        ids = []
         total_names = len(cls.get_feature_names())
         # Todo: this +x thing is really ugly. Currently needed since features
         #       may include id or not, but this code could be better.
         x = 0
         if np.shape(features)[1] > total_names:
             x = np.shape(features)[1] - total_names
-        for name in sort_by_names:
-            idx = 'f%i' % (cls.get_feature_id(name) + x)
-            ids.append(idx)
-        dtype = ','.join(['f4']*total_names)
-        features.view(dtype).sort(order=ids, axis=axis, **kwargs)
-        return features
+        columns = [cls.get_feature_id(name) + x for name in sort_by_names]
+        # lexsort sorts by its last key first.
+        order = np.lexsort([features[:, column] for column in reversed(columns)])
+        return features[order]
 
     @classmethod
     def get_feature_names(cls):
@@ -363,50 +587,62 @@ class ArthurDocument(object):
     def get_text(self, features):
         """Returns text from given features.
 
+        Elements are looked up by their (page, x, y) position through an index, so
+        reconstructing text of n features takes O(n) instead of a scan of the whole
+        document per feature.
+
         Args:
             features: Numpy array of features.
 
         Returns:
             string: A string containing reconstructed text from features.
         """
-        text = ''
         if len(np.shape(features)) == 1:
             features = [features]
+        features = np.asarray(features)
+        if len(features) == 0:
+            return ''
+
+        index = self._get_position_index()
+        keys = features[:, [ArthurDocument.get_feature_id('page'),
+                            ArthurDocument.get_feature_id('x'),
+                            ArthurDocument.get_feature_id('y')]].tolist()
+        ids = []
+        for key in keys:
+            ids.extend(index.get(tuple(key), ()))
 
+        # Needs +1 since _data contains id at its first column.
+        ys = self._data[ids, ArthurDocument.get_feature_id('y')+1].tolist()
+        texts = self._elements.get_texts(ids)
+        chunks = []
         last_y = None
-        for f in features:
-            rows = self._data[np.where(
-                # The following combines 3 where conditions with '*'.
-                # Needs +1 since _data contains id at its first column.
-                (self._data[:,ArthurDocument.get_feature_id('x')+1] == f[ArthurDocument.get_feature_id('x')]) * 
-                (self._data[:,ArthurDocument.get_feature_id('y')+1] == f[ArthurDocument.get_feature_id('y')]) *
-                (self._data[:,ArthurDocument.get_feature_id('page')+1] == f[ArthurDocument.get_feature_id('page')])
-            )]
-            for r in rows:
-                y = r[ArthurDocument.get_feature_id('y')+1]
-                if last_y != y and last_y is not None:
-                    # Todo: Move this to reader.correct_block().
-                    text += ' '
-                last_y = y
-                text += self._elements[int(r[0])].text
-        return text
-
-    def _recreate_features(self):
-        """Recreate :self._data: from :self._elements:.
-
-        No need to return anything since this is a protected method.
-
-        Note: This will create a numpy array with first column being id. This id is used to get
-              characters in :func:`get_text` method. Numeric id instead of char is used here to
-              avoid numpy behavior that converts all values into string when one value turned into string.
-        """
+        for y, chartext in zip(ys, texts):
+            if last_y != y and last_y is not None:
+                # Todo: Move this to reader.correct_block().
+                chunks.append(' ')
+            last_y = y
+            chunks.append(chartext)
+        return ''.join(chunks)
+
+    def _get_position_index(self):
+        """Gets index of element ids by their (page, x, y) position.
 
-        self._data = np.zeros([len(self._elements), len(ArthurDocument.get_feature_names())+1])
-        for i, val in enumerate(self._elements):
-            self._data[i,0] = i
-            for j, k in enumerate(ArthurDocument.get_feature_names()):
-                self._data[i, j+1] = val.features[k]
-        self._data = np.nan_to_num(self._data)
+        Multiple elements may share a position (e.g. duplicated glyphs), in which case
+        their ids are listed in the order they were written.
+
+        Returns:
+            dict: Dictionary of `{(page, x, y): [id, ...]}`.
+        """
+        if self.__position_index is None:
+            data = self._data
+            positions = data[:, [ArthurDocument.get_feature_id('page')+1,
+                                 ArthurDocument.get_feature_id('x')+1,
+                                 ArthurDocument.get_feature_id('y')+1]].tolist()
+            index = {}
+            for idx, position in enumerate(positions):
+                index.setdefault(tuple(position), []).append(idx)
+            self.__position_index = index
+        return self.__position_index
 
 class ArthurDocumentPageInfo(namedtuple('ArthurDocumentPageInfo', ['number', 'width', 'height'])):
     """A single page information object.
@@ -0,0 +1,329 @@
+"""
+This module contains ArthurElementStore, a columnar storage for the elements
+of an ArthurDocument.
+"""
+
+import sys
+import numpy as np
+
+_INF = float('inf')
+
+class ArthurElementStore(object):
+    """Growable, array-backed storage of document elements.
+
+    Instead of keeping one ArthurDocumentElement (and one features dict) per character,
+    the store keeps all features in a single preallocated numpy array, and all texts in
+    one packed buffer with offsets. The array is column-major, so each feature is a
+    contiguous column, and the first column holds element ids.
+
+    >>> store = ArthurElementStore(['page', 'x', 'y'], {'page': 0, 'x': 0., 'y': 0.},
+    ...                            int_features=['page'], capacity=2)
+    >>> store.append('a', {'x': 1.5, 'y': 2., 'page': 1})
+    0
+    >>> store.append('b', {'x': 2.5, 'y': 2., 'page': 1})
+    1
+
+    Store grows when capacity is reached:
+    >>> store.append('<image>', {'x': 3.5})
+    2
+    >>> len(store)
+    3
+    >>> store.get_data()
+    array([[0. , 1. , 1.5, 2. ],
+           [1. , 1. , 2.5, 2. ],
+           [2. , 0. , 3.5, 0. ]])
+
+    Features returned are read-only views, not copies:
+    >>> features = store.get_features()
+    >>> features.base is not None, features.flags.writeable
+    (True, False)
+
+    Texts are kept in a packed buffer:
+    >>> store.get_text(2)
+    '<image>'
+    >>> store.get_texts([0, 1])
+    ['a', 'b']
+
+    Elements can be appended in bulk, e.g. from another store:
+    >>> other = ArthurElementStore(['page', 'x', 'y'])
+    >>> other.append('cd', {'x': 4.5, 'y': 2., 'page': 2})
+    0
+    >>> store.extend(*other.get_arrays())
+    >>> store.get_text(3)
+    'cd'
+    >>> store.get_data()[3]
+    array([3. , 2. , 4.5, 2. ])
+
+    Elements can still be accessed one by one:
+    >>> store[1].text
+    'b'
+    >>> store[1].features['page']
+    1
+
+    Or as one compact array per feature, e.g. to send them to a client:
+    >>> columns = store.to_columns()
+    >>> columns['features']['page'], columns['features']['x']
+    (array([1, 1, 0, 2], dtype=int32), array([1.5, 2.5, 3.5, 4.5], dtype=float32))
+    >>> columns['text'].tostring(), columns['text_offsets']
+    ('ab<image>cd', array([ 0,  1,  2,  9, 11], dtype=int32))
+
+    Or only some of them:
+    >>> columns = store.to_columns(ids=[1, 3])
+    >>> columns['features']['x'], columns['text'].tostring(), columns['text_offsets']
+    (array([2.5, 4.5], dtype=float32), 'bcd', array([0, 1, 3], dtype=int32))
+
+    NaN and infinite values are replaced the same way as `np.nan_to_num` does:
+    >>> store.append('e', {'x': float('nan'), 'y': float('inf')})
+    4
+    >>> store.get_features()[4].tolist() == [0., 0., sys.float_info.max]
+    True
+
+    Attributes:
+        feature_names: (read-only) List of sorted feature names, in the order of columns.
+        _data: Column-major numpy array with the id column followed by feature columns.
+               Only the first :func:`len` rows are in use.
+        _text: bytearray containing texts of all elements, one after another.
+        _offsets: Numpy array of offsets into :attr:`_text`. Text of element `i` is
+                  `_text[_offsets[i]:_offsets[i+1]]`.
+    """
+
+    def __init__(self, feature_names, defaults=None, int_features=None, capacity=1024):
+        """Initializes ArthurElementStore instance.
+
+        Args:
+            feature_names: List of (sorted) feature names.
+            defaults: Dict of default feature values, used when an appended element misses
+                      a feature.
+            int_features: List of feature names that are returned as ints by :func:`get_element`
+                          (e.g. ids and page numbers).
+            capacity: Number of elements to preallocate.
+        """
+        if defaults is None:
+            defaults = {}
+        self.feature_names = list(feature_names)
+        self._defaults = [defaults.get(name, 0.) for name in self.feature_names]
+        self._int_features = set(int_features or [])
+        self._size = 0
+        capacity = max(int(capacity), 1)
+        self._data = np.zeros([capacity, len(self.feature_names)+1], order='F')
+        self._text = bytearray()
+        self._offsets = np.zeros(capacity+1, dtype=np.int64)
+
+    @classmethod
+    def from_arrays(cls, feature_names, data, text, offsets, defaults=None, int_features=None):
+        """Creates a store over existing arrays, e.g. memory-mapped ones.
+
+        Arrays are used as they are, without copying. Read-only arrays are copied only
+        when more elements are appended.
+
+        Args:
+            feature_names: List of (sorted) feature names.
+            data: Numpy array with the id column followed by feature columns, see :func:`get_data`.
+            text: Packed texts of the elements.
+            offsets: Offsets of texts in `text`, one more than the number of elements.
+            defaults: See :func:`__init__`.
+            int_features: See :func:`__init__`.
+
+        Returns:
+            ArthurElementStore: New store containing given elements.
+        """
+        store = cls(feature_names, defaults, int_features=int_features, capacity=1)
+        store._data = data
+        store._text = bytearray(text)
+        store._offsets = offsets
+        store._size = len(data)
+        return store
+
+    def __len__(self):
+        return self._size
+
+    def __iter__(self):
+        for idx in xrange(self._size):
+            yield self[idx]
+
+    def __getitem__(self, idx):
+        """Gets element with given id as an ArthurDocumentElement.
+        """
+        from document import ArthurDocumentElement
+        text, features = self.get_element(idx)
+        return ArthurDocumentElement(text, features)
+
+    def append(self, text, features=None):
+        """Appends an element to this store.
+
+        Args:
+            text: Text of element (usually a character).
+            features: Dict of features. Missing features get their default values.
+                      Like `np.nan_to_num`, NaN values are stored as 0, and infinite values
+                      as the largest (or smallest) finite float.
+
+        Returns:
+            int: Id of the appended element.
+        """
+        idx = self._size
+        if idx >= self._data.shape[0]:
+            self._grow(idx+1)
+        if features is None:
+            features = {}
+        row = self._data[idx]
+        row[0] = idx
+        for j, name in enumerate(self.feature_names):
+            value = features.get(name, self._defaults[j])
+            # Same as np.nan_to_num, without creating an array per element.
+            if value != value:
+                value = 0.
+            elif value in (_INF, -_INF):
+                value = sys.float_info.max if value > 0 else -sys.float_info.max
+            row[j+1] = value
+        if isinstance(text, unicode):
+            text = text.encode('utf-8')
+        self._text.extend(text)
+        self._offsets[idx+1] = len(self._text)
+        self._size += 1
+        return idx
+
+    def extend(self, features, text, offsets):
+        """Appends multiple elements at once.
+
+        Args:
+            features: Numpy array of features, one row per element, columns ordered by
+                      :attr:`feature_names`.
+            text: Packed texts of the elements.
+            offsets: Offsets of texts in `text`, starting from 0, one more than the number
+                     of elements.
+        """
+        count = len(features)
+        if count == 0:
+            return
+        start = self._size
+        if start + count > self._data.shape[0]:
+            self._grow(start + count)
+        self._data[start:start+count, 0] = np.arange(start, start+count)
+        self._data[start:start+count, 1:] = np.nan_to_num(features)
+        self._offsets[start+1:start+count+1] = len(self._text) + np.asarray(offsets[1:count+1])
+        self._text.extend(text)
+        self._size += count
+
+    def get_arrays(self):
+        """Gets compact copies of stored elements, e.g. to send them to another process.
+
+        Returns:
+            tuple: (features, text, offsets), as accepted by :func:`extend`.
+        """
+        return (self.get_features().copy(), str(self._text),
+                self._offsets[:self._size+1].copy())
+
+    def to_columns(self, ids=None, float_dtype=np.float32, int_dtype=np.int32):
+        """Gets stored elements as one array per feature.
+
+        Much more compact than a features dict per element, and typed arrays can be used
+        as they are by clients (e.g. as javascript typed arrays).
+
+        Args:
+            ids: Ids of elements to get, e.g. elements of some pages. Defaults to None,
+                 i.e. all elements. Only the selected elements are copied.
+            float_dtype: Numpy dtype of features that are not int features.
+            int_dtype: Numpy dtype of int features, and of text offsets.
+
+        Returns:
+            dict: 'count': number of elements, 'features': dict of feature name to array,
+                  'text': uint8 array of packed utf-8 texts, and 'text_offsets': offsets of
+                  texts in 'text', one more than the number of elements.
+        """
+        text = np.frombuffer(self._text, dtype=np.uint8)
+        if ids is None:
+            data = self.get_features()
+            offsets = self._offsets[:self._size+1]
+            text = text.copy()
+        else:
+            ids = np.asarray(ids, dtype=np.int64)
+            data = self._data[ids, 1:]
+            starts = self._offsets[ids]
+            lengths = self._offsets[ids+1] - starts
+            offsets = np.concatenate([[0], np.cumsum(lengths)])
+            # Position of each selected byte: its element's start, plus its position within the element.
+            text = text[np.repeat(starts - offsets[:-1], lengths) + np.arange(offsets[-1])]
+        features = {}
+        for j, name in enumerate(self.feature_names):
+            dtype = int_dtype if name in self._int_features else float_dtype
+            features[name] = data[:, j].astype(dtype)
+        return {
+            'count': len(data),
+            'features': features,
+            'text': text,
+            'text_offsets': offsets.astype(int_dtype)
+        }
+
+    def get_data(self):
+        """Gets a read-only view of all stored elements, with id as the first column.
+        """
+        view = self._data[:self._size]
+        view.flags.writeable = False
+        return view
+
+    def get_features(self):
+        """Gets a read-only view of all stored features, without the id column.
+        Copy it to modify values.
+        """
+        view = self._data[:self._size, 1:]
+        view.flags.writeable = False
+        return view
+
+    def get_text(self, idx):
+        """Gets text of a single element.
+        """
+        return str(self._text[self._offsets[idx]:self._offsets[idx+1]])
+
+    def get_texts(self, ids):
+        """Gets texts of multiple elements.
+
+        Args:
+            ids: Iterable of element ids.
+
+        Returns:
+            list: List of texts, in the order of given ids.
+        """
+        text = self._text
+        offsets = self._offsets
+        return [str(text[offsets[i]:offsets[i+1]]) for i in ids]
+
+    def get_element(self, idx):
+        """Gets text and features dict of a single element.
+
+        Returns:
+            tuple: (text, features) pair.
+        """
+        if idx < 0:
+            idx += self._size
+        if idx < 0 or idx >= self._size:
+            raise IndexError('element index out of range')
+        values = self._data[idx, 1:].tolist()
+        features = {}
+        for name, value in zip(self.feature_names, values):
+            if name in self._int_features:
+                value = int(value)
+            features[name] = value
+        return (self.get_text(idx), features)
+
+    def clear(self):
+        """Removes all elements while keeping allocated capacity.
+        """
+        self._size = 0
+        del self._text[:]
+
+    def _grow(self, min_capacity):
+        """Grows allocated arrays to at least `min_capacity` elements by doubling them.
+        """
+        capacity = max(self._data.shape[0], 1)
+        while capacity < min_capacity:
+            capacity *= 2
+        data = np.zeros([capacity, self._data.shape[1]], order='F')
+        data[:self._size] = self._data[:self._size]
+        self._data = data
+        offsets = np.zeros(capacity+1, dtype=np.int64)
+        offsets[:self._size+1] = self._offsets[:self._size+1]
+        self._offsets = offsets
+
+if __name__ == '__main__':
+    import doctest
+    doctest.testmod()
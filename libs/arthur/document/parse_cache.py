@@ -0,0 +1,302 @@
+"""
+This module contains ArthurParseCache, an on-disk cache of parsed documents.
+"""
+
+import os, errno
+import json
+import shutil
+import hashlib
+import tempfile
+import threading
+import time
+import numpy as np
+
+# Bump this whenever parsing changes what ends up in an ArthurDocument
+# (e.g. new features or different coordinates), to invalidate cached documents.
+PARSER_VERSION = 1
+
+TMP_PREFIX = '.tmp-'
+
+class ArthurParseCache(object):
+    """Content-addressed cache of parsed documents.
+
+    Parsing a pdf through pdfminer is slow, so the result of parsing (element arrays and
+    page infos) is stored on disk keyed by hash of the document's content and
+    :data:`PARSER_VERSION`. Each entry is a directory with:
+
+    - `data.npy`: Element features with id as first column.
+    - `offsets.npy`: Offsets of each element's text in `text.bin`.
+    - `text.bin`: Packed texts of all elements.
+    - `meta.json`: Page infos, feature names and parser version.
+
+    Arrays are loaded memory-mapped, so loading a cached document does not read
+    all of it into memory.
+
+    Like :class:`libs.filesystem.LocalCache`, the cache can be bounded by total size and age
+    of its entries: saving a document evicts expired entries, then least recently loaded ones
+    until all entries fit in `max_size`. Entries of other parser versions are always evicted.
+
+    >>> import tempfile
+    >>> from document import ArthurDocument
+    >>> cache = ArthurParseCache(tempfile.mkdtemp())
+    >>> pdf_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'test', 'test.pdf')
+    >>> with open(pdf_path, 'rb') as f:
+    ...     text = f.read()
+    >>> cache.has(text)
+    False
+
+    First load parses the document and stores it into cache:
+    >>> document = ArthurDocument(text, doctype='pdf', cache=cache)
+    >>> cache.has(text)
+    True
+
+    The next load comes from cache:
+    >>> cached = ArthurDocument(text, doctype='pdf', cache=cache)
+    >>> np.array_equal(cached.get_features(), document.get_features())
+    True
+    >>> cached._page_infos == document._page_infos
+    True
+    >>> cached.get_text(cached.get_features()[:11])
+    '3150 Rutlan'
+
+    When the cache is full, least recently loaded documents are evicted:
+    >>> size = cache.stats()['size']
+    >>> cache.max_size = size
+    >>> feature_names = ArthurDocument.get_feature_names()
+    >>> data, chars, offsets, page_infos = cache.load(text, feature_names)
+    >>> cache.save('other', data, chars, offsets, page_infos, feature_names)
+    >>> cache.has(text), cache.has('other')
+    (False, True)
+    >>> stats = cache.stats()
+    >>> stats['entries'], stats['size'] == size, stats['evictions']
+    (1, True, 1)
+
+    Attributes:
+        cache_dir: Directory where cached documents are stored.
+        max_size: Maximum total size of cached documents in bytes. None for no limit.
+        max_age: Seconds a cached document may stay unused before it is evicted. None for no limit.
+        evictions: Number of documents evicted.
+    """
+
+    def __init__(self, cache_dir, max_size=None, max_age=None):
+        """Initializes ArthurParseCache instance.
+
+        Args:
+            cache_dir(str): Directory to store cached documents in. Created when needed.
+            max_size(int): See :attr:`max_size`.
+            max_age(int): See :attr:`max_age`.
+        """
+        self.cache_dir = cache_dir
+        self.max_size = max_size
+        self.max_age = max_age
+        self.evictions = 0
+        self._uses = {}
+        self._use_count = 0
+        self._lock = threading.Lock()
+
+    def key(self, text):
+        """Gets cache key of a document's content.
+        """
+        return "%s-v%s" % (hashlib.sha1(text).hexdigest(), PARSER_VERSION)
+
+    def path(self, text):
+        """Gets path of the cache entry of a document's content.
+        """
+        key = self.key(text)
+        return os.path.join(self.cache_dir, key[:2], key)
+
+    def has(self, text):
+        """Checks if a document's content is cached.
+        """
+        return os.path.isfile(os.path.join(self.path(text), 'meta.json'))
+
+    def load(self, text, feature_names):
+        """Loads a cached document.
+
+        Args:
+            text: Content of the document.
+            feature_names: Expected feature names. Entries with different feature names are ignored.
+
+        Returns:
+            tuple: (data, text, offsets, page_infos), or None when document is not cached.
+                   Page infos are returned as (number, width, height) tuples.
+        """
+        path = self.path(text)
+        try:
+            if self.max_age is not None and time.time() - os.path.getmtime(os.path.join(path, 'meta.json')) > self.max_age:
+                self._remove(path)
+                return None
+            with open(os.path.join(path, 'meta.json'), 'r') as f:
+                meta = json.load(f)
+            if meta['feature_names'] != list(feature_names):
+                return None
+            mmap_mode = 'r' if meta['num_elements'] > 0 else None
+            data = np.load(os.path.join(path, 'data.npy'), mmap_mode=mmap_mode)
+            offsets = np.load(os.path.join(path, 'offsets.npy'), mmap_mode=mmap_mode)
+            with open(os.path.join(path, 'text.bin'), 'rb') as f:
+                chars = f.read()
+        except (IOError, OSError) as e:
+            if e.errno == errno.ENOENT:
+                return None
+            raise
+        self._use(path)
+        page_infos = [tuple(page_info) for page_info in meta['page_infos']]
+        return (data, chars, offsets, page_infos)
+
+    def save(self, text, data, chars, offsets, page_infos, feature_names):
+        """Stores a parsed document.
+
+        Files are written into a temporary directory first, then moved into place,
+        so readers never see a partially written entry. Then entries are evicted, see
+        :func:`evict`.
+
+        Args:
+            text: Content of the document.
+            data: Element features with id as first column.
+            chars: Packed texts of all elements.
+            offsets: Offsets of each element's text in `chars`.
+            page_infos: List of (number, width, height) tuples.
+            feature_names: Feature names, in the order of data's columns (after id).
+        """
+        path = self.path(text)
+        parent = os.path.dirname(path)
+        try:
+            os.makedirs(parent)
+        except OSError as e:
+            if e.errno != errno.EEXIST:
+                raise
+        tmppath = tempfile.mkdtemp(prefix=TMP_PREFIX, dir=parent)
+        try:
+            np.save(os.path.join(tmppath, 'data.npy'), data)
+            np.save(os.path.join(tmppath, 'offsets.npy'), offsets)
+            with open(os.path.join(tmppath, 'text.bin'), 'wb') as f:
+                f.write(chars)
+            with open(os.path.join(tmppath, 'meta.json'), 'w') as f:
+                json.dump({
+                    'parser_version': PARSER_VERSION,
+                    'feature_names': list(feature_names),
+                    'num_elements': len(data),
+                    'page_infos': [list(page_info) for page_info in page_infos]
+                }, f)
+            os.rename(tmppath, path)
+        except OSError as e:
+            shutil.rmtree(tmppath, ignore_errors=True)
+            # Another process cached the same document first.
+            if e.errno not in (errno.EEXIST, errno.ENOTEMPTY):
+                raise
+        except:
+            shutil.rmtree(tmppath, ignore_errors=True)
+            raise
+        self._use(path)
+        self.evict(keep=path)
+
+    def evict(self, keep=None):
+        """Removes entries of other parser versions and expired entries, then least recently
+        used entries until cached documents fit in :attr:`max_size`.
+
+        Entries used by this process are ordered by their last use, and the rest (e.g. cached
+        by another process) by their last load, before all entries used by this process.
+        Temporary directories left by interrupted saves are removed once older than :attr:`max_age`.
+
+        Args:
+            keep(str): Path of an entry to never evict, e.g. the one just saved.
+        """
+        if self.max_size is None and self.max_age is None:
+            return
+        now = time.time()
+        entries = []
+        total = 0
+        for path, name, mtime, size in self._entries():
+            expired = self.max_age is not None and now - mtime > self.max_age
+            if name.startswith(TMP_PREFIX):
+                if expired:
+                    self._remove(path, evicted=False)
+                continue
+            if path != keep and (expired or not name.endswith("-v%s" % PARSER_VERSION)):
+                self._remove(path)
+                continue
+            entries.append(((self._uses.get(path, 0), mtime), path, size))
+            total += size
+        if self.max_size is None:
+            return
+        entries.sort()
+        for _, path, size in entries:
+            if total <= self.max_size:
+                break
+            if path == keep:
+                continue
+            self._remove(path)
+            total -= size
+
+    def stats(self):
+        """Gets number of evictions and current size of the cache, for monitoring.
+
+        Returns:
+            dict: `evictions`, plus `entries` and `size` of cached documents in bytes.
+        """
+        entries = 0
+        size = 0
+        for _, name, _, entry_size in self._entries():
+            if not name.startswith(TMP_PREFIX):
+                entries += 1
+                size += entry_size
+        return {'evictions': self.evictions, 'entries': entries, 'size': size}
+
+    def _entries(self):
+        """Lists entries and temporary directories in the cache.
+
+        Returns:
+            generator: (path, name, mtime, size) tuples. mtime is the last load of an entry,
+                       size is the total size of its files in bytes.
+        """
+        if not os.path.isdir(self.cache_dir):
+            return
+        for prefix in os.listdir(self.cache_dir):
+            parent = os.path.join(self.cache_dir, prefix)
+            if not os.path.isdir(parent):
+                continue
+            for name in os.listdir(parent):
+                path = os.path.join(parent, name)
+                try:
+                    files = [os.stat(os.path.join(path, filename)) for filename in os.listdir(path)]
+                    mtime = os.path.getmtime(os.path.join(path, 'meta.json')) if not name.startswith(TMP_PREFIX) \
+                        else os.path.getmtime(path)
+                except OSError:
+                    # Removed meanwhile, or an entry without meta.json i.e. not a complete one.
+                    continue
+                yield (path, name, mtime, sum(stat.st_size for stat in files))
+
+    def _remove(self, path, evicted=True):
+        """Removes an entry, unless it was already removed (e.g. by another process).
+
+        The entry is moved out of place first, so it is removed as a whole for readers.
+        Arrays a reader already has memory-mapped stay readable after removal.
+        """
+        tmppath = os.path.join(os.path.dirname(path), TMP_PREFIX + os.path.basename(path) + '-removed')
+        try:
+            os.rename(path, tmppath)
+        except OSError as e:
+            if e.errno not in (errno.ENOENT, errno.EEXIST, errno.ENOTEMPTY):
+                raise
+            return
+        shutil.rmtree(tmppath, ignore_errors=True)
+        with self._lock:
+            self._uses.pop(path, None)
+            if evicted:
+                self.evictions += 1
+
+    def _use(self, path):
+        """Marks an entry as recently used, also for other processes through its mtime.
+        """
+        try:
+            os.utime(os.path.join(path, 'meta.json'), None)
+        except OSError as e:
+            if e.errno != errno.ENOENT:
+                raise
+        with self._lock:
+            self._use_count += 1
+            self._uses[path] = self._use_count
+
+if __name__ == '__main__':
+    import doctest
+    doctest.testmod()
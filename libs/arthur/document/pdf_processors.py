@@ -1,6 +1,8 @@
 """A module containing all pdf processors required for ArthurDocument.
 """
 
+from pdfminer.pdfparser import PDFParser
+from pdfminer.pdfdocument import PDFDocument
 from pdfminer.pdfinterp import PDFResourceManager
 from pdfminer.pdfinterp import PDFPageInterpreter
 from pdfminer.layout import LAParams
@@ -12,19 +14,62 @@ from pdfminer.layout import LTImage, LTChar
 from pdfminer.layout import LTTextBox
 
 from pdfminer.image import ImageWriter
+from pdfminer.utils import apply_matrix_pt
+
+from multiprocessing import Pool
 
 try:
     from cStringIO import StringIO
 except ImportError:
     from StringIO import StringIO
 
-def process_pdf(outfp, text):
+def open_pdf(text):
+    """Parses a PDF document once, to be reused for page listing and layout analysis.
+
+    Args:
+        text: Content of a pdf file.
+
+    Returns:
+        PDFDocument: Parsed pdf document. Raises PDFSyntaxError when text is not a pdf.
+    """
+    parser = PDFParser(StringIO(text))
+    return PDFDocument(parser)
+
+def process_pdf(outfp, text, document=None, processes=None):
     """Process PDF document.
 
     Args:
         outfp: Basically an object that has `write` method, like ArthurDocument or sys.stdout.
+        text: Content of a pdf file. Only parsed when `document` is not given.
+        document: PDFDocument returned by :func:`open_pdf`. Pass it when the pdf has been
+                  parsed already, so it is not parsed again.
+        processes: Number of processes to run page interpretation and layout analysis in.
+                   Only used when outfp is an ArthurDocument (i.e. has `write_elements` method)
+                   and the pdf has more than one page. Defaults to None, i.e. process pages serially.
+                   The resulting document is the same either way.
+    """
+    if document is None:
+        document = open_pdf(text)
+
+    # Pages are listed once from the page tree, then reused for both
+    # max width calculation and layout analysis.
+    pages = list(ArthurPDFPage.create_pages(document))
+    max_width = ArthurPDFPage.get_max_width(pages)
+
+    if processes is not None and processes > 1 and len(pages) > 1 and hasattr(outfp, 'write_elements'):
+        _process_pages_parallel(outfp, text, pages, max_width, processes)
+    else:
+        device, interpreter = _create_interpreter(outfp)
+        for page in pages:
+            interpreter.process_page(page, max_width)
+        device.close()
+
+def _create_interpreter(outfp):
+    """Creates ArthurPDFConverter device and its page interpreter writing into outfp.
+
+    Returns:
+        tuple: (ArthurPDFConverter, ArthurPDFPageInterpreter) pair.
     """
-
     rsrcmgr = PDFResourceManager(caching=True)
     codec = 'utf-8'
     imagewriter = ImageWriter('images')
@@ -34,34 +79,93 @@ def process_pdf(outfp, text):
                                 imagewriter=imagewriter)
     interpreter = ArthurPDFPageInterpreter(rsrcmgr, device)
     interpreter.debug = False
+    return (device, interpreter)
+
+def _process_pages_parallel(outfp, text, pages, max_width, processes):
+    """Runs page interpretation and layout analysis in a process pool.
 
-    pagenos = set()
-    text_io = StringIO(text)
+    Each worker parses the pdf once, then returns compact arrays of each page it processed.
+    These are merged into outfp in page order.
 
-    max_width = ArthurPDFPage.get_max_width(text_io, pagenos)
+    Pages are stitched into one continuous plane by :func:`ArthurPDFConverter.receive_layout`
+    using the total height of all pages up to the current one. Page heights are known from
+    mediaboxes, so the totals are summed here in page order, the same way the serial path
+    does, and passed to workers to keep coordinates exactly equal.
+    """
+    tasks = []
+    current_total_height = 0
+    for idx, page in enumerate(pages):
+        tasks.append((idx, current_total_height))
+        current_total_height += ArthurPDFPage.get_height(page)
+
+    from document import ArthurDocumentPageInfo
+    pool = Pool(processes, initializer=_init_page_worker, initargs=(text, max_width))
+    try:
+        for page_infos, features, chars, offsets in pool.imap(_process_page_worker, tasks):
+            for number, width, height in page_infos:
+                outfp.write_page_info(ArthurDocumentPageInfo(number=number, width=width, height=height))
+            outfp.write_elements(features, chars, offsets)
+        pool.close()
+    except:
+        pool.terminate()
+        raise
+    finally:
+        pool.join()
+
+# State of a page worker process, set up by :func:`_init_page_worker`.
+_page_worker = {}
+
+def _init_page_worker(text, max_width):
+    """Parses the pdf once per worker process.
+    """
+    document = open_pdf(text)
+    _page_worker['pages'] = list(ArthurPDFPage.create_pages(document))
+    _page_worker['max_width'] = max_width
+    _page_worker['device'], _page_worker['interpreter'] = _create_interpreter(None)
 
-    for page in ArthurPDFPage.get_pages(text_io, pagenos):
-        interpreter.process_page(page, max_width)
-    device.close()
+def _process_page_worker(task):
+    """Processes a single page in a worker process.
+
+    Args:
+        task: Tuple of (page index, total height of all previous pages).
+
+    Returns:
+        tuple: (page_infos, features, text, offsets), page infos as (number, width, height) tuples
+               and elements as returned by :func:`ArthurElementStore.get_arrays`.
+    """
+    from document import ArthurDocument
+    idx, total_height = task
+    collector = ArthurDocument()
+    device = _page_worker['device']
+    device.outfp = collector
+    device.pageno = idx + 1
+    device.current_total_height = total_height
+    _page_worker['interpreter'].process_page(_page_worker['pages'][idx], _page_worker['max_width'])
+    page_infos = [(p.number, p.width, p.height) for p in collector._page_infos]
+    features, chars, offsets = collector._elements.get_arrays()
+    return (page_infos, features, chars, offsets)
 
 
 class ArthurPDFPage(PDFPage):
     @classmethod
-    def get_max_width(cls, text_io, pagenos = None):
+    def get_max_width(cls, pages):
+        """Gets max width of given pages from their mediaboxes.
+
+        Args:
+            pages: List of PDFPage objects, e.g. from :func:`PDFPage.create_pages`.
+        """
         max_width = 0
-        for page in cls.get_pages(text_io, pagenos):
+        for page in pages:
             (x0, y0, x1, y1) = page.mediabox
             width = x1 - x0
             if width > max_width:
                 max_width = width
         return max_width
 
-class ArthurPDFPageInterpreter(PDFPageInterpreter):
-    def process_page(self, page, max_width):
-        """Adds max_width to page processing method.
+    @classmethod
+    def get_ctm(cls, page):
+        """Gets current transformation matrix of a page, taking its rotation into account.
         """
-        if 1 <= self.debug:
-            print >>sys.stderr, 'Processing page: %r' % page
         (x0, y0, x1, y1) = page.mediabox
         if page.rotate == 90:
             ctm = (0, -1, 1, 0, -y0, x1)
@@ -71,6 +175,27 @@ class ArthurPDFPageInterpreter(PDFPageInterpreter):
             ctm = (0, 1, -1, 0, y1, -x0)
         else:
             ctm = (1, 0, 0, 1, -x0, -y0)
+        return ctm
+
+    @classmethod
+    def get_height(cls, page):
+        """Gets height of the LTPage a page will be laid out in, without laying it out.
+
+        Calculated the same way as :func:`PDFConverter.begin_page`.
+        """
+        ctm = cls.get_ctm(page)
+        (x0, y0, x1, y1) = page.mediabox
+        (x0, y0) = apply_matrix_pt(ctm, (x0, y0))
+        (x1, y1) = apply_matrix_pt(ctm, (x1, y1))
+        return LTPage(0, (0, 0, abs(x0-x1), abs(y0-y1))).height
+
+class ArthurPDFPageInterpreter(PDFPageInterpreter):
+    def process_page(self, page, max_width):
+        """Adds max_width to page processing method.
+        """
+        if 1 <= self.debug:
+            print >>sys.stderr, 'Processing page: %r' % page
+        ctm = ArthurPDFPage.get_ctm(page)
         self.device.begin_page(page, ctm)
         self.render_contents(page.resources, page.contents, ctm=ctm)
         self.device.end_page(page, max_width)
@@ -92,15 +217,15 @@ class ArthurPDFConverter(PDFConverter):
     >>> device = ArthurPDFConverter(rsrcmgr, outfp, laparams=laparams, imagewriter=imagewriter)
     >>> interpreter = ArthurPDFPageInterpreter(rsrcmgr, device)
 
-    >>> pagenos = set()
     >>> pdf_path = base_path + '/test/test.pdf'
     >>> f = open(pdf_path, 'rb')
     >>> text = f.read()
 
-    When get_pages is run, :func:`ArthurPDFConverter.receive_layout` is executed for each element.
-    >>> text_io = StringIO(text)
-    >>> max_width = ArthurPDFPage.get_max_width(text_io, pagenos)
-    >>> pages = PDFPage.get_pages(text_io, pagenos)
+    When a page is processed, :func:`ArthurPDFConverter.receive_layout` is executed for each element.
+    >>> document = open_pdf(text)
+    >>> pages = list(PDFPage.create_pages(document))
+    >>> max_width = ArthurPDFPage.get_max_width(pages)
+    >>> pages = iter(pages)
     >>> page = pages.next()
 
     By doing the above preparation, when we process the page,
@@ -0,0 +1,119 @@
+"""
+Module containing MWEMatcher class and the tokenizer it uses.
+
+Multi-word expressions (MWEs) are compiled once into a trie of words, then matched
+against texts in a single pass over their tokens.
+"""
+import re
+import numpy as np
+
+# Numbers (e.g. "2.24" or "1,200"), words, clitics following a word (e.g. "'s" in
+# "victoria's"), and runs of punctuation.
+# This mostly follows how corpus words (and so MWEs learned from them) are tokenized.
+TOKEN_PATTERN = re.compile(r"\d+(?:[.,]\d+)+|\w+|(?<=\w)'\w+|[^\w\s]+", re.UNICODE)
+
+def tokenize(text):
+    """Tokenizes text, keeping character offsets of each token.
+
+    >>> tokenize("Victoria's crown-jewel, 2.24 ac.")
+    [(0, 8), (8, 10), (11, 16), (16, 17), (17, 22), (22, 23), (24, 28), (29, 31), (31, 32)]
+
+    Args:
+        text(str): Text to tokenize.
+
+    Returns:
+        list: List of (start, end) offsets of tokens, i.e. token is `text[start:end]`.
+    """
+    return [match.span() for match in TOKEN_PATTERN.finditer(text)]
+
+class MWEMatcher(object):
+    """Matches multi-word expressions in texts.
+
+    MWEs are stored in a trie keyed by lowercased words, so matching a text takes one pass
+    over its tokens, whatever the number of MWEs. Like nltk's MWETokenizer, the longest MWE
+    starting at a token wins, and tokens not part of an MWE are expressions on their own.
+
+    >>> matcher = MWEMatcher(['crown jewel', ('waterfront', 'estates'), 'crown jewel of victoria'])
+    >>> text = "VICTORIA'S CROWN JEWEL OF WATERFRONT  ESTATES."
+    >>> starts, ends = matcher.match(text)
+    >>> [text[start:end] for start, end in zip(starts, ends)]
+    ['VICTORIA', "'S", 'CROWN JEWEL', 'OF', 'WATERFRONT  ESTATES', '.']
+
+    More MWEs can be added later:
+    >>> matcher.add(['jewel of'])
+    >>> len(matcher)
+    4
+    """
+
+    def __init__(self, mwes=[]):
+        """Initializes MWEMatcher instance.
+
+        Args:
+            mwes(list): List of MWEs. Each MWE is either a string (e.g. "property type") or
+                        a list or tuple of words (e.g. `('property', 'type')`).
+        """
+        self._trie = {}
+        self._count = 0
+        self.add(mwes)
+
+    def __len__(self):
+        return self._count
+
+    def add(self, mwes):
+        """Adds MWEs into the trie.
+
+        Args:
+            mwes(list): List of MWEs, see :func:`__init__`.
+        """
+        for mwe in mwes:
+            if isinstance(mwe, basestring):
+                lower = mwe.lower()
+                words = [lower[start:end] for start, end in tokenize(lower)]
+            else:
+                words = [word.lower() for word in mwe]
+            if len(words) == 0:
+                continue
+            node = self._trie
+            for word in words:
+                node = node.setdefault(word, {})
+            if None not in node:
+                node[None] = True
+                self._count += 1
+
+    def match(self, text):
+        """Finds expressions in text.
+
+        Args:
+            text(str): Text to find expressions in.
+
+        Returns:
+            tuple: (starts, ends) numpy arrays of character offsets, one per expression.
+        """
+        lower = text.lower()
+        spans = tokenize(lower)
+        words = [lower[start:end] for start, end in spans]
+        trie = self._trie
+        starts = []
+        ends = []
+        i = 0
+        total = len(words)
+        while i < total:
+            # Find the longest MWE starting at token i.
+            last = i
+            node = trie.get(words[i])
+            j = i
+            while node is not None:
+                if None in node:
+                    last = j
+                j += 1
+                if j >= total:
+                    break
+                node = node.get(words[j])
+            starts.append(spans[i][0])
+            ends.append(spans[last][1])
+            i = last + 1
+        return (np.array(starts, dtype=int), np.array(ends, dtype=int))
+
+if __name__ == '__main__':
+    import doctest
+    doctest.testmod()
@@ -0,0 +1,150 @@
+"""
+Module containing Pipeline class, which streams items through stages running in threads.
+"""
+import sys
+import threading
+from Queue import Queue, Empty, Full
+
+# Marks the end of items in a queue.
+_DONE = object()
+
+# Seconds to wait on a queue before checking whether the pipeline was stopped.
+_POLL_INTERVAL = 0.1
+
+class _Failure(object):
+    """Wraps an exception raised in a stage, so it can be passed down the queues.
+    """
+    def __init__(self, exc_info):
+        self.exc_info = exc_info
+
+class Pipeline(object):
+    """Streams items through a chain of stages, each running in its own thread.
+
+    Stages are connected with bounded queues, so at most `maxsize` items wait between two
+    stages and memory stays flat however many items go through. Since each stage has one
+    thread, items come out in the order they went in, and a stage may keep state without
+    locking. While one stage waits on I/O (e.g. reading a zip file or inserting into
+    database) the others keep working.
+
+    >>> pipeline = Pipeline([lambda x: x * 2, lambda x: x + 1], maxsize=2)
+    >>> list(pipeline.run(xrange(5)))
+    [1, 3, 5, 7, 9]
+
+    Exception raised in a stage stops the pipeline, and is raised again while consuming it:
+    >>> def check(x):
+    ...     if x == 2:
+    ...         raise ValueError('bad item')
+    ...     return x
+    >>> results = []
+    >>> try:
+    ...     for x in Pipeline([check]).run(xrange(5)):
+    ...         results.append(x)
+    ... except ValueError as e:
+    ...     print(e)
+    bad item
+    >>> results
+    [0, 1]
+
+    Attributes:
+        stages: List of functions, each taking an item and returning the item for next stage.
+        maxsize: Maximum number of items waiting between two stages.
+    """
+
+    def __init__(self, stages, maxsize=2):
+        """Initializes Pipeline instance.
+
+        Args:
+            stages(list): List of functions, see :attr:`stages`.
+            maxsize(int): See :attr:`maxsize`.
+        """
+        self.stages = list(stages)
+        self.maxsize = maxsize
+
+    def run(self, items):
+        """Runs items through all stages.
+
+        Items are read from `items` in a thread of their own, so `items` can be a generator
+        doing I/O.
+
+        Args:
+            items: Iterable of items to run.
+
+        Returns:
+            generator: Results of the last stage, in order of `items`.
+        """
+        stop = threading.Event()
+        queues = [Queue(self.maxsize) for _ in xrange(len(self.stages)+1)]
+        threads = [threading.Thread(target=self._feed, args=(items, queues[0], stop))]
+        for stage, inqueue, outqueue in zip(self.stages, queues, queues[1:]):
+            threads.append(threading.Thread(target=self._work, args=(stage, inqueue, outqueue, stop)))
+        for thread in threads:
+            thread.daemon = True
+            thread.start()
+        try:
+            while True:
+                result = queues[-1].get()
+                if result is _DONE:
+                    break
+                if isinstance(result, _Failure):
+                    raise result.exc_info[0], result.exc_info[1], result.exc_info[2]
+                yield result
+        finally:
+            stop.set()
+            for thread in threads:
+                thread.join()
+
+    def _feed(self, items, outqueue, stop):
+        """Puts items into the first queue.
+        """
+        try:
+            for item in items:
+                if not self._put(outqueue, item, stop):
+                    return
+        except Exception:
+            self._put(outqueue, _Failure(sys.exc_info()), stop)
+            return
+        self._put(outqueue, _DONE, stop)
+
+    def _work(self, stage, inqueue, outqueue, stop):
+        """Runs a stage over items from `inqueue`, putting its results into `outqueue`.
+        """
+        while True:
+            item = self._get(inqueue, stop)
+            if item is _DONE or isinstance(item, _Failure):
+                self._put(outqueue, item, stop)
+                return
+            try:
+                result = stage(item)
+            except Exception:
+                self._put(outqueue, _Failure(sys.exc_info()), stop)
+                return
+            if not self._put(outqueue, result, stop):
+                return
+
+    def _put(self, queue, item, stop):
+        """Puts item into queue, unless pipeline is stopped first.
+
+        Returns:
+            bool: False when pipeline was stopped.
+        """
+        while not stop.is_set():
+            try:
+                queue.put(item, timeout=_POLL_INTERVAL)
+                return True
+            except Full:
+                pass
+        return False
+
+    def _get(self, queue, stop):
+        """Gets item from queue, or :data:`_DONE` when pipeline is stopped first.
+        """
+        while not stop.is_set():
+            try:
+                return queue.get(timeout=_POLL_INTERVAL)
+            except Empty:
+                pass
+        return _DONE
+
+if __name__ == '__main__':
+    import doctest
+    doctest.testmod()
@@ -33,24 +33,40 @@ class ArthurProject():
         self.context = context
         self.docs = docs
 
-    def to_dict(self):
+    def to_dict(self, columnar=False, active_doc_pages=None):
         """Serializes this object to a python dictionary.
+
+        Args:
+            columnar(bool): Serialize elements of active document as one array per feature,
+                            see :func:`ArthurDocument.to_dict`.
+            active_doc_pages(list|None): Only include elements of these pages of active document.
+                                         Defaults to None, i.e. all pages.
         """
         active_doc = None
         if self.active_doc is not None:
-            active_doc = self.active_doc.to_dict(raw=False, with_details=True)
-
-        doclist = []
-        for doc in self.docs:
-            doclist.append(doc.to_dict(raw=False, with_details=False))
+            active_doc = self.active_doc.to_dict(raw=False, with_details=True, columnar=columnar,
+                                                 pages=active_doc_pages)
 
         obj = {
             'name': self.name,
             'active_doc': active_doc,
-            'docs': doclist
+            'docs': self.get_doc_summaries()
         }
         return obj
 
+    def get_doc_summaries(self):
+        """Gets summaries of all documents, i.e. their `to_dict(raw=False, with_details=False)`.
+
+        When :attr:`docs` can list summaries itself (e.g. a `ProjectDocs` of the app, loading
+        documents on demand), documents that were not used yet are not created for this.
+
+        Returns:
+            list: List of dicts.
+        """
+        if hasattr(self.docs, 'summaries'):
+            return self.docs.summaries()
+        return [doc.to_dict(raw=False, with_details=False) for doc in self.docs]
+
     def get_doc_infos(self, zipfile):
         """Gets all informations of documents inside given zip file.
 
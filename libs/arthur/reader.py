@@ -25,9 +25,12 @@ if __name__ == '__main__':
 from document import ArthurDocument
 from zipfile import ZipFile
 from errors import BatchReadingError
+from collocations import CollocationStore
 from scipy.spatial import cKDTree
-from helpers import unique_rows
+from multiprocessing import Pool
+from collections import deque
 import numpy as np
+import traceback
 import os
 
 def read(document, clusterer, project_id=None):
@@ -70,13 +73,10 @@ def read(document, clusterer, project_id=None):
     Returns:
         list: Data fields
     """
-    textboxes = __extract_textboxes(document)
     data_fields = []
     counter = 0
-    for textbox_id, textbox in enumerate(textboxes):
+    for ctextbox in __extract_clean_textboxes(document):
         counter += 1
-        remove = __find_duplicates(textbox)
-        ctextbox = np.delete(textbox, remove, axis=0)
         for exp in clusterer.extract_expressions(document, ctextbox):
             data_fields.append({
                 'id': counter,
@@ -92,8 +92,19 @@ def read(document, clusterer, project_id=None):
 
     return data_fields
 
-def create_corpus(zip_path, corpus_dir, batch_size=100, start_batch=0, stdout=None, overwrite=False):
+def create_corpus(zip_path, corpus_dir, batch_size=100, start_batch=0, stdout=None, overwrite=False, processes=None,
+                  on_batch=None):
     """Create corpus from zip file. A corpus is basically just a list of text files.
+
+    When `processes` is given, documents of each batch are fanned out to a pool of worker
+    processes. Each worker opens the zip file itself and reads one member at a time, so
+    only `processes` documents are held in memory at once, and at most `2*processes` texts
+    wait to be counted. Progress is still written to stdout in the order of the zip file's
+    members.
+
+    N-gram counts of the corpus (see :class:`collocations.CollocationStore`) are updated
+    as files are written, and saved after each batch.
+
     Args:
         zip_path(str):    Path of zip file to load.
         corpus_dir(str):  Path to corpus dir where the files will be written into.
@@ -105,54 +116,199 @@ def create_corpus(zip_path, corpus_dir, batch_size=100, start_batch=0, stdout=No
         stdout(Object):   Pass sys.stdout to print progress, or pass any object with `write`
                           method to pass printed progress to it.
         overwrite(bool):  Overwrite files as they are created?
+        processes(int):   Number of worker processes to build corpus with. Defaults to None,
+                          i.e. build corpus in this process.
+        on_batch(function): Called with the index of the next batch after each batch is done,
+                          e.g. to save it as `start_batch` of a resumed run.
+
+    Raises:
+        BatchReadingError: When a document in a batch could not be processed. Its `last_batch`
+                           can be passed as `start_batch` to resume from that batch.
     """
     zipfile = ZipFile(zip_path, 'r')
     namelist = zipfile.namelist()
     jobs_total = len(namelist)
     jobs_left = jobs_total - start_batch*batch_size
-    
-    def process_batch(zipfile, corpus_dir, batch, total, counter=0):
+
+    if not os.path.exists(corpus_dir):
+        os.makedirs(corpus_dir)
+    collocations = CollocationStore.open(corpus_dir)
+
+    pool = None
+    if processes is not None and processes > 1:
+        pool = Pool(processes, initializer=_init_corpus_worker, initargs=(zip_path,))
+
+    def write(message):
+        if stdout is not None:
+            stdout.write(message)
+
+    def process_batch(zipfile, corpus_dir, batch, batch_index, total, counter=0):
+        tasks = []
+        skipped = []
         for docname in batch:
-            counter += 1
-            if not os.path.exists(corpus_dir):
-                os.makedirs(corpus_dir)
             filename = os.path.join(corpus_dir, docname+'.txt')
-            if os.path.isfile(filename) and not overwrite:
-                if stdout is not None:
-                    stdout.write("%s already exists (%i/%i)\n" % (docname, counter, total))
-            else:
-                content = zipfile.read(docname)
-                if stdout is not None:
-                    stdout.write("processing %s (%i/%i)\n" % (docname, counter, total))
-                document = ArthurDocument(content, name=docname)
-
-                textboxes = __extract_textboxes(document)
-
-                texts = []
-                for idx, textbox in enumerate(textboxes):
-                    remove = __find_duplicates(textbox)
-                    ctextbox = np.delete(textbox, remove, axis=0)
-                    texts.append(document.get_text(ctextbox))
-
-                if len(texts) > 0:
-                    if not os.path.isdir(corpus_dir):
-                        os.mkdir(corpus_dir)
-
-                    with open(filename,'w') as fout:
-                        for text in texts:
-                            print>>fout, text
+            exists = os.path.isfile(filename)
+            skip = exists and not overwrite
+            skipped.append(skip)
+            if not skip:
+                # Counts of a file being overwritten are subtracted while it still exists.
+                if exists and docname+'.txt' in collocations.fileids:
+                    with open(filename, 'rb') as f:
+                        collocations.remove_text(docname+'.txt', f.read())
+                tasks.append((docname, filename))
+
+        if pool is None:
+            results = (_build_corpus_file(docname, filename, zipfile) for docname, filename in tasks)
+        else:
+            results = _imap_bounded(pool, _build_corpus_file_worker, tasks, 2*processes)
+
+        try:
+            for docname, skip in zip(batch, skipped):
+                counter += 1
+                if skip:
+                    write("%s already exists (%i/%i)\n" % (docname, counter, total))
+                    continue
+                write("processing %s (%i/%i)\n" % (docname, counter, total))
+                _, text, error = next(results)
+                if error is not None:
+                    raise BatchReadingError(batch_index, "Error processing %s:\n%s" % (docname, error))
+                if text:
+                    collocations.add_text(docname+'.txt', text)
                 else:
-                    if stdout is not None:
-                        stdout.write("    empty text! moving on...\n")
+                    write("    empty text! moving on...\n")
+        finally:
+            collocations.save()
+
+    try:
+        while jobs_left > 0:
+            job_start = jobs_total - jobs_left
+            job_end = job_start + batch_size
+            batch = namelist[job_start:job_end]
+            process_batch(zipfile, corpus_dir, batch, job_start // batch_size, jobs_total, job_start)
+            jobs_left -= batch_size
+            if on_batch is not None:
+                on_batch(job_start // batch_size + 1)
+        if pool is not None:
+            pool.close()
+    except:
+        if pool is not None:
+            pool.terminate()
+        raise
+    finally:
+        if pool is not None:
+            pool.join()
+        zipfile.close()
+
+def _build_corpus_file(docname, filename, zipfile):
+    """Builds a corpus text file from a document inside a zip file.
+
+    Args:
+        docname(str): Name of document in the zip file.
+        filename(str): Path of corpus text file to write.
+        zipfile(ZipFile): Opened zip file containing the document.
+
+    Returns:
+        tuple: (docname, text, error). `text` is the written text, empty when the document
+               has no text, and `error` is the traceback when the document could not be
+               processed. Tracebacks are returned as text since they can't be pickled back
+               from a worker process.
+    """
+    try:
+        content = zipfile.read(docname)
+        document = ArthurDocument(content, name=docname)
+        del content
+        return (docname, write_corpus_file(document, filename), None)
+    except Exception:
+        return (docname, None, traceback.format_exc())
+
+def write_corpus_file(document, filename):
+    """Writes texts of a document's (clean) textboxes into a corpus text file, one per line.
 
-    while jobs_left > 0:
-        job_start = jobs_total - jobs_left
-        job_end = job_start + batch_size
-        batch = namelist[job_start:job_end]
-        process_batch(zipfile, corpus_dir, batch, jobs_total, job_start)
-        jobs_left -= batch_size
+    Nothing is written when the document has no text.
 
-    zipfile.close()
+    Args:
+        document(ArthurDocument): Parsed document.
+        filename(str): Path of corpus text file to write.
+
+    Returns:
+        str: The written text, empty when the document has no text.
+    """
+    texts = []
+    for ctextbox in __extract_clean_textboxes(document):
+        texts.append(document.get_text(ctextbox))
+
+    if len(texts) == 0:
+        return ''
+    with open(filename,'w') as fout:
+        for text in texts:
+            print>>fout, text
+    return ''.join(text+'\n' for text in texts)
+
+# State of a corpus worker process, set up by :func:`_init_corpus_worker`.
+_corpus_worker = {}
+
+def _init_corpus_worker(zip_path):
+    """Opens the zip file once per worker process.
+    """
+    _corpus_worker['zipfile'] = ZipFile(zip_path, 'r')
+
+def _build_corpus_file_worker(task):
+    """Runs :func:`_build_corpus_file` in a worker process.
+
+    Args:
+        task: Tuple of (docname, filename).
+    """
+    docname, filename = task
+    return _build_corpus_file(docname, filename, _corpus_worker['zipfile'])
+
+def _imap_bounded(pool, func, tasks, window):
+    """Like `pool.imap`, but submits a task only when fewer than `window` results are waiting
+    to be consumed, instead of queueing all tasks at once and buffering their results.
+
+    >>> from multiprocessing.pool import ThreadPool
+    >>> pool = ThreadPool(2)
+    >>> list(_imap_bounded(pool, abs, [-1, 2, -3, 4, -5], 2))
+    [1, 2, 3, 4, 5]
+    >>> pool.close()
+
+    Args:
+        pool(Pool): Pool of workers.
+        func(function): Function to call with each task.
+        tasks(iterable): Arguments of func.
+        window(int): Maximum number of submitted tasks whose results were not yet consumed.
+
+    Returns:
+        generator: Results of func, in order of tasks.
+    """
+    pending = deque()
+    for task in tasks:
+        pending.append(pool.apply_async(func, (task,)))
+        if len(pending) >= window:
+            yield pending.popleft().get()
+    while len(pending) > 0:
+        yield pending.popleft().get()
+
+def __extract_clean_textboxes(document):
+    """Extract textboxes from document, with their duplicates and images removed.
+
+    Elements to keep are found once for the whole document (see :func:`__get_keep_mask`),
+    then applied to each textbox.
+
+    Args:
+        document(ArthurDocument): ArthurDocument instance textboxes will be extracted from.
+
+    Returns:
+        list: List of cleaned textboxes.
+    """
+    features = document.get_features()
+    if len(features) == 0:
+        return []
+    order, boundaries = __sort_textboxes(features)
+    keep = __get_keep_mask(document)[order]
+    textboxes = []
+    for textbox, textbox_keep in zip(np.split(features[order], boundaries), np.split(keep, boundaries)):
+        textboxes.append(textbox[textbox_keep])
+    return textboxes
 
 def __extract_textboxes(document):
     """Extract textboxes from document.
@@ -161,30 +317,47 @@ def __extract_textboxes(document):
     In ArthurDocument a textbox is just a set of features happen to have the same textbox_id. Different document
     type may have different configurations and approaches to this.
 
+    Features are grouped in a single pass: one sort by (page, textbox_id) followed by a split,
+    so textboxes are views of one sorted copy of the features.
+
     Args:
         document(ArthurDocument): ArthurDocument instance textboxes will be extracted from.
 
     Returns:
-        list: List of textboxes i.e. grouped features from document.
+        list: List of textboxes i.e. grouped features from document, ordered by page then textbox_id.
     """
     features = document.get_features()
-    page_feature_id = ArthurDocument.get_feature_id('page')
-    textbox_feature_id = ArthurDocument.get_feature_id('textbox_id')
+    if len(features) == 0:
+        return []
+    order, boundaries = __sort_textboxes(features)
+    return np.split(features[order], boundaries)
 
-    page_textbox_pairs = features[:, [page_feature_id, textbox_feature_id]]
-    unique_page_textbox_pairs = unique_rows(page_textbox_pairs)
-    textboxes = []
-    for page, textbox_id in unique_page_textbox_pairs:
-        textbox = features[np.where(
-            (features[:, page_feature_id]==page) * 
-            (features[:, textbox_feature_id]==textbox_id)
-        )]
-        textboxes.append(textbox)
-    return textboxes
+def __sort_textboxes(features):
+    """Sorts features by textbox.
+
+    Stable sort by (page, textbox_id) keeps features of each textbox in their original order.
+
+    Args:
+        features(np.array): Features of a document.
+
+    Returns:
+        tuple: (order, boundaries). `features[order]` split at `boundaries` gives the textboxes.
+    """
+    pages = features[:, ArthurDocument.get_feature_id('page')]
+    textbox_ids = features[:, ArthurDocument.get_feature_id('textbox_id')]
+    order = np.lexsort((textbox_ids, pages))
+    sorted_pages = pages[order]
+    sorted_textbox_ids = textbox_ids[order]
+    boundaries = np.flatnonzero((sorted_pages[1:] != sorted_pages[:-1]) |
+                                (sorted_textbox_ids[1:] != sorted_textbox_ids[:-1])) + 1
+    return (order, boundaries)
+
+def __get_keep_mask(document):
+    """Gets which elements of a document are kept when reading it.
+
+    Duplicated glyphs and images are not kept. The mask is computed once and cached on
+    the document, so all readers of a document share it.
 
-def __find_duplicates(features):
-    """Finds duplicates of a set of features.
-    
     Example of usage
     >>> pdf_path = os.path.join(base_path, 'test', 'test.pdf')
     >>> f = open(pdf_path, 'rb')
@@ -193,43 +366,68 @@ def __find_duplicates(features):
     >>> print(document.get_text(textboxes[11]))
     Property TypeProperty Type Property TypeProperty Type Single Family
 
-    >>> remove_indexes = __find_duplicates(textboxes[11])
-    >>> cfeatures = np.delete(textboxes[11], remove_indexes, axis=0)
+    >>> keep = __get_keep_mask(document)
+    >>> keep.dtype, len(keep) == len(document.get_features())
+    (dtype('bool'), True)
+    >>> __get_keep_mask(document) is keep
+    True
+
+    >>> cfeatures = __extract_clean_textboxes(document)[11]
     >>> print(document.get_text(cfeatures))
     Property Type Single Family
 
     Args:
-        features(np.array): List of features to find duplicates of.
+        document(ArthurDocument): Document to get the mask of.
 
     Returns:
-        list: Returns a tuple of corrected block and removed indexes.
+        np.array: Boolean array, True for each element (i.e. row of features) to keep.
     """
-    fxid = ArthurDocument.get_feature_id('x')
-    fyid = ArthurDocument.get_feature_id('y')
-    positions = features[:,[fxid,fyid]]
-    tree = cKDTree(positions)
-
-    # Removes duplicate elements that are close together
-    radius = 0.4
-    neighbors = tree.query_ball_point(positions, radius)
-    neighbors = np.unique(neighbors)
-    # This returns numpy array like:
-    # [[0, 13, 26, 39] [1, 14, 27, 40] [5, 31, 44, 18] [11, 24, 37, 50]
-    # [16, 29, 42, 3] [17, 30, 43, 4] [21, 8, 34, 47] [22, 35, 48, 9]
-    # [32, 45, 19, 6] [36, 23, 10, 49] [38, 12, 25, 51] [41, 28, 2, 15]
-    # [46, 33, 7, 20] [52] [53] [54] [55] [56] [57] [58] [59] [60] [61] [62]
-    # [63] [64]]
-    #
-    # Which we will then remove duplicates e.g. remove index 13, 26, 39, 14, 27, etc.
-    removed = []
-    for n in neighbors:
-        removed.extend(np.sort(n)[1:])
-    
-    # Removes image elements
-    removed.extend(np.where(features[:,ArthurDocument.get_feature_id('img_width')] != -1)[0].tolist())
-
-    return removed
-    
+    def create(document):
+        features = document.get_features()
+        images = features[:, ArthurDocument.get_feature_id('img_width')] != -1
+        return ~(__find_duplicates(features) | images)
+    return document.get_derived('reader_keep_mask', create)
+
+def __find_duplicates(features, radius=0.4):
+    """Finds duplicated glyphs in features of a whole document.
+
+    An element is a duplicate when an earlier element of the same textbox lies within `radius`
+    of it, e.g. characters printed over themselves to look bold. Only the first element
+    of such a group is not a duplicate.
+
+    One spatial index is built per page, and close pairs are found in a single query.
+
+    >>> features = np.zeros([4, len(ArthurDocument.get_feature_names())])
+    >>> features[:, ArthurDocument.get_feature_id('x')] = [1., 1.1, 5., 1.]
+    >>> features[:, ArthurDocument.get_feature_id('page')] = [1, 1, 1, 2]
+    >>> __find_duplicates(features)
+    array([False,  True, False, False])
+
+    Args:
+        features(np.array): Features of a document.
+        radius(float): Elements closer than this are duplicates.
+
+    Returns:
+        np.array: Boolean array, True for each duplicated element.
+    """
+    duplicates = np.zeros(len(features), dtype=bool)
+    pages = features[:, ArthurDocument.get_feature_id('page')]
+    textbox_ids = features[:, ArthurDocument.get_feature_id('textbox_id')]
+    positions = features[:, [ArthurDocument.get_feature_id('x'), ArthurDocument.get_feature_id('y')]]
+    for page in np.unique(pages):
+        ids = np.flatnonzero(pages == page)
+        if len(ids) < 2:
+            continue
+        tree = cKDTree(positions[ids])
+        pairs = tree.query_pairs(radius, output_type='ndarray')
+        if len(pairs) == 0:
+            continue
+        # Pairs are (i, j) with i < j, i.e. j is the later element.
+        pairs = ids[pairs]
+        same_textbox = textbox_ids[pairs[:, 0]] == textbox_ids[pairs[:, 1]]
+        duplicates[pairs[same_textbox, 1]] = True
+    return duplicates
+
 if __name__ == '__main__':
     import doctest
     doctest.testmod()
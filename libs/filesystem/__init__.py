@@ -1 +1,4 @@
-from base import Filesystem
\ No newline at end of file
+from base import Filesystem
+from zip_index import ZipIndex
+from remote_file import RemoteFile
+from local_cache import LocalCache
\ No newline at end of file
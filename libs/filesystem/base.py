@@ -4,17 +4,25 @@ adapter to either connect to 3rd party storage servers like Amazon S3
 or use local filesystem.
 """
 from contextlib import contextmanager
-import boto3
+from collections import OrderedDict
 import io
+import threading
 import os, errno
 import ConfigParser
 from zipfile import ZipFile
 import mimetypes
+from zip_index import ZipIndex
+from remote_file import RemoteFile
+from local_cache import LocalCache
+
+# Number of zip indexes kept by a Filesystem, least recently used ones are dropped beyond it.
+MAX_ZIP_INDEXES = 32
 
 class Filesystem():
     """Filesystem class
     """
-    def __init__(self, connect_to=None, config_file=None, bucket_name=None, rootdir='', tmpdir='tmp'):
+    def __init__(self, connect_to=None, config_file=None, bucket_name=None, rootdir='', tmpdir='tmp',
+                 cache_size=None, cache_age=None, endpoint_url=None):
         """Initialize Filesystem instance.
 
         Args:
@@ -26,17 +34,53 @@ class Filesystem():
             tmpdir(str): Directory location where files from remote storage will be temporarily stored.
                          Name of file stored will be its md5. Directory is cleaned up periodically and in
                          each build.
+            cache_size(int|None): Maximum total size in bytes of files kept in tmpdir. Least recently
+                                  used files are removed beyond it. None for no limit.
+            cache_age(int|None): Seconds a file in tmpdir may stay unused before it is removed.
+                                 None for no limit.
+            endpoint_url(str|None): Endpoint of remote storage, to use an S3 compatible server
+                                    (e.g. a local minio) instead of Amazon S3.
         """
-        self.s3 = None
+        self._s3 = None
+        self._bucket = None
+        self._connect_lock = threading.Lock()
+        self._zip_indexes = OrderedDict()
+        self._zip_indexes_lock = threading.Lock()
         self.connect_to = connect_to
+        self.bucket_name = bucket_name
+        self.endpoint_url = endpoint_url
         self.rootdir = rootdir
         self.tmpdir = tmpdir
-        if connect_to == 'aws-s3':
-            if config_file != None:
-                os.environ['AWS_CONFIG_FILE'] = config_file
-                os.environ['AWS_SHARED_CREDENTIALS_FILE'] = config_file
-            self.s3 = boto3.resource('s3')
-            self.bucket = self.s3.Bucket(bucket_name)
+        self.cache = LocalCache(tmpdir, max_size=cache_size, max_age=cache_age)
+        if connect_to == 'aws-s3' and config_file != None:
+            os.environ['AWS_CONFIG_FILE'] = config_file
+            os.environ['AWS_SHARED_CREDENTIALS_FILE'] = config_file
+
+    @property
+    def remote(self):
+        """Whether files are kept in remote storage.
+        """
+        return self.connect_to == 'aws-s3'
+
+    @property
+    def s3(self):
+        """S3 resource, or None for local filesystem. boto3 is imported and the resource created on
+        first use, as importing it takes a noticeable part of server's start up.
+        """
+        if self._s3 is None and self.remote:
+            with self._connect_lock:
+                if self._s3 is None:
+                    import boto3
+                    s3 = boto3.resource('s3', endpoint_url=self.endpoint_url)
+                    self._bucket = s3.Bucket(self.bucket_name)
+                    self._s3 = s3
+        return self._s3
+
+    @property
+    def bucket(self):
+        """Bucket in remote storage, or None for local filesystem.
+        """
+        return self._bucket if self.s3 is not None else None
 
     @contextmanager
     def get_path(self, path="", base_dir=""):
@@ -70,24 +114,92 @@ class Filesystem():
         Returns:
             string: Path usable in both local and remote scenarios.
         """
-        if self.s3 != None:
+        if self.remote:
             s3path = self.key_from_path(path, base_dir)
             obj = self.bucket.Object(key=s3path)
-            try:
-                os.makedirs(self.tmpdir)
-            except OSError, e:
-                if e.errno != errno.EEXIST:
-                    raise
-            md5 = obj.get()['ETag'].replace('"', '')
-            ext = mimetypes.guess_extension(obj.get()['ContentType'])
+            # One HEAD request for both ETag and content type, instead of fetching the object.
+            obj.load()
+            md5 = obj.e_tag.replace('"', '')
+            ext = mimetypes.guess_extension(obj.content_type) or ''
             filename = "%s%s" % (md5,ext)
-            localpath = os.path.join(self.tmpdir, filename)
-            if not os.path.exists(localpath):
-                self.bucket.download_file(s3path, localpath)
-            yield localpath
+            # Concurrent requests of the same object share a single download. The file is
+            # pinned, so other threads adding files to the cache don't remove it while in use.
+            with self.cache.pinned(filename, lambda tmp_path: self.bucket.download_file(s3path, tmp_path)) as tmp_path:
+                yield tmp_path
         else:
             yield path
 
+    def get_version(self, path="", base_dir=""):
+        """Get a value that changes whenever the file at path changes.
+
+        This is the ETag of the object in remote storage, or the modification time and size
+        of a local file.
+
+        Args:
+            path(string): See :func:`get_path`.
+            base_dir(string): See :func:`get_path`.
+
+        Raises:
+            OSError: When local file does not exist.
+        """
+        if self.remote:
+            obj = self.bucket.Object(key=self.key_from_path(path, base_dir))
+            obj.load()
+            return obj.e_tag
+        stat = os.stat(path)
+        return (stat.st_mtime, stat.st_size)
+
+    def get_zip_index(self, path="", base_dir=""):
+        """Get a ZipIndex of the zip file at path.
+
+        Indexes are kept per path, and only recreated when the file's version (see
+        :func:`get_version`) changes, so members of an unchanged zip file can be counted,
+        listed and read without parsing its central directory again. Only the
+        :data:`MAX_ZIP_INDEXES` most recently used indexes are kept.
+
+        A remote zip file is never downloaded whole: its central directory and members are
+        read with range requests (see :class:`RemoteFile`), and members read are kept in
+        tmpdir.
+
+        >>> import tempfile
+        >>> fs = Filesystem()
+        >>> path = tempfile.mktemp(suffix='.zip')
+        >>> with ZipFile(path, 'w') as zipfile:
+        ...     zipfile.writestr('test.txt', 'test')
+        >>> index = fs.get_zip_index(path)
+        >>> index.read('test.txt')
+        'test'
+        >>> fs.get_zip_index(path) is index
+        True
+        >>> os.remove(path)
+
+        Args:
+            path(string): See :func:`get_path`.
+            base_dir(string): See :func:`get_path`.
+
+        Returns:
+            ZipIndex: Index of the zip file.
+        """
+        if self.remote:
+            obj = self.bucket.Object(key=self.key_from_path(path, base_dir))
+            obj.load()
+            version = obj.e_tag
+            source = lambda: RemoteFile(obj, obj.content_length)
+            cache = self.cache
+        else:
+            version = self.get_version(path, base_dir)
+            source = path
+            cache = None
+        with self._zip_indexes_lock:
+            index = self._zip_indexes.pop(path, None)
+        if index is None or index.version != version:
+            index = ZipIndex(source, version=version, cache=cache)
+        with self._zip_indexes_lock:
+            self._zip_indexes[path] = index
+            while len(self._zip_indexes) > MAX_ZIP_INDEXES:
+                self._zip_indexes.popitem(last=False)
+        return index
+
     def key_from_path(self, path="", base_dir=""):
         """Turn path into key to use in 3rd party storage.
 
@@ -0,0 +1,343 @@
+"""
+This module contains LocalCache class, a size-bounded cache of files in a local directory.
+"""
+import os, errno
+from contextlib import contextmanager
+import shutil
+import tempfile
+import threading
+import time
+
+TMP_PREFIX = '.tmp-'
+
+class LocalCache():
+    """Least recently used files kept in a local directory, up to a total size and age.
+
+    Files are keyed by name (e.g. ETag of a remote object). Getting a file marks it as used,
+    and adding a file evicts least recently used files until all files fit in `max_size`.
+    Files used by this process are ordered by their last use, and the rest (e.g. cached by
+    a previous run) by modification time, before all files used by this process.
+
+    >>> directory = tempfile.mkdtemp()
+    >>> cache = LocalCache(directory, max_size=10)
+    >>> cache.get('a') is None
+    True
+    >>> path = cache.put('a', '12345')
+    >>> open(cache.get('a')).read()
+    '12345'
+    >>> path = cache.put('b', '12345')
+    >>> cache.get('a') is not None
+    True
+
+    Adding more than `max_size` evicts least recently used file, i.e. "b" since "a" was used after it:
+    >>> path = cache.put('c', '123')
+    >>> cache.get('b') is None, cache.get('a') is None, cache.get('c') is None
+    (True, False, False)
+
+    Use :func:`fetch` to write a file only when it is not cached yet. Threads fetching the
+    same key at once wait for a single write:
+    >>> writes = []
+    >>> def download(tmp_path):
+    ...     writes.append(tmp_path)
+    ...     time.sleep(0.1)
+    ...     with open(tmp_path, 'wb') as f:
+    ...         f.write('data')
+    >>> threads = [threading.Thread(target=cache.fetch, args=('d', download)) for i in range(3)]
+    >>> for thread in threads: thread.start()
+    >>> for thread in threads: thread.join()
+    >>> len(writes), open(cache.get('d')).read()
+    (1, 'data')
+
+    Hits and misses are counted for monitoring. Threads that waited for another thread's write
+    count as misses without a write:
+    >>> stats = cache.stats()
+    >>> stats['hits'], stats['misses'], stats['writes'], stats['evictions']
+    (5, 5, 4, 2)
+
+    A file used with :func:`pinned` is not evicted until the with block ends, even when
+    other files are added meanwhile:
+    >>> with cache.pinned('e', lambda tmp_path: open(tmp_path, 'wb').write('1234567890')) as path:
+    ...     added = cache.put('f', '12345')
+    ...     os.path.isfile(path)
+    True
+    >>> cache.evict()
+    >>> cache.get('e') is None, cache.get('f') is None
+    (True, False)
+    >>> shutil.rmtree(directory)
+
+    Attributes:
+        directory: Directory containing cached files.
+        max_size: Maximum total size of cached files in bytes. None for no limit.
+        max_age: Seconds a cached file may stay unused before it is evicted. None for no limit.
+        hits: Number of lookups that found a cached file.
+        misses: Number of lookups that did not find a cached file.
+        writes: Number of files written into the cache.
+        evictions: Number of files evicted.
+    """
+    def __init__(self, directory, max_size=None, max_age=None):
+        """Initializes object.
+
+        Args:
+            directory(str): See :attr:`directory`.
+            max_size(int): See :attr:`max_size`.
+            max_age(int): See :attr:`max_age`.
+        """
+        self.directory = directory
+        self.max_size = max_size
+        self.max_age = max_age
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        self.evictions = 0
+        self._uses = {}
+        self._use_count = 0
+        # Reentrant, as files are removed while holding it, see :func:`_remove_unpinned`.
+        self._lock = threading.RLock()
+        self._key_locks = {}
+        self._pins = {}
+
+    def path(self, key):
+        """Gets path where file with given key is (or would be) cached.
+        """
+        return os.path.join(self.directory, key)
+
+    def get(self, key):
+        """Gets path of a cached file, marking it as recently used.
+
+        Returns:
+            str: Path of cached file, or None when not cached or expired.
+        """
+        path = self._lookup(key)
+        with self._lock:
+            if path is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return path
+
+    def fetch(self, key, write):
+        """Gets path of a cached file, writing it first when it is not cached.
+
+        Only one thread writes a key at a time. Other threads fetching the same key wait for
+        it, then use the file it wrote.
+
+        Args:
+            key(str): Key of file.
+            write(function): Function taking a path to write the file into, see :func:`add`.
+
+        Returns:
+            str: Path of cached file.
+        """
+        path = self.get(key)
+        if path is not None:
+            return path
+        with self._locked(key):
+            path = self._lookup(key)
+            if path is None:
+                path = self.add(key, write)
+        return path
+
+    @contextmanager
+    def pinned(self, key, write):
+        """Gets path of a cached file like :func:`fetch`, keeping the file from being evicted
+        by this process until the with block ends, e.g. while it is read.
+
+        Args:
+            key(str): Key of file.
+            write(function): Function taking a path to write the file into, see :func:`add`.
+
+        Returns:
+            str: Path of cached file.
+        """
+        path = self.path(key)
+        # Pinned before the lookup, so the file can't be evicted between lookup and use.
+        with self._lock:
+            self._pins[path] = self._pins.get(path, 0) + 1
+        try:
+            yield self.fetch(key, write)
+        finally:
+            with self._lock:
+                self._pins[path] -= 1
+                if self._pins[path] == 0:
+                    del self._pins[path]
+
+    def put(self, key, data):
+        """Caches data as a file.
+
+        Returns:
+            str: Path of cached file.
+        """
+        def write(tmp_path):
+            with open(tmp_path, 'wb') as f:
+                f.write(data)
+        return self.add(key, write)
+
+    def add(self, key, write):
+        """Caches a file written by a function, e.g. a download.
+
+        The file is written into a temporary path first, then moved into place, so
+        a partially written file is never returned by :func:`get`.
+
+        Args:
+            key(str): Key of file.
+            write(function): Function taking a path to write the file into.
+
+        Returns:
+            str: Path of cached file.
+        """
+        self._makedirs()
+        fd, tmp_path = tempfile.mkstemp(prefix=TMP_PREFIX, dir=self.directory)
+        os.close(fd)
+        try:
+            write(tmp_path)
+            path = self.path(key)
+            os.rename(tmp_path, path)
+        except:
+            os.remove(tmp_path)
+            raise
+        with self._lock:
+            self.writes += 1
+            self._use(path)
+        self.evict(keep=path)
+        return path
+
+    def evict(self, keep=None):
+        """Removes expired files, then least recently used files until cached files fit in
+        :attr:`max_size`. Files pinned by :func:`pinned` are skipped.
+
+        Temporary files left by interrupted writes are removed once older than :attr:`max_age`.
+
+        Args:
+            keep(str): Path of a file to never evict, e.g. the one just added.
+        """
+        if self.max_size is None and self.max_age is None:
+            return
+        now = time.time()
+        files = []
+        total = 0
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            if not os.path.isfile(path):
+                continue
+            expired = self.max_age is not None and now - stat.st_mtime > self.max_age
+            if name.startswith(TMP_PREFIX):
+                if expired:
+                    self._remove(path, evicted=False)
+                continue
+            if expired and path != keep and self._remove_unpinned(path):
+                continue
+            files.append(((self._uses.get(path, 0), stat.st_mtime), path, stat.st_size))
+            total += stat.st_size
+        if self.max_size is None:
+            return
+        files.sort()
+        for _, path, size in files:
+            if total <= self.max_size:
+                break
+            if path != keep and self._remove_unpinned(path):
+                total -= size
+
+    def stats(self):
+        """Gets counters and current size of the cache, for monitoring.
+
+        Returns:
+            dict: Counters (see attributes), plus `files` and `size` of cached files in bytes.
+        """
+        files = 0
+        size = 0
+        if os.path.isdir(self.directory):
+            for name in os.listdir(self.directory):
+                path = os.path.join(self.directory, name)
+                if name.startswith(TMP_PREFIX) or not os.path.isfile(path):
+                    continue
+                files += 1
+                size += os.path.getsize(path)
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'writes': self.writes,
+            'evictions': self.evictions,
+            'files': files,
+            'size': size
+        }
+
+    def _lookup(self, key):
+        """Gets path of a cached file like :func:`get`, without counting a hit or miss.
+        """
+        path = self.path(key)
+        try:
+            if self.max_age is not None and time.time() - os.path.getmtime(path) > self.max_age \
+                    and self._remove_unpinned(path):
+                return None
+            os.utime(path, None)
+        except OSError as e:
+            if e.errno == errno.ENOENT:
+                return None
+            raise
+        with self._lock:
+            self._use(path)
+        return path
+
+    @contextmanager
+    def _locked(self, key):
+        """Holds the lock of a key. Locks are dropped once no thread holds or waits for them.
+        """
+        with self._lock:
+            if key not in self._key_locks:
+                self._key_locks[key] = [threading.Lock(), 0]
+            key_lock = self._key_locks[key]
+            key_lock[1] += 1
+        try:
+            with key_lock[0]:
+                yield
+        finally:
+            with self._lock:
+                key_lock[1] -= 1
+                if key_lock[1] == 0:
+                    del self._key_locks[key]
+
+    def _remove(self, path, evicted=True):
+        """Removes a cached file, unless it was already removed (e.g. by another process).
+        """
+        try:
+            os.remove(path)
+        except OSError as e:
+            if e.errno != errno.ENOENT:
+                raise
+            return
+        with self._lock:
+            self._uses.pop(path, None)
+            if evicted:
+                self.evictions += 1
+
+    def _remove_unpinned(self, path):
+        """Removes a cached file unless it is pinned. Pins are checked and the file removed
+        under the lock :func:`pinned` pins with, so a file is never removed once pinned.
+
+        Returns:
+            bool: True when file was removed (or already gone).
+        """
+        with self._lock:
+            if path in self._pins:
+                return False
+            self._remove(path)
+            return True
+
+    def _use(self, path):
+        self._use_count += 1
+        self._uses[path] = self._use_count
+
+    def _makedirs(self):
+        try:
+            os.makedirs(self.directory)
+        except OSError as e:
+            if e.errno != errno.EEXIST:
+                raise
+
+if __name__ == '__main__':
+    import doctest
+    doctest.testmod()
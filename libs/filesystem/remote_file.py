@@ -0,0 +1,98 @@
+"""
+This module contains RemoteFile class, a read-only file object over HTTP range reads.
+"""
+import os
+
+class RemoteFile():
+    """Seekable, read-only file object reading an S3 object with range requests.
+
+    Only the requested ranges are transferred, so e.g. ZipFile can read the central directory
+    and a single member of a large remote zip file without downloading all of it. Each
+    request reads at least `readahead` bytes, and the last response is kept in memory, so
+    small sequential reads (like a zip member's header followed by its data) usually take
+    a single request.
+
+    Any object with `get(Range=...)` returning a dict with 'Body' works, e.g. a boto3 S3 Object
+    or this local stand-in:
+    >>> import io
+    >>> class LocalObject(object):
+    ...     def __init__(self, data):
+    ...         self.data = data
+    ...         self.content_length = len(data)
+    ...         self.requests = []
+    ...     def get(self, Range):
+    ...         start, end = [int(x) for x in Range[len('bytes='):].split('-')]
+    ...         self.requests.append((start, end))
+    ...         return {'Body': io.BytesIO(self.data[start:end+1])}
+    >>> obj = LocalObject('0123456789' * 10)
+    >>> f = RemoteFile(obj, obj.content_length, readahead=20)
+    >>> f.seek(-5, os.SEEK_END)
+    >>> f.read()
+    '56789'
+    >>> f.seek(10)
+    >>> f.read(3), f.read(3), f.tell()
+    ('012', '345', 16)
+    >>> obj.requests
+    [(95, 99), (10, 29)]
+
+    Attributes:
+        size: Size of the remote object in bytes.
+    """
+    def __init__(self, obj, size, readahead=64*1024):
+        """Initializes object.
+
+        Args:
+            obj: S3 Object (or a stand-in with the same `get` method).
+            size(int): Size of the object in bytes, e.g. its `content_length` after a HEAD request.
+            readahead(int): Minimum number of bytes to request at once.
+        """
+        self.obj = obj
+        self.size = size
+        self.readahead = readahead
+        self._pos = 0
+        self._buffer_start = 0
+        self._buffer = ''
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        self._buffer = ''
+
+    def seek(self, offset, whence=os.SEEK_SET):
+        if whence == os.SEEK_CUR:
+            offset += self._pos
+        elif whence == os.SEEK_END:
+            offset += self.size
+        if offset < 0:
+            raise IOError("Invalid seek position %i" % offset)
+        self._pos = offset
+
+    def tell(self):
+        return self._pos
+
+    def read(self, n=-1):
+        if n is None or n < 0:
+            n = self.size - self._pos
+        n = min(n, self.size - self._pos)
+        if n <= 0:
+            return ''
+        start = self._pos
+        end = start + n
+        buffer_end = self._buffer_start + len(self._buffer)
+        if not (self._buffer_start <= start and end <= buffer_end):
+            fetch_end = min(self.size, start + max(n, self.readahead))
+            body = self.obj.get(Range='bytes=%i-%i' % (start, fetch_end-1))['Body']
+            self._buffer = body.read()
+            self._buffer_start = start
+        offset = start - self._buffer_start
+        data = self._buffer[offset:offset+n]
+        self._pos += len(data)
+        return data
+
+if __name__ == '__main__':
+    import doctest
+    doctest.testmod()
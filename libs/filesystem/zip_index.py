@@ -0,0 +1,148 @@
+"""
+This module contains ZipIndex class, an in-memory index of a zip file's central directory.
+"""
+import struct
+import zlib
+import hashlib
+from zipfile import ZipFile, ZIP_STORED, ZIP_DEFLATED, BadZipfile
+
+# Local file header, see https://pkware.cachefly.net/webdocs/casestudies/APPNOTE.TXT
+_LOCAL_HEADER_FORMAT = '<4s2B4HL2L2H'
+_LOCAL_HEADER_SIZE = struct.calcsize(_LOCAL_HEADER_FORMAT)
+_LOCAL_HEADER_SIGNATURE = 'PK\003\004'
+
+class ZipIndex():
+    """Names, sizes and offsets of all members of a zip file.
+
+    The central directory is parsed once, when the index is created. Counting and listing
+    members then come from memory, and a member is read by seeking to its offset, without
+    parsing the central directory again.
+
+    >>> import os, tempfile
+    >>> path = tempfile.mktemp(suffix='.zip')
+    >>> with ZipFile(path, 'w', ZIP_DEFLATED) as zipfile:
+    ...     zipfile.writestr('a.txt', 'hello ' * 100)
+    ...     zipfile.writestr('b.txt', 'world')
+    >>> index = ZipIndex(path, version=1)
+    >>> len(index), 'a.txt' in index
+    (2, True)
+    >>> index.namelist()
+    ['a.txt', 'b.txt']
+    >>> index.read('b.txt')
+    'world'
+    >>> index.read('a.txt') == 'hello ' * 100
+    True
+
+    Missing members raise KeyError, like ZipFile.read:
+    >>> index.read('c.txt')
+    Traceback (most recent call last):
+    ...
+    KeyError: "There is no item named 'c.txt' in the archive"
+
+    >>> os.remove(path)
+
+    Instead of a path, a function opening the zip file can be given, e.g. to read a remote
+    zip file with :class:`remote_file.RemoteFile`. Members read can then be kept in a
+    :class:`local_cache.LocalCache`.
+
+    Attributes:
+        path: Path of the zip file, or function returning a new file object of it.
+        version: Version of the zip file this index was created from, e.g. its mtime or ETag.
+        cache: LocalCache to keep read members in, or None.
+    """
+    def __init__(self, path, version=None, cache=None):
+        """Initializes object by reading central directory of a zip file.
+
+        Args:
+            path: See :attr:`path`.
+            version: See :attr:`version`.
+            cache: See :attr:`cache`.
+        """
+        self.path = path
+        self.version = version
+        self.cache = cache
+        with self._open() as f:
+            with ZipFile(f, 'r') as zipfile:
+                self._infolist = zipfile.infolist()
+        self._infos = dict((zipinfo.filename, zipinfo) for zipinfo in self._infolist)
+
+    def __len__(self):
+        return len(self._infolist)
+
+    def __contains__(self, name):
+        return name in self._infos
+
+    def infolist(self):
+        """Gets ZipInfo objects of all members, in order of the zip file.
+        """
+        return list(self._infolist)
+
+    def namelist(self):
+        """Gets names of all members, in order of the zip file.
+        """
+        return [zipinfo.filename for zipinfo in self._infolist]
+
+    def getinfo(self, name):
+        """Gets ZipInfo of a member.
+
+        Raises:
+            KeyError: When there is no member with given name.
+        """
+        try:
+            return self._infos[name]
+        except KeyError:
+            raise KeyError("There is no item named %r in the archive" % name)
+
+    def read(self, name):
+        """Reads content of a member.
+
+        Stored and deflated members are read from their offset. Other members (e.g. encrypted
+        ones) are read through ZipFile.
+
+        Raises:
+            KeyError: When there is no member with given name.
+        """
+        zipinfo = self.getinfo(name)
+        if self.cache is None:
+            return self._read(zipinfo)
+
+        def write(tmp_path):
+            with open(tmp_path, 'wb') as f:
+                f.write(self._read(zipinfo))
+        cache_key = hashlib.md5(repr((self.version, name))).hexdigest()
+        with self.cache.pinned(cache_key, write) as path:
+            with open(path, 'rb') as f:
+                return f.read()
+
+    def _read(self, zipinfo):
+        """Reads content of a member from the zip file.
+        """
+        name = zipinfo.filename
+        if zipinfo.flag_bits & 0x1 or zipinfo.compress_type not in (ZIP_STORED, ZIP_DEFLATED):
+            with self._open() as f:
+                with ZipFile(f, 'r') as zipfile:
+                    return zipfile.read(name)
+
+        with self._open() as f:
+            f.seek(zipinfo.header_offset)
+            header = struct.unpack(_LOCAL_HEADER_FORMAT, f.read(_LOCAL_HEADER_SIZE))
+            if header[0] != _LOCAL_HEADER_SIGNATURE:
+                raise BadZipfile("Bad magic number for file header")
+            # Skip file name and extra field, whose lengths may differ from central directory's.
+            f.seek(header[10] + header[11], 1)
+            data = f.read(zipinfo.compress_size)
+
+        if zipinfo.compress_type == ZIP_DEFLATED:
+            data = zlib.decompressobj(-15).decompress(data)
+        if zlib.crc32(data) & 0xffffffff != zipinfo.CRC:
+            raise BadZipfile("Bad CRC-32 for file %r" % name)
+        return data
+
+    def _open(self):
+        if callable(self.path):
+            return self.path()
+        return open(self.path, 'rb')
+
+if __name__ == '__main__':
+    import doctest
+    doctest.testmod()
@@ -0,0 +1,88 @@
+"""
+This module contains ImportProfiler class, which measures how long each module takes to import.
+"""
+import __builtin__
+import sys
+import time
+
+class ImportProfiler():
+    """Times imports of modules while installed.
+
+    Each module's time is split into its own time (running the module's code) and the time
+    of modules it imported first, so the slow module in a chain of imports stands out.
+    Only first imports of a module are timed, later imports are looked up in sys.modules.
+
+    >>> profiler = ImportProfiler()
+    >>> profiler.install()
+    >>> import json.tool
+    >>> profiler.uninstall()
+    >>> 'json.tool' in profiler.modules()
+    True
+    >>> print(profiler.report(limit=1)) # doctest:+ELLIPSIS
+    cumulative(ms)   self(ms)  module
+    ...
+
+    Attributes:
+        timings: Dict of module name to (cumulative seconds, self seconds).
+    """
+    def __init__(self):
+        """Initializes object.
+        """
+        self.timings = {}
+        self._original_import = None
+        self._stack = []
+
+    def install(self):
+        """Starts timing imports.
+        """
+        self._original_import = __builtin__.__import__
+        __builtin__.__import__ = self._import
+
+    def uninstall(self):
+        """Stops timing imports.
+        """
+        if self._original_import is not None:
+            __builtin__.__import__ = self._original_import
+            self._original_import = None
+
+    def modules(self):
+        """Gets names of all timed modules.
+        """
+        return self.timings.keys()
+
+    def report(self, limit=30):
+        """Gets a table of the slowest imports, sorted by cumulative time.
+
+        Args:
+            limit(int): Number of modules to list.
+
+        Returns:
+            str: The table, one module per line.
+        """
+        lines = ["%14s %10s  %s" % ('cumulative(ms)', 'self(ms)', 'module')]
+        timings = sorted(self.timings.items(), key=lambda item: -item[1][0])
+        for name, (cumulative, own) in timings[:limit]:
+            lines.append("%14.1f %10.1f  %s" % (cumulative*1000, own*1000, name))
+        return "\n".join(lines)
+
+    def _import(self, name, globals=None, locals=None, fromlist=None, level=-1):
+        loaded = name in sys.modules
+        self._stack.append(0)
+        start = time.time()
+        try:
+            module = self._original_import(name, globals, locals, fromlist, level)
+        finally:
+            elapsed = time.time() - start
+            children = self._stack.pop()
+            if self._stack:
+                self._stack[-1] += elapsed
+        if not loaded and name:
+            # Without fromlist, the top-level package is returned for `import a.b`.
+            full_name = module.__name__ if fromlist else module.__name__ + name[len(name.split('.')[0]):]
+            if full_name not in self.timings:
+                self.timings[full_name] = (elapsed, elapsed - children)
+        return module
+
+if __name__ == '__main__':
+    import doctest
+    doctest.testmod()
@@ -0,0 +1,413 @@
+"""
+This module contains JobQueue, Job and JobWorker classes, a persistent queue of
+long-running jobs kept in Redis.
+
+A job is kept in these keys (with default prefix `job`):
+
+- `job:<id>`: Hash of the job's kind, owner, parameters, status, checkpoint and result.
+- `job:<id>:log`: List of the job's latest progress messages.
+- `job:queue`: List of ids of jobs waiting for a worker.
+- `job:processing`: List of ids of jobs claimed by a worker.
+- `job:user:<user>`: List of ids of a user's jobs, latest first.
+"""
+import json
+import logging
+import socket
+import os
+import time
+import threading
+from uuid import uuid4
+
+QUEUED = 'queued'
+RUNNING = 'running'
+CANCELLING = 'cancelling'
+CANCELLED = 'cancelled'
+FAILED = 'failed'
+DONE = 'done'
+
+class JobCancelled(Exception):
+    """Raised inside a job that was cancelled, at its next progress message or checkpoint.
+    """
+
+class JobQueue():
+    """Submits jobs, and lets workers (usually separate processes) claim and run them.
+
+    Jobs and their progress are kept in Redis, so they outlive the connection (and the
+    process) that submitted them. A job saves checkpoints as it goes, e.g. the last batch
+    completed, so a failed, cancelled or interrupted job can be resumed from there.
+
+    >>> from local_redis import LocalRedis
+    >>> queue = JobQueue(LocalRedis())
+    >>> job_id = queue.submit('count', {'to': 5}, user='default', project='risky')
+    >>> queue.get(job_id)['status']
+    'queued'
+
+    A worker claims the job and runs it, sending progress and saving checkpoints:
+    >>> def count(job):
+    ...     for i in range(job.checkpoint.get('done', 0), job.params['to']):
+    ...         job.send("Counted %i." % (i+1))
+    ...         job.save_checkpoint({'done': i+1})
+    ...         if i == 2 and job.checkpoint.get('fail', True):
+    ...             raise ValueError("Lost count")
+    ...     return "Counted to %i." % job.params['to']
+    >>> worker = JobWorker(queue, {'count': count})
+    >>> worker.run_once(timeout=1)
+    True
+    >>> job = queue.get(job_id)
+    >>> job['status'], job['error'], job['checkpoint']['done']
+    ('failed', 'ValueError: Lost count', 3)
+    >>> queue.log(job_id)
+    ['Counted 1.', 'Counted 2.', 'Counted 3.']
+
+    Resuming the job queues it again, and it continues from its checkpoint:
+    >>> queue.resume(job_id, checkpoint={'done': 3, 'fail': False})
+    True
+    >>> worker.run_once(timeout=1)
+    True
+    >>> job = queue.get(job_id)
+    >>> job['status'], job['result'], queue.log(job_id)[-2:]
+    ('done', 'Counted to 5.', ['Counted 4.', 'Counted 5.'])
+
+    Cancelling a queued job removes it from the queue:
+    >>> job_id = queue.submit('count', {'to': 5}, user='default')
+    >>> queue.cancel(job_id)
+    True
+    >>> worker.run_once(timeout=0.1)
+    False
+    >>> [job['status'] for job in queue.list_jobs('default')]
+    ['cancelled', 'done']
+
+    Attributes:
+        redis: Redis connection.
+        key_prefix: Prefix of all keys of this queue.
+        log_size: Number of latest progress messages kept per job.
+        ttl: Seconds a finished job is kept.
+    """
+    def __init__(self, redis_connection, key_prefix='job', log_size=100, ttl=7*24*60*60):
+        """Initializes object.
+
+        Args:
+            redis_connection: Redis instance.
+            key_prefix(str): See :attr:`key_prefix`.
+            log_size(int): See :attr:`log_size`.
+            ttl(int): See :attr:`ttl`.
+        """
+        self.redis = redis_connection
+        self.key_prefix = key_prefix
+        self.log_size = log_size
+        self.ttl = ttl
+
+    def key(self, *parts):
+        return ':'.join((self.key_prefix,) + parts)
+
+    def submit(self, kind, params=None, user=None, project=None):
+        """Queues a job.
+
+        Args:
+            kind(str): Kind of job, decides which handler of :class:`JobWorker` runs it.
+            params(dict): JSON serializable parameters of the job.
+            user(str): User owning the job.
+            project(str): Name of project the job runs on.
+
+        Returns:
+            str: Id of the job.
+        """
+        job_id = uuid4().hex
+        now = time.time()
+        self.redis.hset(self.key(job_id), mapping={
+            'id': job_id,
+            'kind': kind,
+            'user': user or '',
+            'project': project or '',
+            'params': json.dumps(params or {}),
+            'checkpoint': json.dumps({}),
+            'status': QUEUED,
+            'created_at': now,
+            'updated_at': now
+        })
+        if user:
+            self.redis.lpush(self.key('user', user), job_id)
+            self.redis.ltrim(self.key('user', user), 0, self.log_size-1)
+        self.redis.lpush(self.key('queue'), job_id)
+        return job_id
+
+    def get(self, job_id):
+        """Gets a job.
+
+        Returns:
+            dict: The job, with its params and checkpoint decoded, or None when not found.
+        """
+        job = self.redis.hgetall(self.key(job_id))
+        if not job:
+            return None
+        job['params'] = json.loads(job['params'])
+        job['checkpoint'] = json.loads(job['checkpoint'])
+        for name in ('created_at', 'updated_at', 'heartbeat'):
+            if name in job:
+                job[name] = float(job[name])
+        return job
+
+    def log(self, job_id, count=None):
+        """Gets the latest progress messages of a job, oldest first.
+
+        Args:
+            count(int): Number of messages to get. None to get all kept messages.
+        """
+        start = 0 if count is None else -count
+        return self.redis.lrange(self.key(job_id, 'log'), start, -1)
+
+    def list_jobs(self, user, count=10):
+        """Gets the latest jobs of a user, latest first.
+        """
+        job_ids = self.redis.lrange(self.key('user', user), 0, count-1)
+        jobs = [self.get(job_id) for job_id in job_ids]
+        return [job for job in jobs if job is not None]
+
+    def cancel(self, job_id):
+        """Cancels a job. A queued job is removed from the queue, and a running job stops at its
+        next progress message or checkpoint.
+
+        Returns:
+            bool: False when the job was not found or had already finished.
+        """
+        job = self.get(job_id)
+        if job is None:
+            return False
+        if job['status'] == QUEUED:
+            self.redis.lrem(self.key('queue'), 0, job_id)
+            self._set(job_id, status=CANCELLED)
+            return True
+        if job['status'] == RUNNING:
+            self._set(job_id, status=CANCELLING)
+            return True
+        return False
+
+    def resume(self, job_id, checkpoint=None):
+        """Queues a failed or cancelled job again. It continues from its last checkpoint.
+
+        Args:
+            checkpoint(dict): Replaces the job's checkpoint when given.
+
+        Returns:
+            bool: False when the job was not found or can't be resumed.
+        """
+        job = self.get(job_id)
+        if job is None or job['status'] not in (FAILED, CANCELLED):
+            return False
+        values = {'status': QUEUED, 'error': ''}
+        if checkpoint is not None:
+            values['checkpoint'] = json.dumps(checkpoint)
+        self._set(job_id, **values)
+        self.redis.lpush(self.key('queue'), job_id)
+        return True
+
+    def claim(self, worker_id, timeout=5):
+        """Waits for a queued job and marks it as running.
+
+        Args:
+            worker_id(str): Id of the claiming worker, kept in the job.
+            timeout(int): Seconds to wait for a job.
+
+        Returns:
+            Job: Claimed job, or None when no job was queued in time.
+        """
+        job_id = self.redis.brpoplpush(self.key('queue'), self.key('processing'), timeout=timeout)
+        if job_id is None:
+            return None
+        job = self.get(job_id)
+        if job is None or job['status'] != QUEUED:
+            # Cancelled (or expired) after it was queued.
+            self.redis.lrem(self.key('processing'), 0, job_id)
+            return None
+        self._set(job_id, status=RUNNING, worker=worker_id, heartbeat=time.time())
+        return Job(self, job)
+
+    def finish(self, job_id, status, result=None, error=None):
+        """Marks a claimed job as finished.
+
+        Args:
+            status(str): DONE, FAILED or CANCELLED.
+            result(str): Result message of a done job.
+            error(str): Error message of a failed job.
+        """
+        values = {'status': status}
+        if result is not None:
+            values['result'] = result
+        if error is not None:
+            values['error'] = error
+        self._set(job_id, **values)
+        self.redis.lrem(self.key('processing'), 0, job_id)
+        if self.ttl is not None:
+            self.redis.expire(self.key(job_id), self.ttl)
+            self.redis.expire(self.key(job_id, 'log'), self.ttl)
+
+    def requeue_stale(self, max_age):
+        """Queues claimed jobs again when their worker has not been heard from in `max_age`
+        seconds, e.g. because it was killed. They continue from their last checkpoint.
+
+        Returns:
+            int: Number of queued jobs.
+        """
+        requeued = 0
+        for job_id in self.redis.lrange(self.key('processing'), 0, -1):
+            job = self.get(job_id)
+            if job is not None and time.time() - job.get('heartbeat', 0) <= max_age:
+                continue
+            if self.redis.lrem(self.key('processing'), 0, job_id) == 0:
+                # Another worker requeued it first.
+                continue
+            if job is None:
+                continue
+            if job['status'] == CANCELLING:
+                self._set(job_id, status=CANCELLED)
+                continue
+            self._set(job_id, status=QUEUED)
+            self.redis.rpush(self.key('queue'), job_id)
+            requeued += 1
+        return requeued
+
+    def _set(self, job_id, **values):
+        values['updated_at'] = time.time()
+        self.redis.hset(self.key(job_id), mapping=values)
+
+class Job():
+    """A claimed job, passed to the handler running it.
+
+    It can be passed in place of a connection or stdout to functions reporting progress,
+    since it has their `send` and `write` methods.
+
+    Attributes:
+        id: Id of the job.
+        kind: Kind of the job.
+        user: User owning the job.
+        project: Name of project the job runs on.
+        params: Parameters of the job.
+        checkpoint: Last checkpoint saved by the job, an empty dict when starting afresh.
+    """
+    def __init__(self, queue, job):
+        """Initializes object.
+
+        Args:
+            queue(JobQueue): Queue the job was claimed from.
+            job(dict): The job, see :func:`JobQueue.get`.
+        """
+        self.queue = queue
+        self.id = job['id']
+        self.kind = job['kind']
+        self.user = job['user']
+        self.project = job['project']
+        self.params = job['params']
+        self.checkpoint = job['checkpoint']
+
+    def send(self, message):
+        """Adds a progress message.
+
+        Raises:
+            JobCancelled: When the job has been cancelled.
+        """
+        key = self.queue.key(self.id, 'log')
+        self.queue.redis.rpush(key, message)
+        self.queue.redis.ltrim(key, -self.queue.log_size, -1)
+        self.queue._set(self.id, heartbeat=time.time())
+        self.check_cancelled()
+
+    def write(self, message):
+        """Adds a progress message printed with a trailing newline, see :func:`send`.
+        """
+        self.send(message.rstrip('\n'))
+
+    def save_checkpoint(self, checkpoint):
+        """Saves how far the job has got. A resumed job starts with this checkpoint.
+
+        Args:
+            checkpoint(dict): JSON serializable state, e.g. {'batch': 3}.
+
+        Raises:
+            JobCancelled: When the job has been cancelled.
+        """
+        self.checkpoint = checkpoint
+        self.queue._set(self.id, checkpoint=json.dumps(checkpoint), heartbeat=time.time())
+        self.check_cancelled()
+
+    def check_cancelled(self):
+        """Raises :class:`JobCancelled` when the job has been cancelled.
+        """
+        if self.queue.redis.hget(self.queue.key(self.id), 'status') == CANCELLING:
+            raise JobCancelled()
+
+class JobWorker():
+    """Runs jobs claimed from a queue, one at a time.
+
+    Run several workers (each in its own process) to run several jobs at once.
+
+    Attributes:
+        queue: JobQueue to claim jobs from.
+        handlers: Dict of kind of job to function running it. The function is passed a
+                  :class:`Job` and returns a result message.
+        worker_id: Id of this worker, kept in the jobs it claims.
+        heartbeat_interval: Seconds between heartbeats of a running job, so it is not taken
+                            as stale while its handler runs without reporting progress.
+    """
+    def __init__(self, queue, handlers, worker_id=None, heartbeat_interval=30):
+        """Initializes object.
+
+        Args:
+            queue(JobQueue): See :attr:`queue`.
+            handlers(dict): See :attr:`handlers`.
+            worker_id(str): See :attr:`worker_id`. Defaults to host name and process id.
+            heartbeat_interval(int): See :attr:`heartbeat_interval`.
+        """
+        self.queue = queue
+        self.handlers = handlers
+        self.worker_id = worker_id or "%s:%i" % (socket.gethostname(), os.getpid())
+        self.heartbeat_interval = heartbeat_interval
+
+    def run(self, stale_after=10*60, timeout=5):
+        """Runs jobs until interrupted.
+
+        Args:
+            stale_after(int): Seconds after which a job whose worker stopped responding is
+                              queued again, see :func:`JobQueue.requeue_stale`.
+            timeout(int): Seconds to wait for a job before checking for stale jobs again.
+        """
+        while True:
+            self.queue.requeue_stale(stale_after)
+            self.run_once(timeout)
+
+    def run_once(self, timeout=5):
+        """Claims a job and runs it.
+
+        Returns:
+            bool: True when a job was run.
+        """
+        job = self.queue.claim(self.worker_id, timeout=timeout)
+        if job is None:
+            return False
+        handler = self.handlers.get(job.kind)
+        stopped = threading.Event()
+        heartbeat = threading.Thread(target=self._beat, args=(job, stopped))
+        heartbeat.daemon = True
+        heartbeat.start()
+        try:
+            if handler is None:
+                raise ValueError("Unknown kind of job %r" % job.kind)
+            result = handler(job)
+        except JobCancelled:
+            self.queue.finish(job.id, CANCELLED)
+        except Exception as e:
+            logging.exception("Job %s failed", job.id)
+            self.queue.finish(job.id, FAILED, error="%s: %s" % (type(e).__name__, e))
+        else:
+            self.queue.finish(job.id, DONE, result=result)
+        finally:
+            stopped.set()
+            heartbeat.join()
+        return True
+
+    def _beat(self, job, stopped):
+        while not stopped.wait(self.heartbeat_interval):
+            self.queue._set(job.id, heartbeat=time.time())
+
+if __name__ == '__main__':
+    import doctest
+    doctest.testmod()
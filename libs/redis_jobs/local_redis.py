@@ -0,0 +1,109 @@
+"""
+This module contains LocalRedis class, an in-process stand-in for Redis.
+"""
+import time
+import threading
+
+class LocalRedis(object):
+    """Keeps data in memory and implements the few Redis commands :class:`job_queue.JobQueue`
+    uses, with the same arguments and return values as `redis.Redis`. Use it to test code
+    using Redis without a Redis server. Data is not shared between processes.
+
+    >>> r = LocalRedis()
+    >>> r.hset('hash', mapping={'a': 1, 'b': 'x'})
+    2
+    >>> sorted(r.hgetall('hash').items())
+    [('a', '1'), ('b', 'x')]
+    >>> r.lpush('list', 'a', 'b')
+    2
+    >>> r.brpoplpush('list', 'other', timeout=1)
+    'a'
+    >>> r.lrange('other', 0, -1), r.lrange('list', 0, -1)
+    (['a'], ['b'])
+    """
+    def __init__(self):
+        self._data = {}
+        self._changed = threading.Condition()
+
+    def delete(self, *names):
+        with self._changed:
+            return len([self._data.pop(name) for name in names if name in self._data])
+
+    def exists(self, *names):
+        return len([name for name in names if name in self._data])
+
+    def expire(self, name, time):
+        # Expiry is not needed by tests, keys are kept until deleted.
+        return name in self._data
+
+    def hset(self, name, key=None, value=None, mapping=None):
+        items = {}
+        if key is not None:
+            items[key] = value
+        if mapping is not None:
+            items.update(mapping)
+        with self._changed:
+            hash = self._data.setdefault(name, {})
+            added = len([key for key in items if key not in hash])
+            hash.update((key, str(value)) for key, value in items.items())
+        return added
+
+    def hget(self, name, key):
+        return self._data.get(name, {}).get(key)
+
+    def hgetall(self, name):
+        return dict(self._data.get(name, {}))
+
+    def lpush(self, name, *values):
+        with self._changed:
+            items = self._data.setdefault(name, [])
+            for value in values:
+                items.insert(0, str(value))
+            self._changed.notify_all()
+            return len(items)
+
+    def rpush(self, name, *values):
+        with self._changed:
+            items = self._data.setdefault(name, [])
+            items.extend(str(value) for value in values)
+            self._changed.notify_all()
+            return len(items)
+
+    def lrange(self, name, start, end):
+        items = self._data.get(name, [])
+        end = len(items) if end == -1 else end + 1
+        return items[start:end]
+
+    def ltrim(self, name, start, end):
+        with self._changed:
+            self._data[name] = self.lrange(name, start, end)
+        return True
+
+    def lrem(self, name, count, value):
+        with self._changed:
+            items = self._data.get(name, [])
+            removed = len([item for item in items if item == str(value)])
+            if count != 0:
+                removed = min(removed, abs(count))
+            for i in range(removed):
+                if count < 0:
+                    del items[len(items) - 1 - items[::-1].index(str(value))]
+                else:
+                    items.remove(str(value))
+            return removed
+
+    def brpoplpush(self, src, dst, timeout=0):
+        deadline = time.time() + timeout
+        with self._changed:
+            while len(self._data.get(src, [])) == 0:
+                left = deadline - time.time()
+                if timeout != 0 and left <= 0:
+                    return None
+                self._changed.wait(left if timeout != 0 else None)
+            value = self._data[src].pop()
+            self._data.setdefault(dst, []).insert(0, value)
+            return value
+
+if __name__ == '__main__':
+    import doctest
+    doctest.testmod()
@@ -0,0 +1,99 @@
+"""
+This module contains functions to encode messages sent to clients, either as plain json or
+in a compact form.
+
+Formats:
+    json: Plain json, objects are serialized with their `to_dict()`.
+    compact: Json too, but objects are serialized with `to_dict(columnar=True)` when they
+             support it, and numpy arrays are sent as base64 encoded little-endian typed arrays:
+             `{"__typed_array__": "float32", "data": "<base64>"}`, which a javascript client can
+             turn into a `Float32Array` without parsing a number per element.
+
+Compressions:
+    deflate: Messages of at least `min_compress_size` characters are compressed with zlib and sent
+             as `{"encoding": "deflate", "data": "<base64 of zlib stream>"}`. Smaller messages
+             are sent as they are.
+
+Messages stay text, since SockJS transports other than websocket can't carry binary frames.
+"""
+import base64
+import inspect
+import json
+import zlib
+import numpy as np
+
+FORMATS = ['json', 'compact']
+COMPRESSIONS = [None, 'deflate']
+
+def dumps(value, wire_format='json', compression=None, min_compress_size=1024):
+    """Encodes value into a message.
+
+    >>> dumps({'message': 'Done.', 'x': np.array([1.5, 2.], dtype=np.float32)})
+    '{"x": [1.5, 2.0], "message": "Done."}'
+    >>> dumps({'x': np.array([1.5, 2.], dtype=np.float32)}, 'compact')
+    '{"x": {"data": "AADAPwAAAEA=", "__typed_array__": "float32"}}'
+    >>> message = dumps({'message': 'a'*2000}, 'compact', 'deflate')
+    >>> len(message) < 100
+    True
+    >>> loads(message) == {'message': 'a'*2000}
+    True
+
+    Args:
+        value: Value to encode, usually :func:`ClientInstruction.get_value`. May contain objects
+               with a `to_dict` method and numpy arrays.
+        wire_format(str): One of :data:`FORMATS`.
+        compression(str|None): One of :data:`COMPRESSIONS`.
+        min_compress_size(int): Compress only messages of at least this many characters.
+
+    Returns:
+        str: The message.
+    """
+    if wire_format not in FORMATS:
+        raise ValueError("Unknown wire format %s." % wire_format)
+    if compression not in COMPRESSIONS:
+        raise ValueError("Unknown compression %s." % compression)
+    columnar = wire_format == 'compact'
+    message = json.dumps(value, default=lambda obj: _to_serializable(obj, columnar))
+    if compression == 'deflate' and len(message) >= min_compress_size:
+        message = json.dumps({'encoding': 'deflate', 'data': base64.b64encode(zlib.compress(message))})
+    return message
+
+def loads(message):
+    """Decodes a message encoded by :func:`dumps`, the way a client would. Typed arrays are
+    decoded into numpy arrays.
+
+    >>> loads(dumps({'x': np.array([1, 2], dtype=np.int32)}, 'compact'))
+    {u'x': array([1, 2], dtype=int32)}
+    """
+    value = json.loads(message)
+    if isinstance(value, dict) and value.get('encoding') == 'deflate':
+        value = json.loads(zlib.decompress(base64.b64decode(value['data'])))
+    return _decode_arrays(value)
+
+def _to_serializable(obj, columnar):
+    if isinstance(obj, np.ndarray):
+        if not columnar:
+            return obj.tolist()
+        array = obj.astype(obj.dtype.newbyteorder('<'))
+        return {'__typed_array__': array.dtype.name, 'data': base64.b64encode(array.tostring())}
+    if isinstance(obj, np.generic):
+        return obj.item()
+    if hasattr(obj, 'to_dict'):
+        if columnar and 'columnar' in inspect.getargspec(obj.to_dict).args:
+            return obj.to_dict(columnar=True)
+        return obj.to_dict()
+    raise TypeError("%r is not JSON serializable" % obj)
+
+def _decode_arrays(value):
+    if isinstance(value, dict):
+        if '__typed_array__' in value:
+            dtype = np.dtype(str(value['__typed_array__'])).newbyteorder('<')
+            return np.frombuffer(base64.b64decode(value['data']), dtype=dtype).astype(dtype.newbyteorder('='))
+        return dict((key, _decode_arrays(item)) for key, item in value.items())
+    if isinstance(value, list):
+        return [_decode_arrays(item) for item in value]
+    return value
+
+if __name__ == '__main__':
+    import doctest
+    doctest.testmod()
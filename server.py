@@ -1,12 +1,39 @@
 import os
+import sys
+import time
+
+# With `--profile-imports` (or ARTHUR_PROFILE_IMPORTS=1), time spent importing each module
+# and until the server listens is logged, to find what slows down start up.
+profiler = None
+if '--profile-imports' in sys.argv or os.getenv('ARTHUR_PROFILE_IMPORTS') == '1':
+    from libs.import_profiler import ImportProfiler
+    profiler = ImportProfiler()
+    profiler.install()
+started_at = time.time()
+
+import logging
 import tornado.ioloop
 import tornado.web
 import sockjs.tornado
-from app import app
+from app import app, mongo
 import config
 
+def setup_docs():
+    """Indexes documents' collection, and moves documents still kept inside projects into it.
+    """
+    from app.mod_cmd.project_docs import setup_docs_collection
+    setup_docs_collection(mongo.db)
+
 if __name__ == '__main__':
     # app.listen(os.getenv('VCAP_APP_PORT', 49152))
     # app.listen(49152)
     app.listen(config.LISTENING_PORT)
-    tornado.ioloop.IOLoop.instance().start()
+    if profiler is not None:
+        profiler.uninstall()
+        logging.info("Imports:\n%s", profiler.report())
+        logging.info("Listening after %.3fs.", time.time() - started_at)
+    ioloop = tornado.ioloop.IOLoop.instance()
+    # Run in a command thread once listening, so connecting to database delays neither
+    # accepting connections nor the IOLoop.
+    ioloop.add_future(app.executor.submit('setup_docs', setup_docs), lambda future: future.result())
+    ioloop.start()
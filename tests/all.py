@@ -22,10 +22,42 @@ sys.path.append(base_path)
 import unittest
 import doctest 
 import lib.filesystem.base
+import libs.filesystem.zip_index
+import libs.filesystem.remote_file
+import libs.filesystem.local_cache
+import libs.redis_jobs.job_queue
+import libs.redis_jobs.local_redis
+import libs.import_profiler
+import libs.wire_format
+import libs.arthur.collocations
+import libs.arthur.mwe_matcher
+import libs.arthur.pipeline
+import libs.arthur.document.element_store
+import libs.arthur.document.parse_cache
+import app.mod_cmd.project_states
+import app.mod_cmd.project_cache
+import app.mod_cmd.command_registry
+import app.mod_cmd.command_executor
 import app.mod_cmd.commands.docs.list_docs as list_docs
 
 def load_tests(loader, tests, ignore):
     tests.addTests(doctest.DocTestSuite(lib.filesystem.base))
+    tests.addTests(doctest.DocTestSuite(libs.filesystem.zip_index))
+    tests.addTests(doctest.DocTestSuite(libs.filesystem.remote_file))
+    tests.addTests(doctest.DocTestSuite(libs.filesystem.local_cache))
+    tests.addTests(doctest.DocTestSuite(libs.redis_jobs.job_queue))
+    tests.addTests(doctest.DocTestSuite(libs.redis_jobs.local_redis))
+    tests.addTests(doctest.DocTestSuite(libs.import_profiler))
+    tests.addTests(doctest.DocTestSuite(libs.wire_format))
+    tests.addTests(doctest.DocTestSuite(libs.arthur.collocations))
+    tests.addTests(doctest.DocTestSuite(libs.arthur.mwe_matcher))
+    tests.addTests(doctest.DocTestSuite(libs.arthur.pipeline))
+    tests.addTests(doctest.DocTestSuite(libs.arthur.document.element_store))
+    tests.addTests(doctest.DocTestSuite(libs.arthur.document.parse_cache))
+    tests.addTests(doctest.DocTestSuite(app.mod_cmd.project_states))
+    tests.addTests(doctest.DocTestSuite(app.mod_cmd.project_cache))
+    tests.addTests(doctest.DocTestSuite(app.mod_cmd.command_registry))
+    tests.addTests(doctest.DocTestSuite(app.mod_cmd.command_executor))
     tests.addTests(doctest.DocTestSuite(list_docs))
     return tests
 
@@ -0,0 +1,6 @@
+import config
+from app.mod_cmd.jobs import run_workers
+
+if __name__ == '__main__':
+    # Runs jobs submitted with `submit_job` command, see app/mod_cmd/jobs.py.
+    run_workers(config.JOB_WORKERS)